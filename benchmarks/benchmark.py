@@ -0,0 +1,275 @@
+"""
+Benchmark suite timing each stage of images-to-pdf on a synthetic image corpus.
+
+    python benchmarks/benchmark.py run --output results.json
+    python benchmarks/benchmark.py compare baseline.json results.json
+
+Every scenario (layout, resolution and quality) runs in its own process, so its peak
+RSS is measured in isolation. Stage times are taken from the spans of
+images_to_pdf.tracing.
+"""
+
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Literal
+
+from cyclopts import App
+from PIL import Image, ImageDraw
+
+from images_to_pdf import __version__, image, index, tracing
+from images_to_pdf.cli import find_image_files
+from images_to_pdf.pdf import create_pdf_from_images
+
+app = App(help="Benchmark images-to-pdf on a synthetic image corpus.")
+
+LAYOUTS = ("grid", "auto", "lane", "document")
+QUALITIES = ("fast", "balanced", "best")
+RESOLUTIONS = {  # As offered by the GUI.
+    "big": (1754, 1240),
+    "medium": (877, 620),
+    "small": (584, 413),
+}
+MEGAPIXELS = (1, 4, 12, 24, 50)
+ASPECT_RATIOS = (4 / 3, 3 / 4, 3 / 2, 2 / 3, 1, 16 / 9, 9 / 16, 3)
+FORMATS = ("jpg", "png", "gif", "bmp")
+DEFAULT_CORPUS_DIR = Path(tempfile.gettempdir()) / "images_to_pdf_benchmark_corpus"
+
+
+def generate_image(path: Path, megapixels: float, aspect_ratio: float, seed: int):
+    """Write a synthetic photo-like image, a gradient with random shapes on top."""
+    rng = random.Random(seed)
+    width = int((megapixels * 1_000_000 * aspect_ratio) ** 0.5)
+    height = int(megapixels * 1_000_000 / width)
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for _ in range(30):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(width // 20 + 1, width // 5 + 2)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+    if path.suffix == ".gif":
+        img = img.convert("P")
+    img.save(path)
+
+
+def generate_corpus(directory: Path, images: int, max_megapixels: int) -> list[Path]:
+    """Generate a corpus of mixed sizes, aspect ratios and formats, unless present."""
+    directory.mkdir(parents=True, exist_ok=True)
+    sizes = [mp for mp in MEGAPIXELS if mp <= max_megapixels]
+    paths = []
+    for number, (megapixels, aspect_ratio, format_) in enumerate(
+        zip(
+            itertools.cycle(sizes),
+            itertools.cycle(ASPECT_RATIOS),
+            itertools.islice(itertools.cycle(FORMATS), images),
+        )
+    ):
+        path = directory / f"{number:04d}_{megapixels}mp.{format_}"
+        if not path.exists():
+            generate_image(path, megapixels, aspect_ratio, seed=number)
+        paths.append(path)
+    return paths
+
+
+def stage_totals(spans: list[tracing.Span]) -> Counter:
+    """Sum the durations of the spans of each stage, compose excluding its parts."""
+    totals = Counter()
+    for span in spans:
+        totals[span.name] += span.duration
+    return Counter(
+        {
+            "decode": totals["decode"],
+            "fit": totals["fit"],
+            "compose": totals["layout"]
+            - totals["decode"]
+            - totals["fit"]
+            - totals["tile_cache"],
+            "encode": totals["encode"],
+        }
+    )
+
+
+@app.command
+def scenario(
+    layout: Literal["grid", "auto", "lane", "document"],
+    resolution: Literal["big", "medium", "small"],
+    corpus_dir: Path,
+    images_per_page: int = 6,
+    quality: Literal["fast", "balanced", "best"] = "best",
+):
+    """Run a single scenario and print its results as JSON."""
+    recorder = tracing.configure(True)
+    size = RESOLUTIONS[resolution]
+    start = time.perf_counter()
+
+    files = find_image_files(corpus_dir)
+    index.build_index(files)
+    discovery = time.perf_counter() - start
+
+    if layout == "document":
+        pages = files
+    else:
+        if layout == "lane":
+            size = (size[1], size[0])
+        pages = [
+            image.create_collage_from_images(
+                images=image_batch,
+                collage_type=layout,
+                size=size,
+                image_format=image.ImageFormat.JPG,
+                quality=quality,
+            )
+            for image_batch in itertools.batched(files, images_per_page)
+        ]
+    stages = Counter({"discovery": discovery}) + stage_totals(recorder.take())
+
+    pdf_start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as output_dir:
+        create_pdf_from_images(
+            images=pages,
+            output_pdf_path=Path(output_dir) / "benchmark.pdf",
+            page_format="a4",
+            orientation="portrait" if layout in ("lane", "document") else "landscape",
+            shrink_to_resolution=(
+                RESOLUTIONS[resolution] if layout == "document" else None
+            ),
+            quality=quality,
+        )
+    stages["pdf_write"] = time.perf_counter() - pdf_start
+
+    total = time.perf_counter() - start
+    result = {
+        "layout": layout,
+        "resolution": resolution,
+        "quality": quality,
+        "images": len(files),
+        "pages": len(pages),
+        "stages": {stage: round(seconds, 4) for stage, seconds in stages.items()},
+        "total_s": round(total, 4),
+        "images_per_s": round(len(files) / total, 2),
+        "pages_per_s": round(len(pages) / total, 2),
+        "peak_rss_mb": round(tracing.max_rss_mb(), 1),
+    }
+    print(json.dumps(result))
+
+
+@app.command
+def run(
+    output: Path = Path("benchmark-results.json"),
+    images: int = 24,
+    max_megapixels: int = 50,
+    corpus_dir: Path = DEFAULT_CORPUS_DIR,
+    layouts: list[str] = list(LAYOUTS),
+    resolutions: list[str] = list(RESOLUTIONS),
+    qualities: list[str] = list(QUALITIES),
+    images_per_page: int = 6,
+):
+    """
+    Generate the corpus if needed, run every scenario and save the results as JSON.
+
+    :param output: JSON file to save the results to.
+    :param images: Number of images in the corpus.
+    :param max_megapixels: Largest image size in the corpus, from 1 to 50 megapixels.
+    :param corpus_dir: Directory of the generated corpus, kept between runs.
+    :param layouts: Layouts to benchmark.
+    :param resolutions: Resolutions to benchmark, among big, medium and small.
+    :param qualities: Resampling qualities to benchmark, among fast, balanced and best.
+    :param images_per_page: Number of images per page of the collage layouts.
+    """
+    corpus_dir = corpus_dir / f"{images}x{max_megapixels}mp"
+    print(f"Generating corpus in {corpus_dir}", file=sys.stderr)
+    generate_corpus(corpus_dir, images, max_megapixels)
+
+    results = []
+    for layout, resolution, quality in itertools.product(
+        layouts, resolutions, qualities
+    ):
+        completed = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "scenario",
+                layout,
+                resolution,
+                corpus_dir.as_posix(),
+                "--images-per-page",
+                str(images_per_page),
+                "--quality",
+                quality,
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        result = json.loads(completed.stdout.splitlines()[-1])
+        print(
+            f"{layout:>8} {resolution:>6} {quality:>8}: {result['total_s']:7.2f} s "
+            f"{result['images_per_s']:7.2f} images/s {result['pages_per_s']:6.2f} pages/s "
+            f"{result['peak_rss_mb']:7.1f} MB",
+            file=sys.stderr,
+        )
+        results.append(result)
+
+    output.write_text(
+        json.dumps(
+            {
+                "version": __version__,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "corpus": {"images": images, "max_megapixels": max_megapixels},
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"Saved results to {output}", file=sys.stderr)
+
+
+@app.command
+def compare(baseline: Path, current: Path, tolerance: float = 0.1):
+    """
+    Compare two result files and fail if any scenario regressed beyond tolerance.
+
+    :param baseline: Results of the reference version.
+    :param current: Results to check.
+    :param tolerance: Allowed relative slowdown or peak RSS growth, 0.1 for 10%.
+    """
+    baseline_results = {
+        (r["layout"], r["resolution"], r.get("quality", "best")): r
+        for r in json.loads(baseline.read_text())["results"]
+    }
+    regressions = 0
+    for result in json.loads(current.read_text())["results"]:
+        quality = result.get("quality", "best")
+        reference = baseline_results.get(
+            (result["layout"], result["resolution"], quality)
+        )
+        if reference is None:
+            continue
+        time_change = result["total_s"] / reference["total_s"] - 1
+        rss_change = (  # Not measured where the resource module is missing.
+            result["peak_rss_mb"] / reference["peak_rss_mb"] - 1
+            if reference["peak_rss_mb"]
+            else 0.0
+        )
+        regressed = time_change > tolerance or rss_change > tolerance
+        regressions += regressed
+        print(
+            f"{result['layout']:>8} {result['resolution']:>6} {quality:>8}: "
+            f"time {time_change:+7.1%} peak RSS {rss_change:+7.1%}"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    app()
@@ -1,4 +1,12 @@
-import get_version
-
-__version__ = get_version.get_version(__file__)
 __email__ = 'daniel@engvalls.eu'
+
+
+def __getattr__(name):
+    # The version is looked up when first used, as it takes a while.
+    if name == "__version__":
+        import get_version
+
+        global __version__
+        __version__ = get_version.get_version(__file__)
+        return __version__
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
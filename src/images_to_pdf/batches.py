@@ -0,0 +1,110 @@
+import csv
+import json
+import types
+import typing
+from pathlib import Path
+
+from images_to_pdf.server import parse_job_args
+
+# Options set for the whole batch, as its jobs share the processes and caches.
+BATCH_OPTIONS = ("workers", "tile_cache_size", "tile_cache_dir", "memory_limit")
+
+
+def read_entries(manifest_file: Path) -> list[dict]:
+    """
+    Read the jobs of a manifest, a CSV file with a header row of create_pdf parameter
+    names, or a JSON list of objects of them. A JSON manifest may also be an object
+    with the "jobs" list and "defaults" shared by all of them.
+    """
+    if manifest_file.suffix.lower() == ".csv":
+        with manifest_file.open(newline="") as f:
+            return list(csv.DictReader(f))
+    data = json.loads(manifest_file.read_text())
+    if isinstance(data, dict):
+        defaults = data.get("defaults", {})
+        return [defaults | entry for entry in data.get("jobs", [])]
+    return data
+
+
+def entry_args(entry: dict, base: Path) -> list[str]:
+    """
+    Return the command line arguments of a manifest entry. Relative paths are
+    resolved against base, list values of CSV cells are separated by whitespace,
+    and empty values are left to their defaults.
+    """
+    from images_to_pdf.cli import create_pdf
+
+    hints = typing.get_type_hints(create_pdf)
+    args = [entry.get("image_path"), entry.get("output_pdf")]
+    if None in args:
+        raise ValueError("image_path and output_pdf are required")
+    for name, value in entry.items():
+        if name not in hints:
+            raise ValueError(f"Unknown parameter {name}")
+        if name in BATCH_OPTIONS:
+            raise ValueError(f"{name} is set for the whole batch, not per job")
+        if value is None or value == "":
+            continue
+        # The type of the parameter, without None if optional.
+        hint = hints[name]
+        if typing.get_origin(hint) in (typing.Union, types.UnionType):
+            hint = next(arg for arg in typing.get_args(hint) if arg is not type(None))
+        kind = typing.get_origin(hint)
+        values = (
+            value.split() if kind in (list, tuple) and isinstance(value, str) else value
+        )
+        if isinstance(hint, type) and issubclass(hint, Path):
+            values = (base / values).as_posix()
+        if name in ("image_path", "output_pdf"):
+            args[0 if name == "image_path" else 1] = values
+            continue
+        option = f"--{name.replace('_', '-')}"
+        if kind is list:
+            for item in values:
+                args.extend((option, str(item)))
+        elif kind is tuple:
+            args.extend((option, *map(str, values)))
+        elif isinstance(values, bool):
+            args.append(f"{option}={str(values).lower()}")
+        else:
+            args.append(f"{option}={values}")
+    return [str(arg) for arg in args]
+
+
+def load_jobs(manifest_file: Path) -> list[tuple[dict, str | None]]:
+    """
+    Return the create_pdf parameters of every job of a manifest, parsed as the
+    command line is, each with the error of the job if not valid. A job not valid
+    keeps its entry as parameters, so that it can be reported and the others run.
+    """
+    jobs = []
+    for entry in read_entries(manifest_file):
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError("Not an object of parameters")
+            jobs.append((parse_job_args(entry_args(entry, manifest_file.parent)), None))
+        except ValueError as e:
+            jobs.append((entry if isinstance(entry, dict) else {}, str(e)))
+    return jobs
+
+
+def report_table(statuses: list[dict], elapsed: float) -> str:
+    """Return a table of the time and throughput of every job and of the batch."""
+    lines = [
+        f"{'job':>5} {'state':<10}{'s':>8}{'images':>8}{'pages':>7}{'images/s':>10}  output"
+    ]
+    for status in statuses:
+        lines.append(
+            f"{status['id']:>5} {status['state']:<10}{status['elapsed_s']:>8.2f}"
+            f"{status['images']:>8}{status['pages']:>7}{status['images_per_s']:>10.1f}"
+            f"  {status['output_pdf']}"
+        )
+    done = sum(status["state"] == "done" for status in statuses)
+    images = sum(status["images"] for status in statuses)
+    lines.append(
+        f"{len(statuses)} jobs, {done} done, {len(statuses) - done} failed, "
+        f"{images} images in {elapsed:.1f} s, "
+        f"{elapsed / max(1, len(statuses)):.2f} s per job, "
+        f"{images / elapsed if elapsed else 0.0:.1f} images/s"
+    )
+    return "\n".join(lines)
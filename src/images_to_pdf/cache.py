@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Iterable
+
+from PIL import Image
+
+from images_to_pdf import logger
+
+DEFAULT_CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    / "images_to_pdf"
+    / "tiles"
+)
+PNG_MODES = ("1", "L", "LA", "P", "RGB", "RGBA", "I")
+
+counters = Counter()  # Hits and misses of the tile cache in this process
+
+
+class TileCache:
+    """
+    On-disk cache of fitted image tiles with least recently used eviction.
+
+    Tiles are stored as fast-compressed PNG files named by a hash of the source file
+    (path, mtime and size) and of everything else affecting the tile. The file mtime
+    is bumped on every hit, so the least recently used tiles are evicted first once
+    the total size exceeds max_bytes.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.rescan()
+
+    def rescan(self):
+        """Recount the total size from disk, as other processes may have put tiles."""
+        self.total_bytes = sum(f.stat().st_size for f in self._tile_files())
+
+    def _tile_files(self):
+        return (
+            Path(entry.path)
+            for entry in os.scandir(self.directory)
+            if entry.name.endswith(".png")
+        )
+
+    def key(
+        self,
+        img_path: Path,
+        size: tuple[int, int],
+        method: Image.Resampling,
+        annotation: str = "",
+        crop: tuple[float, float, float, float] | None = None,
+        reducing_gap: int = 2,
+    ) -> str:
+        stat = img_path.stat()
+        parts = (
+            img_path.resolve().as_posix(),
+            stat.st_mtime_ns,
+            stat.st_size,
+            *size,
+            method.name,
+            annotation,
+            *(f"{edge:.2f}" for edge in crop or ()),
+            reducing_gap,
+        )
+        return hashlib.sha256("|".join(map(str, parts)).encode()).hexdigest()
+
+    def get(self, key: str) -> Image.Image | None:
+        tile_file = self.directory / f"{key}.png"
+        try:
+            tile = Image.open(tile_file, formats=("PNG",))
+            tile.load()
+            os.utime(tile_file)
+        except OSError:
+            counters["misses"] += 1
+            return None
+        counters["hits"] += 1
+        return tile
+
+    def put(self, key: str, tile: Image.Image) -> Image.Image:
+        """Store a tile and return it, converted if needed to a mode PNG supports."""
+        if tile.mode not in PNG_MODES:
+            tile = tile.convert("RGB")
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, suffix=".tmp", delete=False
+        ) as f:
+            tile.save(f, format="PNG", compress_level=1)
+        tile_file = self.directory / f"{key}.png"
+        os.replace(f.name, tile_file)
+        self.total_bytes += tile_file.stat().st_size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+        return tile
+
+    def evict(self):
+        """Remove the least recently used tiles until below 90% of max_bytes."""
+        tiles = []
+        for tile_file in self._tile_files():
+            try:
+                stat = tile_file.stat()
+            except FileNotFoundError:  # Evicted by another process.
+                continue
+            tiles.append((stat.st_mtime, stat.st_size, tile_file))
+        tiles.sort()
+        self.total_bytes = sum(size for _, size, _ in tiles)
+        evicted = 0
+        for _, size, tile_file in tiles:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            tile_file.unlink(missing_ok=True)
+            self.total_bytes -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} tiles from cache {self.directory.as_posix()}")
+
+
+class PageCache:
+    """
+    In-memory cache of rendered pages with least recently used eviction, letting
+    later runs in the same process, as in watch mode, skip pages that are unchanged.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.pages: OrderedDict[str, bytes] = OrderedDict()
+        self.total_bytes = 0
+
+    @staticmethod
+    def key(plan: dict, sources: Iterable[Path], *options) -> str:
+        """Return the key of a page plan, its rendering options and source files."""
+        parts = [json.dumps(plan, sort_keys=True), *map(str, options)]
+        for source in sources:
+            stat = source.stat()
+            parts.append(f"{source.as_posix()}|{stat.st_mtime_ns}|{stat.st_size}")
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> bytes | None:
+        page = self.pages.get(key)
+        if page is not None:
+            self.pages.move_to_end(key)
+        return page
+
+    def put(self, key: str, page: bytes):
+        if key in self.pages:
+            return
+        self.pages[key] = page
+        self.total_bytes += len(page)
+        while self.total_bytes > self.max_bytes and self.pages:
+            _, evicted = self.pages.popitem(last=False)
+            self.total_bytes -= len(evicted)
+
+
+tile_cache: TileCache | None = None
+page_cache: PageCache | None = None
+
+
+def configure(directory: Path | None, max_megabytes: int):
+    """
+    Enable the tile cache of this process, keeping it if already enabled with the
+    same directory and size, or disable it if max_megabytes is 0.
+    """
+    global tile_cache
+    counters.clear()
+    if max_megabytes <= 0:
+        tile_cache = None
+        return
+    directory = directory or DEFAULT_CACHE_DIR
+    max_bytes = max_megabytes * 1024 * 1024
+    if (
+        tile_cache is None
+        or tile_cache.directory != directory
+        or tile_cache.max_bytes != max_bytes
+    ):
+        tile_cache = TileCache(directory, max_bytes)
+
+
+def configure_page_cache(max_megabytes: int):
+    """
+    Enable the page cache of this process, keeping its pages if already enabled with
+    the same size, or disable it if max_megabytes is 0.
+    """
+    global page_cache
+    if max_megabytes <= 0:
+        page_cache = None
+    elif page_cache is None or page_cache.max_bytes != max_megabytes * 1024 * 1024:
+        page_cache = PageCache(max_megabytes * 1024 * 1024)
+
+
+def summary() -> str | None:
+    """Return a summary of the tile cache counters, or None if the cache is disabled."""
+    if tile_cache is None:
+        return None
+    tile_cache.rescan()  # Worker processes put tiles of their own.
+    return (
+        f"Tile cache hits: {counters['hits']} misses: {counters['misses']} "
+        f"size: {tile_cache.total_bytes / 1024 / 1024:.0f} MB"
+    )
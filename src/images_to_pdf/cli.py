@@ -1,85 +1,430 @@
+import contextlib
 import itertools
+import json
 import random
-import tempfile
+import sys
+import time
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
-from typing import Annotated, Literal, Callable
+from typing import (
+    Annotated,
+    Literal,
+    Callable,
+    Generator,
+    Iterable,
+    Iterator,
+    NamedTuple,
+)
+import images_to_pdf
 from cyclopts import App, Parameter
-from cyclopts.types import ExistingDirectory, ResolvedFile
+from cyclopts.panel import CycloptsPanel
+from cyclopts.types import ExistingDirectory, ResolvedExistingFile, ResolvedFile
 from images_to_pdf.image import (
-    create_collage_from_images,
+    ColorMode,
+    encode_image,
+    render_page_plan,
     ImageFormat,
-    add_text_to_image,
+    JpegSettings,
+    Quality,
 )
+from images_to_pdf.layout import LayoutPlan, plan_page, save_plans
+from . import batches
+from . import cache
+from . import discover
+from . import index
+from . import jobs
 from . import logger
-from . import __version__
+from . import manifest
+from . import memory
+from . import pipeline
+from . import server
+from . import sizing
+from . import tracing
+from . import watcher
 
-from images_to_pdf.pdf import create_pdf_from_images
-from images_to_pdf.text import filename_to_annotation
+from images_to_pdf.pdf import (
+    create_pdf_from_images,
+    process_page_image,
+    stream_pdf_from_images,
+)
 
 app = App()
 
-SUPPORTED_IMAGE_EXTENSIONS = ["*.jpg", "*.jpeg", "*.png", "*.gif", "*.bmp"]
+
+class UsageError(ValueError):
+    """Options not valid together, reported as a usage error on the command line."""
+
+
+def find_image_files(
+    image_path: Path, include: Iterable[str] = (), exclude: Iterable[str] = ()
+) -> list[Path]:
+    """Return all supported image files below a directory, sorted by path."""
+    return list(discover.find_images(image_path, include, exclude))
 
 
-def perform_annotate_images(image_files, tmpdir_annotated_images):
-    """Annotate images with filenames and return a list of annotated file paths."""
-    annotated_files = []
+def collect(image_files: Iterable[Path], found: list[Path]) -> Iterator[Path]:
+    """Yield image files as they are found, adding them to the found list."""
     for image_file in image_files:
-        annotated_file = (Path(tmpdir_annotated_images) / image_file.name).expanduser()
-        logger.info(f"Annotating {annotated_file.as_posix()}")
-        annotated_file.write_bytes(image_file.read_bytes())
-        add_text_to_image(annotated_file, text=filename_to_annotation(annotated_file))
-        annotated_files.append(annotated_file)
-    return annotated_files
+        found.append(image_file)
+        yield image_file
+
+
+def count_pdfs(image_count: int, images_per_pdf: int) -> int:
+    return (image_count + images_per_pdf - 1) // images_per_pdf
+
+
+def index_images(image_files: Iterable[Path], index_file: Path | None = None):
+    """Index image metadata in one parallel pass, layouts are decided from it."""
+    with tracing.span("index", "run"):
+        image_infos = index.build_index(image_files, index_file)
+    for img_file, info in image_infos.items():
+        logger.info(f"Found file {img_file} {info.file_size / 1000:.0f} KB")
+
+
+def render_page(
+    plan: LayoutPlan,
+    annotate=False,
+    quality: Quality = "best",
+    jpeg: JpegSettings | None = None,
+    composed_file: Path | None = None,
+) -> bytes:
+    """
+    Render a single planned collage page and return it as JPEG bytes, saving it to
+    composed_file too if given, to encode it again.
+    """
+    with tracing.span("page", "page", images=len(plan.tiles)):
+        collage = render_page_plan(plan, "#000000", annotate, quality)
+        sizing.save_composed(collage, composed_file)
+        return encode_image(collage, ImageFormat.JPG, jpeg)
+
+
+class WorkerPage(NamedTuple):
+    image_bytes: bytes
+    cache_counters: Counter
+    spans: list[tracing.Span]
+
+
+def render_page_in_worker(
+    plan: LayoutPlan, annotate=False, quality="best", jpeg=None, composed_file=None
+):
+    """Render a page in a worker process, passing back its cache counts and spans."""
+    image_bytes = render_page(plan, annotate, quality, jpeg, composed_file)
+    cache_counters = cache.counters.copy()
+    cache.counters.clear()
+    spans = tracing.recorder.take() if tracing.recorder else []
+    return WorkerPage(image_bytes, cache_counters, spans)
+
+
+def init_worker(
+    tile_cache_dir: Path | None,
+    tile_cache_size: int,
+    trace: bool,
+    decode_budget: memory.MemoryBudget | None,
+):
+    cache.configure(tile_cache_dir, tile_cache_size)
+    tracing.configure(trace)
+    memory.configure(budget=decode_budget)
+
+
+def page_executor(
+    workers: int,
+    tile_cache_dir: Path | None = None,
+    tile_cache_size: int = 0,
+    trace: bool = False,
+    decode_budget: memory.MemoryBudget | None = None,
+) -> contextlib.AbstractContextManager[Executor | None]:
+    """
+    Return a process pool for rendering pages, sharing the decode budget of this
+    process, or no pool if a single worker.
+    """
+    if workers > 1:
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(tile_cache_dir, tile_cache_size, trace, decode_budget),
+        )
+    return contextlib.nullcontext()
+
+
+def share_memory_limit(
+    memory_limit: int | None, prefetch_memory: int
+) -> tuple[int | None, int]:
+    """
+    Return the MB of the memory limit for decoding images, and for reading them
+    ahead, which gets a quarter of it at most.
+    """
+    if not memory_limit:
+        return None, prefetch_memory
+    prefetch_memory = min(prefetch_memory, memory_limit // 4)
+    return memory_limit - prefetch_memory, prefetch_memory
 
 
 def create_pages(
     image_batches,
-    layout,
-    resolution,
-    tmpdir_final_images,
+    page_plans: list[LayoutPlan] | None,
     progress_func,
     progress_pdf_files,
-):
-    """Create page images from batches and return a list of page file paths."""
-    page_files = []
-    for page_number, image_batch in enumerate(image_batches, start=1):
-        logger.info(f"Creating page {page_number}")
-        if layout == "document":  # Use images directly for 'document' layout.
-            page_files.extend(image_batch)
-            continue
-        output_image_bytes = create_collage_from_images(
-            images=image_batch,
-            collage_type=layout,
-            image_format=ImageFormat.JPG,
-            size=resolution,
-            bg_color="#000000",
-        )
-        page_file = (Path(tmpdir_final_images) / f"page_{page_number}.jpg").expanduser()
-        page_file.write_bytes(output_image_bytes)
-        page_files.append(page_file)
-        progress_func(progress_pdf_files, page_number / len(image_batches))
-    return page_files
+    executor: Executor | None = None,
+    annotate: bool = False,
+    prefetch_threads: int = 0,
+    prefetch_memory: int = pipeline.PREFETCH_MEMORY,
+    quality: Quality = "best",
+    jpeg: JpegSettings | None = None,
+    composed: sizing.ComposedPages | None = None,
+) -> Iterator[Path | bytes]:
+    """
+    Yield the pages of a PDF in order, the planned collages rendered as JPEG bytes,
+    encoded with the jpeg settings if given, or the source image paths for 'document'
+    layout, which has no page plans.
 
+    Pages are rendered by the executor's processes if given, otherwise in a pipeline
+    reading images ahead with prefetch_threads threads, holding up to prefetch_memory
+    MB of them, unless prefetch_threads is 0. Pages in the page cache, if enabled,
+    are not rendered again, nor are pages in composed, if given, only encoded again,
+    other pages being saved to it as rendered.
+    """
+    if page_plans is None:  # Use images directly for 'document' layout.
+        yield from itertools.chain.from_iterable(image_batches)
+        return
+    page_keys = []
+    cached_pages = {}
+    if cache.page_cache:
+        page_keys = [
+            cache.PageCache.key(
+                plan.to_dict(),
+                [tile.source for tile in plan.tiles],
+                annotate,
+                quality,
+                jpeg,
+            )
+            for plan in page_plans
+        ]
+        for page_index, page_key in enumerate(page_keys):
+            if (page := cache.page_cache.get(page_key)) is not None:
+                cached_pages[page_index] = page
+    composed_pages = set()
+    if composed:
+        composed_pages = {
+            page_index
+            for page_index in range(len(page_plans))
+            if page_index not in cached_pages and composed.file(page_index).exists()
+        }
+    indices_to_render = [
+        page_index
+        for page_index in range(len(page_plans))
+        if page_index not in cached_pages and page_index not in composed_pages
+    ]
+    plans_to_render = [page_plans[page_index] for page_index in indices_to_render]
+    composed_files = [
+        composed.file(page_index) if composed else None
+        for page_index in indices_to_render
+    ]
+    if executor:
+        rendered_pages = executor.map(
+            render_page_in_worker,
+            plans_to_render,
+            itertools.repeat(annotate),
+            itertools.repeat(quality),
+            itertools.repeat(jpeg),
+            composed_files,
+        )
+    elif prefetch_threads:
+        rendered_pages = pipeline.render_pages(
+            plans_to_render,
+            annotate,
+            quality,
+            prefetch_threads,
+            prefetch_memory * 1024 * 1024,
+            jpeg,
+            composed_files,
+        )
+    else:
+        rendered_pages = map(
+            render_page,
+            plans_to_render,
+            itertools.repeat(annotate),
+            itertools.repeat(quality),
+            itertools.repeat(jpeg),
+            composed_files,
+        )
+    try:
+        for page_number in range(1, len(page_plans) + 1):
+            rendered_page = cached_pages.get(page_number - 1)
+            if rendered_page is not None:
+                logger.info(f"Reusing unchanged page {page_number}")
+            elif page_number - 1 in composed_pages:
+                logger.info(f"Encoding page {page_number} again")
+                rendered_page = encode_image(
+                    composed.load(page_number - 1), ImageFormat.JPG, jpeg
+                )
+                if page_keys:
+                    cache.page_cache.put(page_keys[page_number - 1], rendered_page)
+            else:
+                rendered_page = next(rendered_pages)
+                logger.info(f"Creating page {page_number}")
+                if executor:  # Recorded in the worker process.
+                    cache.counters.update(rendered_page.cache_counters)
+                    tracing.merge(rendered_page.spans)
+                    rendered_page = rendered_page.image_bytes
+                if page_keys:
+                    cache.page_cache.put(page_keys[page_number - 1], rendered_page)
+            yield rendered_page
+            progress_func(progress_pdf_files, page_number / len(page_plans))
+    finally:  # Stop rendering pages ahead, also if the progress callback raised.
+        if isinstance(rendered_pages, Generator):
+            rendered_pages.close()
 
-def generate_pdf(
-    page_files, output_pdf, pdf_number, total_pdfs, orientation, shrink_to_resolution
-):
-    """Generate a single PDF from the given page files."""
+
+@contextlib.contextmanager
+def removed_on_error(files: list[Path]) -> Iterator[None]:
+    """Remove the files listed by then if the enclosed work fails or is cancelled."""
+    try:
+        yield
+    except BaseException:
+        for file in files:
+            file.unlink(missing_ok=True)
+        raise
+
+
+def pdf_output_path(output_pdf, pdf_number, total_pdfs) -> Path:
+    """
+    Return the path of one of the PDFs, numbered if more than one, or a partial path
+    to be renamed if the total number of PDFs is not known yet.
+    """
+    if total_pdfs is None:
+        return output_pdf.with_name(
+            f"{output_pdf.stem}_{pdf_number}.partial{output_pdf.suffix}"
+        )
     if total_pdfs > 1:
         pad_size = len(str(total_pdfs))
         output_pdf = (
             output_pdf.parent
             / f"{output_pdf.stem}_{str(pdf_number).zfill(pad_size)}{output_pdf.suffix}"
         )
+    return output_pdf
+
+
+def generate_pdf(
+    pages,
+    output_pdf,
+    pdf_number,
+    total_pdfs,
+    orientation,
+    shrink_to_resolution,
+    keep_original_resolution=False,
+    annotate=False,
+    streaming=False,
+    quality="best",
+    jpeg=None,
+    color_mode="rgb",
+    composed=None,
+):
+    """Generate a single PDF from the given pages and return its path."""
+    output_pdf = pdf_output_path(output_pdf, pdf_number, total_pdfs)
     logger.info(f"Creating PDF {output_pdf.as_posix()}")
-    create_pdf_from_images(
-        images=page_files,
-        output_pdf_path=output_pdf,
+    pdf_options = dict(
+        images=pages,
         page_format="a4",
         orientation=orientation,
         shrink_to_resolution=shrink_to_resolution,
+        keep_original_resolution=keep_original_resolution,
+        annotate=annotate,
+        quality=quality,
+        jpeg=jpeg,
+        color_mode=color_mode,
+        composed=composed,
     )
+    if is_stdout(output_pdf):
+        stream_pdf_from_images(output=sys.stdout.buffer, **pdf_options)
+    elif streaming:
+        with output_pdf.open("wb") as output:
+            stream_pdf_from_images(output=output, **pdf_options)
+    else:
+        create_pdf_from_images(output_pdf_path=output_pdf, **pdf_options)
+    return output_pdf
+
+
+def is_stdout(output_pdf: Path) -> bool:
+    return output_pdf.name == "-"
+
+
+def size_search(
+    image_batches,
+    page_plans: list[LayoutPlan] | None,
+    annotate: bool,
+    quality: Quality,
+    shrink_to_resolution,
+    keep_original_resolution: bool,
+    color_mode: ColorMode = "rgb",
+) -> sizing.SizeSearch | None:
+    """
+    Render a few sample pages of a PDF to search for JPEG settings fitting its size,
+    returning None if there are no pages to sample.
+    """
+    if page_plans is None:  # Pages of 'document' layout are the images themselves.
+        pages = list(itertools.chain.from_iterable(image_batches))
+        samples = []
+        for page_index in sizing.sample_indices(len(pages)):
+            try:
+                samples.append(
+                    process_page_image(
+                        pages[page_index],
+                        shrink_to_resolution,
+                        keep_original_resolution,
+                        annotate,
+                        quality,
+                        color_mode,
+                    )
+                )
+            except memory.ImageTooLarge:  # Skipped from the PDF as well.
+                continue
+    else:
+        pages = page_plans
+        samples = [
+            render_page_plan(pages[page_index], "#000000", annotate, quality)
+            for page_index in sizing.sample_indices(len(pages))
+        ]
+    if not samples:
+        return None
+    return sizing.SizeSearch(samples, len(pages))
+
+
+def generate_pdf_within_size(
+    write_pdf: Callable[[JpegSettings | None], Path],
+    search: sizing.SizeSearch | None,
+    max_bytes: int,
+) -> Path:
+    """
+    Write a PDF with write_pdf, given the JPEG settings to encode its pages with, the
+    highest estimated to fit in max_bytes if searching for them. A PDF turning out
+    larger is written again with settings searched for with the corrected estimate.
+    """
+    if search is None:
+        return write_pdf(None)
+    for attempt in range(1, sizing.MAX_ATTEMPTS + 1):
+        jpeg = search.best_settings(max_bytes)
+        logger.info(
+            f"Encoding pages with {jpeg}, estimated to "
+            f"{search.estimate(jpeg) / 1024 / 1024:.1f} MB"
+        )
+        pdf_file = write_pdf(jpeg)
+        if is_stdout(pdf_file):
+            return pdf_file
+        pdf_size = pdf_file.stat().st_size
+        if pdf_size <= max_bytes:
+            return pdf_file
+        if search.is_lowest(jpeg) or attempt == sizing.MAX_ATTEMPTS:
+            logger.warning(
+                f"PDF {pdf_file.as_posix()} is {pdf_size / 1024 / 1024:.1f} MB, "
+                "over the size cap, try a smaller resolution or fewer pages per PDF"
+            )
+            return pdf_file
+        logger.info(
+            f"PDF is {pdf_size / 1024 / 1024:.1f} MB, over the size cap, "
+            "writing it again"
+        )
+        search.correct(jpeg, pdf_size)
 
 
 @app.default
@@ -90,10 +435,99 @@ def create_pdf(
     max_pages_per_pdf: int = 20,
     layout: Literal["grid", "auto", "lane", "document"] = "grid",
     resolution: tuple[int, int] = (1754, 1240),
+    quality: Annotated[
+        Quality,
+        Parameter(help="Resampling speed and quality of images scaled to fit"),
+    ] = "best",
     annotate_images: Annotated[
         bool, Parameter(help="Add filename as part of the image")
     ] = False,
     randomize_images: Annotated[bool, Parameter(help="Shuffle images")] = False,
+    seed: Annotated[
+        int | None, Parameter(help="Seed for shuffling images reproducibly")
+    ] = None,
+    keep_original_resolution: Annotated[
+        bool,
+        Parameter(help="Embed 'document' images at their original resolution"),
+    ] = False,
+    color_mode: Annotated[
+        ColorMode,
+        Parameter(help="Colors of 'document' pages, bilevel for black and white scans"),
+    ] = "rgb",
+    include: Annotated[
+        list[str] | None,
+        Parameter(help="Only include images matching one of these globs"),
+    ] = None,
+    exclude: Annotated[
+        list[str] | None,
+        Parameter(help="Skip images and directories matching one of these globs"),
+    ] = None,
+    workers: Annotated[
+        int, Parameter(help="Number of processes rendering pages in parallel")
+    ] = 1,
+    prefetch_threads: Annotated[
+        int,
+        Parameter(help="Threads reading images of upcoming pages, 0 disables it"),
+    ] = pipeline.PREFETCH_THREADS,
+    prefetch_memory: Annotated[
+        int, Parameter(help="Cap in MB of the images read ahead of rendering")
+    ] = pipeline.PREFETCH_MEMORY,
+    save_plan: Annotated[
+        Path | None,
+        Parameter(help="Save the layout plan of every page as a JSON file"),
+    ] = None,
+    save_index: Annotated[
+        bool, Parameter(help="Save image metadata index next to the image directory")
+    ] = False,
+    tile_cache_size: Annotated[
+        int, Parameter(help="Size cap in MB of the on-disk tile cache, 0 disables it")
+    ] = 0,
+    tile_cache_dir: Annotated[
+        Path | None, Parameter(help="Directory of the tile cache")
+    ] = None,
+    page_cache_size: Annotated[
+        int,
+        Parameter(help="Size cap in MB of rendered pages kept in memory between runs"),
+    ] = 0,
+    memory_limit: Annotated[
+        int | None,
+        Parameter(
+            help="Cap in MB of the memory of images being decoded and read ahead"
+        ),
+    ] = None,
+    shard: Annotated[
+        str | None,
+        Parameter(help="Render only shard i/N of the output PDFs, e.g. 2/4"),
+    ] = None,
+    incremental: Annotated[
+        bool, Parameter(help="Skip PDFs whose images and parameters are unchanged")
+    ] = False,
+    streaming: Annotated[
+        bool,
+        Parameter(help="Write pages to the PDF as they are made, with constant memory"),
+    ] = False,
+    max_pdf_size: Annotated[
+        float | None,
+        Parameter(help="Size cap in MB of each PDF, tuning JPEG compression to fit"),
+    ] = None,
+    trace_file: Annotated[
+        Path | None,
+        Parameter(help="Save timings of every stage as a Chrome trace JSON file"),
+    ] = None,
+    trace_summary: Annotated[
+        bool, Parameter(help="Log a table of the time spent in every stage")
+    ] = False,
+    event_func: Annotated[
+        Callable[[dict], None] | None,
+        Parameter(
+            show=False,
+            help="Callable receiving every timed stage as a structured event",
+        ),
+    ] = None,
+    page_pool: Annotated[
+        Executor | None,
+        Parameter(show=False, help="Process pool rendering pages, shared by runs"),
+    ] = None,
     progress_func: Annotated[
         Callable[[float, float], None],
         Parameter(
@@ -113,10 +547,13 @@ def create_pdf(
     image filenames. The images can also be shuffled randomly for inclusion. The
     function allows monitoring of its execution progress using a provided callback.
 
+    Sizes and memory caps are in MB of 1024² bytes.
+
     :param image_path: Directory containing images to process.
-        Only images matching the defined `SUPPORTED_IMAGE_EXTENSIONS` will be included.
+        Only images with a suffix in `discover.IMAGE_SUFFIXES`, in any case, are included.
     :param output_pdf: Path to the resulting PDF file, which will contain the combined images.
         The output can span multiple files if the image count exceeds the limits.
+        Use "-" (as --output-pdf=-) to write the PDF to stdout, for a single PDF only.
     :param images_per_page: Maximum number of images to include on a single PDF page.
         Defaults to 10.
     :param max_pages_per_pdf: Maximum number of pages for each generated PDF file.
@@ -126,28 +563,192 @@ def create_pdf(
     :param resolution: Tuple defining the resolution (width, height) of the image layout.
         Landscape layouts will use the provided resolution. Portrait-oriented layouts will
         apply a transposed resolution. Default is (1754, 1240).
+    :param quality: Resampling of images scaled to fit: "fast" first reduces images by
+        an integer factor to just above the target size and then resamples them
+        bilinearly, "balanced" resamples these with Lanczos, and "best" keeps twice
+        the target size to resample with Lanczos. Default is "best".
     :param annotate_images: Whether to annotate images with their filenames. Default is False.
     :param randomize_images: Whether to shuffle the images randomly before processing.
         Defaults to False.
+    :param seed: Seed for shuffling the images, making the order reproducible.
+        Required to shuffle images of a sharded job. Defaults to None.
+    :param keep_original_resolution: Whether to embed images of the 'document' layout
+        at their original resolution instead of shrinking them to the resolution width.
+        JPEG files are then embedded without being decoded or re-encoded, which they
+        always are if already fitting within the resolution. Defaults to False.
+    :param color_mode: Colors of the pages of the 'document' layout: "rgb" keeps the
+        colors of the images, "gray" embeds them in grayscale with Flate compression
+        and "bilevel" in black and white, thresholded against the brightness around
+        every pixel to cope with uneven lighting, with CCITT Group 4 compression. Text
+        scans are then several times smaller, and JPEG files are decoded without
+        their colors. Bilevel pages are not JPEG encoded, whatever max_pdf_size.
+        Defaults to "rgb".
+    :param include: Glob patterns, matching the file name or path relative to
+        image_path in any case, of images to include. Defaults to None (all images).
+    :param exclude: Glob patterns of images and directories to skip, matched like
+        include. Defaults to None.
+    :param workers: Number of processes rendering the pages of each PDF in parallel.
+        Pages are still added in order. Defaults to 1 (no process pool).
+    :param prefetch_threads: Number of threads reading the images of upcoming pages
+        into memory while a page is composed, with the previous page being encoded
+        meanwhile. Used without a process pool only, 0 renders pages one at a time.
+        Defaults to 4.
+    :param prefetch_memory: Cap in MB of the images read ahead. Defaults to 256.
+    :param save_plan: Path of a JSON file to save the layout plan of every collage
+        page to, by PDF number: the source, crop box and placement of every tile.
+        Defaults to None.
+    :param save_index: Whether to save the metadata index of the images next to the
+        image directory, allowing the next run to skip reading unchanged images.
+        Defaults to False.
+    :param tile_cache_size: Size cap in MB of the on-disk cache of fitted image tiles,
+        least recently used tiles are evicted beyond it. Defaults to 0 (disabled).
+    :param tile_cache_dir: Directory of the tile cache.
+        Defaults to images_to_pdf/tiles in the user cache directory.
+    :param page_cache_size: Size cap in MB of the in-memory cache of rendered collage
+        pages, which later runs in the same process, as by the `watch` command, reuse
+        if the page plan and its images are unchanged. Defaults to 0 (disabled).
+    :param memory_limit: Cap in MB of the memory taken by images read ahead, up to
+        a quarter of it, and by images being decoded at once by all worker processes
+        together, the rest of it. Images wait to be decoded until enough of the cap
+        is free, uncompressed images (BMP, TIFF) are decoded and downscaled a strip
+        of rows at a time, and images which can't be decoded within the cap are
+        skipped with a warning instead of failing the run. Without a cap, images are
+        skipped only beyond the size Pillow refuses as decompression bombs.
+        Defaults to None (no cap).
+    :param shard: Render only a share of the output PDFs, given as i/N for the i-th of
+        N shards. Each shard writes a manifest of its PDFs, and the `merge` command
+        checks that all shards of the job are complete. Defaults to None (all PDFs).
+    :param incremental: Whether to record the images and parameters of each PDF in a
+        build manifest next to the output, and skip PDFs which are unchanged since
+        the last run. Also resumes an interrupted run. Defaults to False.
+    :param streaming: Whether to write every page to the PDF file as soon as it is
+        rendered, keeping memory use constant regardless of the number of pages.
+        Always the case when output_pdf is "-", streaming a single PDF to stdout.
+        Defaults to False.
+    :param max_pdf_size: Size cap in MB of each PDF, such as an email attachment
+        limit. The pages are encoded as JPEG with the highest quality, chroma
+        subsampling and progressive setting estimated to fit, from a few sample pages
+        of the PDF, and a PDF still over the cap is written again with lower settings.
+        Pages are then always re-encoded, also JPEG files of 'document' layout.
+        Defaults to None (Pillow's JPEG defaults and no cap).
+    :param trace_file: Path of a Chrome trace JSON file (viewable in Perfetto) to save
+        timed spans of every stage to, per PDF, page and image, with bytes read and
+        written and the RSS high-water mark. Defaults to None.
+    :param trace_summary: Whether to log a table of the time spent in every stage at
+        the end of the run. Defaults to False.
+    :param event_func: A callable receiving every timed stage as a dict with name,
+        category, start, duration and args, as it completes. Defaults to None.
+    :param page_pool: A process pool rendering the pages, as started by
+        `page_executor`, instead of one of `workers` processes started for this run,
+        so that runs can share it. Defaults to None.
     :param progress_func: A callable function to provide progress updates.
         This callable takes two float arguments: the progress of outer and inner loops,
         expressed as values between 0 and 1. By default, it logs progress values.
     :return: None
     """
-    logger.info(f"Start {__package__} {__version__}")
+    logger.info(f"Start {__package__} {images_to_pdf.__version__}")
+    cache.configure(tile_cache_dir, tile_cache_size)
+    cache.configure_page_cache(page_cache_size)
+    decode_memory, prefetch_memory = share_memory_limit(memory_limit, prefetch_memory)
+    decode_budget = memory.configure(decode_memory)
+    trace = bool(trace_file or trace_summary or event_func)
+    # Spans are only passed on to event_func unless saved or summarized, as a
+    # long-lived job process would otherwise pile them up.
+    recorder = tracing.configure(trace, keep=bool(trace_file or trace_summary))
+    if event_func:
+        recorder.subscribers.append(event_func)
 
-    # Gather and log all image files.
-    all_image_files = list(
-        itertools.chain.from_iterable(
-            image_path.rglob(ext) for ext in SUPPORTED_IMAGE_EXTENSIONS
+    try:
+        shard_index, shard_count = manifest.parse_shard(shard) if shard else (1, 1)
+    except ValueError as e:
+        raise UsageError(str(e)) from None
+    if shard and randomize_images and seed is None:
+        raise UsageError("A seed is required to shuffle images of a sharded job")
+    if color_mode != "rgb" and layout != "document":
+        raise UsageError("A color mode other than rgb needs the document layout")
+    parameters = {
+        "images_per_page": images_per_page,
+        "max_pages_per_pdf": max_pages_per_pdf,
+        "layout": layout,
+        "resolution": resolution,
+        "quality": quality,
+        "annotate_images": annotate_images,
+        "randomize_images": randomize_images,
+        "seed": seed,
+        "keep_original_resolution": keep_original_resolution,
+        "color_mode": color_mode,
+        "max_pdf_size": max_pdf_size,
+    }
+
+    # Find image files in sorted order, rendering the same PDFs on every machine.
+    image_files = discover.find_images(image_path, include or (), exclude or ())
+    images_per_pdf = max_pages_per_pdf * images_per_page
+    # Render PDFs as soon as their images are found, unless all are needed first.
+    all_image_files = []
+    total_pdfs = None  # Known once all images are found.
+    if randomize_images or incremental or save_index or is_stdout(output_pdf):
+        with tracing.span("discover", "run") as args:
+            all_image_files = list(image_files)
+            args["images"] = len(all_image_files)
+        if randomize_images:
+            random.Random(seed).shuffle(all_image_files)
+        image_files = all_image_files
+        total_pdfs = count_pdfs(len(all_image_files), images_per_pdf)
+    else:
+        image_files = collect(image_files, all_image_files)
+
+    if is_stdout(output_pdf) and (total_pdfs > 1 or shard or incremental):
+        raise UsageError(
+            "Only a single PDF, without shards or incremental builds, "
+            "can be written to stdout"
         )
+
+    # Split images into the separate PDFs and keep the share of this shard.
+    pdf_image_batches = (
+        (pdf_number, image_batch)
+        for pdf_number, image_batch in enumerate(
+            itertools.batched(image_files, images_per_pdf), start=1
+        )
+        if manifest.in_shard(pdf_number, shard_index, shard_count)
     )
 
-    if randomize_images:
-        random.shuffle(all_image_files)
+    pdf_files = {}
+    job_plans = {}
+    build = None
+    if total_pdfs is not None:
+        pdf_image_batches = list(pdf_image_batches)
 
-    for img_file in all_image_files:
-        logger.info(f"Found file {img_file} {img_file.stat().st_size / 1000:.0f} KB")
+    # Skip PDFs built before from unchanged images and parameters.
+    if incremental:
+        build = manifest.BuildManifest(
+            manifest.build_manifest_path(output_pdf, shard), parameters
+        )
+        pdf_inputs = {
+            pdf_number: build.input_signature(image_path, image_batch)
+            for pdf_number, image_batch in pdf_image_batches
+        }
+        for pdf_number, _ in pdf_image_batches:
+            pdf_file = pdf_output_path(output_pdf, pdf_number, total_pdfs)
+            if build.is_up_to_date(pdf_number, pdf_inputs[pdf_number], pdf_file):
+                logger.info(f"Skipping unchanged PDF {pdf_file.as_posix()}")
+                pdf_files[pdf_number] = pdf_file
+        pdf_image_batches = [
+            (pdf_number, image_batch)
+            for pdf_number, image_batch in pdf_image_batches
+            if pdf_number not in pdf_files
+        ]
+        # Remove PDFs of the last build no longer written, as numbered anew.
+        planned_files = {
+            pdf_number: pdf_output_path(output_pdf, pdf_number, total_pdfs)
+            for pdf_number in pdf_inputs
+        }
+        for stale_file in build.remove_stale(planned_files, output_pdf.parent):
+            if stale_file.exists():
+                logger.warning(
+                    f"Kept stale PDF {stale_file.as_posix()}, changed since built"
+                )
+            else:
+                logger.info(f"Removed stale PDF {stale_file.as_posix()}")
 
     # Determine orientation and shrink resolution based on layout.
     orientation = "portrait" if layout in ("lane", "document") else "landscape"
@@ -158,50 +759,380 @@ def create_pdf(
             resolution[0],
         )  # Swap resolution for portrait layouts.
 
-    # Calculate number of final PDFs.
-    total_pdfs = (len(all_image_files) + max_pages_per_pdf - 1) // max_pages_per_pdf
-    logger.info(f"Creating {total_pdfs} PDF files")
+    if total_pdfs is None:
+        logger.info("Creating PDF files while finding images")
+    else:
+        index_images(
+            itertools.chain.from_iterable(batch for _, batch in pdf_image_batches),
+            index.index_file_for(image_path) if save_index else None,
+        )
+        logger.info(
+            f"Creating {len(pdf_image_batches)} of {total_pdfs} PDF files"
+            f" from {len(all_image_files)} images"
+        )
 
     # Process each batch of images for separate PDFs.
-    for pdf_number, image_batch in enumerate(
-        itertools.batched(all_image_files, max_pages_per_pdf * images_per_page), start=1
-    ):
-        progress_pdf_files = pdf_number / total_pdfs
-        with tempfile.TemporaryDirectory() as tmpdir_annotated_images:
-            # Annotate images if required.
-            final_images = (
-                perform_annotate_images(image_batch, tmpdir_annotated_images)
-                if annotate_images
-                else image_batch
-            )
+    if page_pool:
+        pool = contextlib.nullcontext(page_pool)
+    else:
+        pool = page_executor(
+            workers, tile_cache_dir, tile_cache_size, trace, decode_budget
+        )
+    partial_pdfs = []  # Removed if the run fails, renamed once numbered otherwise.
+    with pool as executor, removed_on_error(partial_pdfs):
+        for done_pdfs, (pdf_number, image_batch) in enumerate(
+            pdf_image_batches, start=1
+        ):
+            if total_pdfs is None:
+                index_images(image_batch)
+                progress_pdf_files = done_pdfs / (done_pdfs + 1)  # Total unknown.
+                partial_pdfs.append(pdf_output_path(output_pdf, pdf_number, None))
+            else:
+                progress_pdf_files = done_pdfs / len(pdf_image_batches)
+            # Stream the pages of the PDF straight into the PDF writer.
+            image_batches = list(itertools.batched(image_batch, images_per_page))
+            page_plans = None
+            if layout != "document":  # Plan every page before decoding any pixels.
+                with tracing.span("plan", "pdf", pages=len(image_batches)):
+                    page_plans = [
+                        plan_page(list(batch), layout, resolution)
+                        for batch in image_batches
+                    ]
+                if save_plan:
+                    job_plans[pdf_number] = page_plans
+            search = None
+            # Sample pages before rendering them all, bilevel ones aren't JPEG encoded.
+            if max_pdf_size and color_mode != "bilevel":
+                with tracing.span("size_search", "pdf", number=pdf_number):
+                    search = size_search(
+                        image_batches,
+                        page_plans,
+                        annotate_images,
+                        quality,
+                        shrink_to_resolution,
+                        keep_original_resolution,
+                        color_mode,
+                    )
 
-            # Create pages for the PDF.
-            with tempfile.TemporaryDirectory() as tmpdir_final_images:
-                image_batches = list(itertools.batched(final_images, images_per_page))
-                page_files = create_pages(
+            def write_pdf(jpeg: JpegSettings | None) -> Path:
+                pages = create_pages(
                     image_batches,
-                    layout,
-                    resolution,
-                    tmpdir_final_images,
+                    page_plans,
                     progress_func,
                     progress_pdf_files,
+                    executor,
+                    annotate_images,
+                    prefetch_threads,
+                    prefetch_memory,
+                    quality,
+                    jpeg,
+                    composed,
                 )
+                with tracing.span("pdf", "pdf", number=pdf_number):
+                    return generate_pdf(
+                        pages,
+                        output_pdf,
+                        pdf_number,
+                        total_pdfs,
+                        orientation,
+                        shrink_to_resolution,
+                        keep_original_resolution,
+                        annotate_images,
+                        streaming,
+                        quality,
+                        jpeg,
+                        color_mode,
+                        composed,
+                    )
 
-                # Generate the PDF from the page images.
-                generate_pdf(
-                    page_files,
-                    output_pdf,
+            # Keep the pages composed while searching, to encode them again if the
+            # PDF is written again.
+            with (
+                sizing.ComposedPages() if search else contextlib.nullcontext()
+            ) as composed:
+                pdf_files[pdf_number] = generate_pdf_within_size(
+                    write_pdf, search, int((max_pdf_size or 0) * 1024 * 1024)
+                )
+            if build:
+                build.record(
                     pdf_number,
-                    total_pdfs,
-                    orientation,
-                    shrink_to_resolution,
+                    pdf_inputs[pdf_number],
+                    image_batches,
+                    pdf_files[pdf_number],
+                    image_path,
                 )
 
-        progress_func(progress_pdf_files, 1.0)
+            progress_func(progress_pdf_files, 1.0)
+
+    if total_pdfs is None:  # Number the PDFs now that all images are found.
+        total_pdfs = count_pdfs(len(all_image_files), images_per_pdf)
+        for pdf_number, pdf_file in pdf_files.items():
+            pdf_files[pdf_number] = pdf_file.replace(
+                pdf_output_path(output_pdf, pdf_number, total_pdfs)
+            )
+        logger.info(
+            f"Created {len(pdf_files)} of {total_pdfs} PDF files"
+            f" from {len(all_image_files)} images"
+        )
+        progress_func(1.0, 1.0)  # As the progress of PDFs could only approach it.
+
+    if save_plan:
+        save_plans(save_plan, job_plans)
+        logger.info(f"Saved layout plans to {save_plan.as_posix()}")
+
+    if cache_summary := cache.summary():
+        logger.info(cache_summary)
+    if recorder:
+        spans = recorder.take()
+        if trace_file:
+            tracing.export_chrome_trace(spans, trace_file)
+            logger.info(f"Saved trace to {trace_file.as_posix()}")
+        if trace_summary:
+            logger.info(f"Time spent per stage:\n{tracing.summary_table(spans)}")
+
+    if shard:
+        job = manifest.job_fingerprint(image_path, all_image_files, parameters)
+        manifest_file = manifest.write_shard_manifest(
+            output_pdf, shard_index, shard_count, job, total_pdfs, pdf_files
+        )
+        logger.info(f"Wrote shard manifest {manifest_file.as_posix()}")
+
+
+@app.command
+def merge(output_pdf: ResolvedFile):
+    """
+    Checks that all shards of a job rendered with `--shard` are complete, and combines
+    their manifests into one.
+
+    :param output_pdf: Output PDF path the sharded job was run with.
+    """
+    merged_file, problems = manifest.merge_shard_manifests(output_pdf)
+    for problem in problems:
+        logger.error(problem)
+    if problems:
+        sys.exit(1)
+    logger.info(f"All shards complete, wrote {merged_file.as_posix()}")
+
+
+@app.command
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: Path | None = None,
+    max_jobs: int = jobs.MAX_JOBS,
+    token: str | None = None,
+):
+    """
+    Serves a local JSON API queuing jobs of creating PDFs, run by a fixed pool of
+    worker processes which keep imported modules and caches warm between jobs.
+
+    Jobs are posted to /jobs as {"args": [...], "priority": 0}, the args being those
+    of the images-to-pdf command, run highest priority first and in order of
+    submission otherwise. GET /jobs and /jobs/<id> return their status, DELETE
+    /jobs/<id> cancels a job. The `submit` command is a client of it. Requests need
+    the token of the server as "Authorization: Bearer <token>", which it saves to a
+    file only the user can read, and requests from web pages are refused.
+
+    :param host: Address to listen on, local only by default.
+    :param port: Port to listen on.
+    :param unix_socket: Path of a Unix socket to listen on instead of host and port.
+    :param max_jobs: Number of worker processes, running a job each at a time. The
+        processes rendering pages of a job are capped at its share of the CPUs.
+    :param token: Token clients need, a random one by default.
+    """
+    job_queue = jobs.JobQueue(max_jobs)
+    try:
+        server.serve(job_queue, host, port, unix_socket, token)
+    finally:
+        job_queue.close()
+
+
+@app.command
+def submit(
+    *args: str,
+    address: str = server.DEFAULT_SERVER,
+    priority: int = 0,
+    wait: bool = True,
+    token: str | None = None,
+):
+    """
+    Queues a job of creating PDFs on a server started with `serve`, given the
+    arguments of the images-to-pdf command after "--", and waits for it to end.
+
+    :param args: Arguments of creating the PDFs, relative paths being resolved here.
+    :param address: Address of the server, as http://host:port or unix:/path.
+    :param priority: Priority of the job, higher ones running first.
+    :param wait: Whether to wait for the job to end, logging its messages, cancelling
+        it if interrupted, and exit with an error if it did not succeed.
+    :param token: Token of the server, read from the file it saves by default.
+    """
+    client = server.Client(address, token)
+    try:
+        job = client.submit(
+            server.job_args(server.parse_job_args(list(args))), priority
+        )
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not queue job at {address}: {e}")
+        sys.exit(1)
+    logger.info(f"Queued job {job['id']} at {address}")
+    try:
+        while wait and job["state"] in ("queued", "running"):
+            time.sleep(jobs.POLL_INTERVAL)
+            job = client.status(job["id"])
+            for level, text in job.pop("logs"):
+                logger.log(level, f"Job {job['id']}: {text}")
+    except KeyboardInterrupt:
+        job = client.cancel(job["id"])
+    logger.info(f"Job {job['id']} {job['state']}: {json.dumps(job)}")
+    if wait and job["state"] != "done":
+        sys.exit(1)
+
+
+@app.command
+def watch(
+    image_path: ExistingDirectory,
+    output_pdf: ResolvedFile,
+    *args: str,
+    debounce: float = 2.0,
+    poll_interval: float | None = None,
+    page_cache_size: int = 256,
+):
+    """
+    Watches a directory of images, creating PDFs of them as the default command does
+    and updating them whenever images are added, changed or removed.
+
+    Each update is an incremental build, writing again only the PDFs whose images
+    changed, and rendering again only their pages whose images changed, the other
+    pages being kept in memory.
+
+    :param image_path: Directory containing images to watch.
+    :param output_pdf: Path to the resulting PDF file, numbered if several.
+    :param args: Other options of creating the PDFs, given after "--".
+    :param debounce: Seconds without further changes to wait for before updating,
+        so that files being copied are handled at once.
+    :param poll_interval: Scan the directory for changes every this many seconds,
+        instead of being notified by inotify, as needed on network storage. Polling
+        is always used where inotify is not available.
+    :param page_cache_size: Size cap in MB (1024² bytes) of the rendered pages kept
+        in memory.
+    """
+    parameters = server.parse_job_args(
+        [image_path.as_posix(), output_pdf.as_posix(), *args]
+    )
+    parameters |= {"incremental": True, "page_cache_size": page_cache_size}
+    changes = watcher.watcher_for(image_path, poll_interval)
+    try:
+        create_pdf(**parameters)
+        logger.info(f"Watching {image_path.as_posix()} for changes")
+        for changed in watcher.debounced_changes(changes, debounce):
+            logger.info(f"{len(changed)} images changed, updating PDFs")
+            start = time.perf_counter()
+            try:
+                create_pdf(**parameters)
+            except Exception as e:  # Keep watching, as a later change may fix it.
+                logger.error(f"Updating PDFs failed: {type(e).__name__}: {e}")
+                continue
+            logger.info(f"Updated PDFs in {time.perf_counter() - start:.1f} s")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        changes.close()
+
+
+@app.command
+def batch(
+    manifest_file: ResolvedExistingFile,
+    workers: int = 1,
+    tile_cache_size: int = 0,
+    tile_cache_dir: Path | None = None,
+    memory_limit: int | None = None,
+    report: Path | None = None,
+):
+    """
+    Runs every job of creating PDFs listed in a manifest in this process, one after
+    the other, and logs the time taken by each job and by all of them.
+
+    The jobs share the imported modules, the image index, the font and tile caches,
+    and the processes rendering pages, instead of each paying for starting anew as
+    separate images-to-pdf commands would. A job failing, or with options not valid,
+    is reported, and the others still run.
+
+    The manifest is a CSV file with a header row of option names of the default
+    command, as image_path,output_pdf,layout,resolution, list values being
+    separated by spaces. Or a JSON list of objects of them, or a JSON object with
+    this list as "jobs" and options common to all jobs as "defaults". Relative paths
+    are resolved against the directory of the manifest. Sizes and memory caps are in
+    MB of 1024² bytes.
+
+    :param manifest_file: CSV or JSON file listing the options of every job.
+    :param workers: Number of processes rendering pages, shared by all jobs.
+    :param tile_cache_size: Size cap in MB of the on-disk tile cache, 0 disables it.
+    :param tile_cache_dir: Directory of the tile cache.
+    :param memory_limit: Cap in MB of the memory of images being decoded and read
+        ahead, as of the default command.
+    :param report: Path of a JSON file to save the status and timing of every job to.
+    """
+    try:
+        job_parameters = batches.load_jobs(manifest_file)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read manifest: {e}")
+        sys.exit(1)
+    shared = dict(
+        workers=workers,
+        tile_cache_size=tile_cache_size,
+        tile_cache_dir=tile_cache_dir,
+        memory_limit=memory_limit,
+    )
+    decode_memory, _ = share_memory_limit(memory_limit, pipeline.PREFETCH_MEMORY)
+    decode_budget = memory.configure(decode_memory)
+    statuses = []
+    start = time.perf_counter()
+    # With spans traced in the pool, as the pages and images of a job are counted.
+    with page_executor(
+        workers, tile_cache_dir, tile_cache_size, True, decode_budget
+    ) as page_pool:
+        for number, (parameters, error) in enumerate(job_parameters, start=1):
+            job = jobs.Job(number, parameters)
+            job.start()
+            if error:
+                job.finish("failed", error)
+                logger.error(f"Job {number} of {manifest_file.as_posix()}: {error}")
+                statuses.append(job.status())
+                continue
+            logger.info(
+                f"Running job {number} of {len(job_parameters)}: "
+                f"{parameters['output_pdf']}"
+            )
+            try:
+                create_pdf(
+                    **parameters,
+                    **shared,
+                    page_pool=page_pool,
+                    event_func=lambda event, job=job: job.handle(("event", event)),
+                )
+            except Exception as e:
+                job.finish("failed", f"{type(e).__name__}: {e}")
+                logger.error(f"Job {number} failed: {job.error}")
+            else:
+                job.finish("done")
+            statuses.append(job.status())
+    elapsed = time.perf_counter() - start
+    logger.info(f"Batch report:\n{batches.report_table(statuses, elapsed)}")
+    if report:
+        report.write_text(
+            json.dumps({"elapsed_s": round(elapsed, 2), "jobs": statuses}, indent=2)
+        )
+        logger.info(f"Saved report to {report.as_posix()}")
+    if any(status["state"] != "done" for status in statuses):
+        sys.exit(1)
 
 
 def main():
-    app()
+    try:
+        app()
+    except UsageError as e:  # As cyclopts reports options it can't parse.
+        app.error_console.print(CycloptsPanel(str(e)))
+        sys.exit(2)
 
 
 if __name__ == "__main__":
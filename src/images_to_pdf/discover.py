@@ -0,0 +1,83 @@
+import fnmatch
+import os
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from images_to_pdf import logger
+
+IMAGE_SUFFIXES = frozenset({".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff"})
+IMAGE_FORMATS = ("JPEG", "PNG", "GIF", "BMP", "TIFF")  # Pillow formats of the suffixes.
+SCAN_THREADS = 8  # Listing directories is I/O bound, notably on network storage.
+
+Listing = list[tuple[Path, Future | None]]  # Sorted entries, futures for directories.
+
+
+def compile_globs(patterns: Iterable[str]) -> re.Pattern | None:
+    """Combine glob patterns into one case-insensitive regular expression."""
+    patterns = list(patterns)
+    if not patterns:
+        return None
+    return re.compile("|".join(map(fnmatch.translate, patterns)), re.IGNORECASE)
+
+
+def find_images(
+    image_path: Path,
+    include: Iterable[str] = (),
+    exclude: Iterable[str] = (),
+    threads: int = SCAN_THREADS,
+) -> Iterator[Path]:
+    """
+    Yield the image files below a directory lazily, in sorted path order, while the
+    rest of the tree is still being scanned.
+
+    The tree is walked once with os.scandir, listing subdirectories in parallel ahead
+    of the files yielded. Image suffixes are matched case-insensitively, and so are
+    the include and exclude globs, which match either the name or the path relative
+    to image_path. Files must match an include glob if any are given, excluded
+    directories are not entered.
+    """
+    included, excluded = compile_globs(include), compile_globs(exclude)
+    executor = ThreadPoolExecutor(max_workers=threads)
+
+    def is_excluded(name: str, relative_path: str) -> bool:
+        return excluded is not None and bool(
+            excluded.match(name) or excluded.match(relative_path)
+        )
+
+    def scan(directory: Path, prefix: str) -> Listing:
+        listing = []
+        try:
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError as e:
+            logger.warning(f"Skipping directory {directory.as_posix()}: {e}")
+            return listing
+        for entry in entries:
+            relative_path = prefix + entry.name
+            if is_excluded(entry.name, relative_path):
+                continue
+            path = directory / entry.name
+            if entry.is_dir(follow_symlinks=False):
+                subdirectory = executor.submit(scan, path, f"{relative_path}/")
+                listing.append((path, subdirectory))
+            elif os.path.splitext(entry.name)[1].lower() in IMAGE_SUFFIXES and (
+                included is None
+                or included.match(entry.name)
+                or included.match(relative_path)
+            ):
+                listing.append((path, None))
+        return listing
+
+    def walk(listing: Future) -> Iterator[Path]:
+        for path, subdirectory in listing.result():
+            if subdirectory is None:
+                yield path
+            else:
+                yield from walk(subdirectory)
+
+    try:
+        yield from walk(executor.submit(scan, image_path, ""))
+    finally:  # Stop scanning ahead if the caller stops early.
+        executor.shutdown(wait=False, cancel_futures=True)
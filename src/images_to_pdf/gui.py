@@ -1,17 +1,30 @@
+import os
+import time
 from pathlib import Path
 
-from pywebio.output import put_progressbar, set_progressbar, put_text, put_html
+from pywebio.output import (
+    put_buttons,
+    put_progressbar,
+    set_progressbar,
+    put_text,
+    put_html,
+    use_scope,
+    put_scope,
+    clear,
+)
 
-from images_to_pdf.cli import create_pdf
 from . import runmode, __email__
+from .jobs import Job, job_queue, POLL_INTERVAL
 import pywebio
-from pywebio.input import input_group, input, NUMBER, select, checkbox, TEXT
-from pywebio_battery import put_logbox
+from pywebio.input import input_group, input, NUMBER, FLOAT, select, checkbox, TEXT
+from pywebio_battery import put_logbox, logbox_append
 from userpaths import get_desktop
 from . import logger
 from . import __version__
 import sys
 
+DEFAULT_HOST = "127.0.0.1"  # Local only, remote access is opted into.
+
 
 def validate_path(path: str):
     if not Path(path).is_dir():
@@ -27,14 +40,30 @@ def validate_output_file(path: str):
     return None
 
 
-def update_progress_gui(outer: float, inner: float):
-    set_progressbar('outer', outer)
-    set_progressbar("inner", inner)
-
+def validate_params(params: dict):
+    if params["color_mode"] != "rgb" and params["layout"] != "document":
+        return "color_mode", "Only document layout can be in grayscale or bilevel"
+    return None
 
-def main():
-    runmode.set_runmode("gui")
 
+def show_job_status(job: Job):
+    set_progressbar('outer', job.outer)
+    set_progressbar("inner", job.inner)
+    for level, text in job.take_logs():
+        logbox_append("log", f"{time.strftime('%H:%M:%S')} {level} {text}\n")
+    with use_scope("stage", clear=True):
+        if job.state == "queued":
+            put_text(f"Queued behind {job_queue.position(job)} other jobs")
+            return
+        eta = job.eta()
+        put_text(
+            f"Stage: {job.stage or 'starting'} | {job.images} images, {job.pages} pages"
+            f" | {job.images_per_second():.1f} images/s"
+            f" | ETA: {f'{eta:.0f} s' if eta is not None else 'unknown'}"
+        )
+
+
+def session():
     put_html(f'<h1>🌄 Images to PDF 📄 {__version__}</h1>')
     put_html(f'Author: <a href="mailto:{__email__}">{__email__}</a><br/>')
 
@@ -72,6 +101,20 @@ def main():
             input(
                 "Max pages per PDF: ", type=NUMBER, name="max_pages_per_pdf", value=20
             ),
+            input(
+                "Workers: ",
+                type=NUMBER,
+                name="workers",
+                value=os.cpu_count() or 1,
+                help_text=f"Number of processes rendering pages in parallel, at most {job_queue.cpus_per_job} as jobs share the CPUs",
+            ),
+            input(
+                "Tile cache size (MB): ",
+                type=NUMBER,
+                name="tile_cache_size",
+                value=0,
+                help_text="Cache fitted images on disk to speed up re-runs, 0 disables it",
+            ),
             select(
                 label="Layout",
                 options=["grid", "auto", "lane", "document"],
@@ -89,6 +132,27 @@ def main():
                 name="resolution",
                 help_text="Smaller result in smaller file",
             ),
+            select(
+                label="Quality",
+                options=["fast", "balanced", "best"],
+                name="quality",
+                value="best",
+                help_text="Faster resampling of images, fast is enough for small resolution",
+            ),
+            select(
+                label="Color mode",
+                options=["rgb", "gray", "bilevel"],
+                name="color_mode",
+                value="rgb",
+                help_text="Document pages in grayscale, or black and white for much smaller text scans",
+            ),
+            input(
+                "Max PDF size (MB): ",
+                type=FLOAT,
+                name="max_pdf_size",
+                value=0,
+                help_text="Compress images to keep each PDF under this size, e.g. an email attachment limit, 0 for no limit",
+            ),
             checkbox(
                 label="Annotate images",
                 options=["filename"],
@@ -96,6 +160,13 @@ def main():
                 value=[],
                 help_text="Add filename as part of the image, initial digits removed (could be kept for ordering), single underscores replaced by spaces, double underscores replaces by newlines",
             ),
+            checkbox(
+                label="Keep original resolution",
+                options=["keep"],
+                name="keep_original_resolution",
+                value=[],
+                help_text="Embed document images as-is instead of shrinking them to the resolution",
+            ),
             checkbox(
                 label="Randomize images",
                 options=["randomize"],
@@ -104,27 +175,60 @@ def main():
                 help_text="Shuffle images randomly before processing",
             )
         ],
+        validate=validate_params,
     )
 
     logger.info(f"Parameters: {params}")
     put_progressbar("outer", label='PDF creation progress:')
     put_progressbar("inner", label='Imageset progress:')
+    put_scope("stage")
+    put_scope("job")
 
-    create_pdf(
+    job = job_queue.submit(dict(
         image_path=Path(params["image_path"]),
         output_pdf=Path(params["output_pdf"]),
         images_per_page=params["images_per_page"],
         max_pages_per_pdf=params["max_pages_per_pdf"],
         layout=params["layout"],
         resolution=params["resolution"],
+        quality=params["quality"],
+        color_mode=params["color_mode"],
+        max_pdf_size=params["max_pdf_size"] or None,
         annotate_images=params["annotate_images"],
         randomize_images=params["randomize"],
-        progress_func=update_progress_gui,
-    )
+        keep_original_resolution=bool(params["keep_original_resolution"]),
+        workers=params["workers"],
+        tile_cache_size=params["tile_cache_size"],
+    ))
+    put_buttons(["Cancel"], onclick=lambda _: job.cancel(), scope="job")
+    while job.state in ("queued", "running"):
+        show_job_status(job)
+        time.sleep(POLL_INTERVAL)
+    show_job_status(job)
+    clear("job")
+
+    match job.state:
+        case "done":
+            put_text(f'✅ PDF created successfully to {Path(params["output_pdf"]).parent.as_posix()} ...')
+        case "cancelled":
+            put_text('🛑 PDF creation cancelled')
+        case "failed":
+            put_text(f'❌ PDF creation failed: {job.error}')
 
-    put_text(f'✅ PDF created successfully to {Path(params["output_pdf"]).parent.as_posix()} ...')
 
+def main():
+    """
+    Serve the GUI, every browser session queuing its jobs on the shared job queue.
 
+    The GUI browses folders and writes PDFs anywhere the user can, so it listens on
+    this machine only, unless another address is opted into with the environment
+    variable IMAGES_TO_PDF_GUI_HOST, such as 0.0.0.0 for every network interface.
+    """
+    runmode.set_runmode("gui")
+    host = os.environ.get("IMAGES_TO_PDF_GUI_HOST", DEFAULT_HOST)
+    if host != DEFAULT_HOST:
+        logger.warning(f"GUI reachable from other machines at {host}")
+    pywebio.start_server(session, host=host, auto_open_webbrowser=True)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,41 @@
+import contextlib
+import functools
 import re
 from enum import StrEnum
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import io
 from pathlib import Path
-from typing import Literal, Annotated, Iterable
-from PIL import Image, ImageOps
+from typing import TYPE_CHECKING, Literal, Annotated, Iterable, Iterator, NamedTuple
 import math
-import random
 
-from loguru import logger
+from images_to_pdf import cache, index, layout, logger, memory, tracing
+from images_to_pdf.text import filename_to_annotation
 
-GOLDEN_RATIO = (1 + math.sqrt(5)) / 2  # Define the golden ratio
+if TYPE_CHECKING:  # Imported when labelling images only, as it takes a while.
+    from PIL import ImageFont
+
+REDUCING_GAP = 2  # Keep at least this factor above target size before resampling
+MIN_LABEL_FONT_SIZE = 12
+
+Quality = Literal["fast", "balanced", "best"]
+# Resampling filter of each quality, and the margin above target size kept when first
+# reducing by an integer factor, the larger the more pixels the filter processes.
+RESAMPLING = {
+    "fast": (Image.Resampling.BILINEAR, 1),
+    "balanced": (Image.Resampling.LANCZOS, 1),
+    "best": (Image.Resampling.LANCZOS, REDUCING_GAP),
+}
+
+ColorMode = Literal["rgb", "gray", "bilevel"]
+# Bilevel pages are thresholded adaptively: pixels darker by THRESHOLD_OFFSET than
+# the mean of a box around them, of this share of the page width, turn black, as do
+# pixels darker than DARK_LEVEL, so uneven lighting of scans doesn't turn to black.
+THRESHOLD_WINDOW = 1 / 16
+THRESHOLD_OFFSET = 16
+DARK_LEVEL = 64
+
+prefetched: dict[Path, bytes] = {}  # Image files read ahead into memory.
 
 
 class ImageFormat(StrEnum):
@@ -19,7 +43,174 @@ class ImageFormat(StrEnum):
     PNG = "PNG"
 
 
-def golden_ratio_collage(images, collage, padding, randomization):
+class JpegSettings(NamedTuple):
+    """JPEG encoder settings, with Huffman tables always optimized."""
+
+    quality: int
+    subsampling: int  # 0 for 4:4:4, 2 for 4:2:0 chroma subsampling.
+    progressive: bool = False
+
+    def save_options(self) -> dict:
+        return dict(
+            quality=self.quality,
+            subsampling=self.subsampling,
+            progressive=self.progressive,
+            optimize=True,
+        )
+
+    def __str__(self):
+        chroma = "4:4:4" if self.subsampling == 0 else "4:2:0"
+        progressive = ", progressive" if self.progressive else ""
+        return f"JPEG quality {self.quality}, {chroma} chroma{progressive}"
+
+
+def cover_size(image_size: tuple[int, int], size: tuple[int, int]) -> tuple[int, int]:
+    """Return the smallest size with the aspect of image_size that fully covers size."""
+    scale = max(size[0] / image_size[0], size[1] / image_size[1])
+    return (
+        max(1, math.ceil(image_size[0] * scale)),
+        max(1, math.ceil(image_size[1] * scale)),
+    )
+
+
+@contextlib.contextmanager
+def decoded_image_for_size(
+    img_path: Path,
+    size: tuple[int, int],
+    crop: layout.Box | None = None,
+    reducing_gap: int = REDUCING_GAP,
+    mode: str | None = None,
+) -> Iterator[Image.Image]:
+    """
+    Decode an image to no more pixels than needed to cover the given size, or for
+    its crop box to cover it if given, holding its decoded bytes in the memory budget
+    while in use.
+
+    JPEG files are decoded directly at the smallest DCT scale (1/2, 1/4 or 1/8) that
+    still covers the target, and in the mode if given, such as "L" to skip decoding
+    their colors when only gray is needed. Other formats are box-reduced by an integer factor
+    right after decoding, keeping a margin of reducing_gap for the final resampling.
+    Uncompressed images (BMP, TIFF) are decoded and reduced a strip of rows at a
+    time, so huge scans are never held decoded whole. Images read ahead into
+    prefetched are decoded from memory. Raises memory.ImageTooLarge if the image
+    can't be decoded within the memory limit.
+    """
+    data = prefetched.get(img_path)
+
+    def open_image() -> Image.Image:
+        return index.open_image(io.BytesIO(data) if data is not None else img_path)
+
+    img = open_image()
+    if crop is not None:
+        left, top, right, bottom = crop
+        size = (
+            math.ceil(size[0] * img.width / (right - left)),
+            math.ceil(size[1] * img.height / (bottom - top)),
+        )
+    img.draft(mode, cover_size(img.size, size))
+    factor = 1
+    if img.mode not in ("1", "P"):
+        cover_width, cover_height = cover_size(img.size, size)
+        factor = max(
+            1, min(img.width // cover_width, img.height // cover_height) // reducing_gap
+        )
+    strips = factor > 1 and memory.can_decode_in_strips(img)
+    with memory.reserve(
+        memory.decode_bytes(img, factor, strips),
+        f"{img_path.name} of {img.width}x{img.height} pixels",
+    ):
+        with tracing.span(
+            "decode", "image", bytes_read=index.lookup(img_path).file_size
+        ) as args:
+            if strips:
+                img.close()
+                img = memory.reduce_in_strips(open_image, factor)
+                args["strips"] = True
+            else:
+                img.load()
+                if factor > 1:
+                    img = img.reduce(factor)
+            args["decoded_size"] = img.size
+        yield img
+
+
+def fit_image(
+    img_path: Path,
+    size: tuple[int, int],
+    annotation: str = "",
+    crop: layout.Box | None = None,
+    quality: Quality = "best",
+) -> Image.Image:
+    """
+    Open, crop and resize an image to exactly fill size, labelled with the annotation
+    if given, using the tile cache if enabled.
+
+    The image is cropped to the crop box if given, and otherwise to its centered part
+    with the aspect of size, as ImageOps.fit does. It is resampled as the quality
+    sets in RESAMPLING.
+    """
+    method, reducing_gap = RESAMPLING[quality]
+    info = index.lookup(img_path)
+    if crop is None:
+        crop = layout.fit_crop((info.width, info.height), size)
+    tile_cache = cache.tile_cache
+    key = (
+        tile_cache.key(img_path, size, method, annotation, crop, reducing_gap)
+        if tile_cache
+        else None
+    )
+    if key:
+        with tracing.span("tile_cache", "image") as args:
+            tile = tile_cache.get(key)
+            args["hit"] = tile is not None
+        if tile is not None:
+            return tile
+    with decoded_image_for_size(img_path, size, crop, reducing_gap) as img:
+        with tracing.span("fit", "image"):
+            scale_x, scale_y = img.width / info.width, img.height / info.height
+            left, top, right, bottom = crop
+            tile = img.resize(
+                size,
+                method,
+                box=(left * scale_x, top * scale_y, right * scale_x, bottom * scale_y),
+            )
+    if annotation:
+        with tracing.span("annotate", "image"):
+            tile = add_text_to_image(tile, annotation)
+    if key:
+        tile = tile_cache.put(key, tile)
+    return tile
+
+
+def tile_annotation(img_path: Path, annotate: bool) -> str:
+    return filename_to_annotation(img_path) if annotate else ""
+
+
+def render_plan(
+    plan: layout.LayoutPlan,
+    collage: Image.Image,
+    annotate: bool = False,
+    quality: Quality = "best",
+) -> Image.Image:
+    """Render the tiles of a page plan onto the collage."""
+    for tile in plan.tiles:
+        x, y, width, height = tile.rect
+        try:
+            img = fit_image(
+                tile.source,
+                (width, height),
+                tile_annotation(tile.source, annotate),
+                tile.crop,
+                quality,
+            )
+        except memory.ImageTooLarge as e:  # Leave its place blank, not fail the run.
+            logger.warning(f"Skipping image {tile.source.as_posix()}: {e}")
+            continue
+        collage.paste(img, (x, y))
+    return collage
+
+
+def golden_ratio_collage(images, collage, padding, randomization, annotate=False):
     """
     Create a golden ratio-based collage from the provided images.
 
@@ -28,78 +219,23 @@ def golden_ratio_collage(images, collage, padding, randomization):
         collage (PIL.Image): Blank canvas to place the images.
         padding (int): Space between images and canvas edges.
         randomization (bool): Randomize image placement and order.
+        annotate (bool): Label each image with its filename.
 
     Notes:
         - Images are dynamically resized based on the golden ratio and remaining working area.
     """
-    # Initialize the working area for placing images
-    working_area = {
-        "x": 0,
-        "y": 0,
-        "width": collage.width,
-        "height": collage.height,
-    }
-
-    # Determine the initial layout orders
-    horizontal_order = "right-to-left"
-    vertical_order = "bottom-to-top"
-
-    # Determine the initial layout orders
-    if randomization:
-        horizontal_order = random.choice(["right-to-left", "left-to-right"])
-        vertical_order = random.choice(["bottom-to-top", "top-to-bottom"])
-        random.shuffle(images)
-
-    x, y = 0, 0  # Starting position
-    for idx, img_path in enumerate(images):
-        img = Image.open(img_path)
-        # Decide whether to split horizontally or vertically based on working area dimensions
-        if working_area["width"] > working_area["height"]:  # Horizontal split
-            img = ImageOps.fit(
-                img,
-                (int(working_area["width"] / GOLDEN_RATIO), working_area["height"]),
-                method=Image.Resampling.LANCZOS,
-            )
-            # Adjust position and update working area
-            if horizontal_order == "right-to-left":
-                horizontal_order = "left-to-right"
-                working_area["x"] += img.width + padding
-            else:
-                x = x + working_area["width"] - img.width
-                horizontal_order = "right-to-left"
-            working_area["width"] -= img.width + padding
-        else:  # Vertical split
-            img = ImageOps.fit(
-                img,
-                (working_area["width"], int(working_area["height"] / GOLDEN_RATIO)),
-                method=Image.Resampling.LANCZOS,
-            )
-            # Adjust position and update working area
-            if vertical_order == "bottom-to-top":
-                working_area["y"] += img.height + padding
-                vertical_order = "top-to-bottom"
-            else:
-                y = y + working_area["height"] - img.height
-                vertical_order = "bottom-to-top"
-            working_area["height"] -= img.height + padding
-
-        # Paste the image onto the canvas
-        collage.paste(img, (x, y))
-        x, y = (
-            working_area["x"],
-            working_area["y"],
-        )  # Update position for the next image
-
-        # Stop if the working area becomes too small
-        if working_area["width"] <= 0 or working_area["height"] <= 0:
-            print("Working area exhausted. Stopping collage creation.")
-            break
-
-    return collage
+    plan = layout.plan_golden_ratio(images, collage.size, padding, randomization)
+    return render_plan(plan, collage, annotate)
 
 
 def lane_collage(
-    images, collage, padding, randomization, centered, orientation="horizontal"
+    images,
+    collage,
+    padding,
+    randomization,
+    centered,
+    orientation="horizontal",
+    annotate=False,
 ):
     """
     Create a lane-based collage.
@@ -111,60 +247,18 @@ def lane_collage(
         randomization (bool): Randomize image placement and order.
         centered (bool): Whether to center the grid if the canvas is not square.
         orientation (str): Orientation of the grid: "horizontal" or "vertical".
+        annotate (bool): Label each image with its filename.
     """
-    canvas_width, canvas_height = collage.size
-
-    images_num = len(images)
-
-    if randomization:
-        random.shuffle(images)
-
-    # Determine block size based on orientation
-    if orientation == "horizontal":
-        block_height = (canvas_height - (images_num + 1) * padding) // images_num
-        block_width = canvas_width
-    elif orientation == "vertical":
-        block_width = (canvas_width - (images_num + 1) * padding) // images_num
-        block_height = canvas_height
-    else:
-        raise ValueError("Orientation must be 'horizontal' or 'vertical'.")
-
-    # Centering offsets
-    offset_x, offset_y = 0, 0
-    if centered:
-        if (
-            orientation == "horizontal"
-            and images_num * (block_height + padding) < canvas_height
-        ):
-            offset_y = (canvas_height - (images_num * (block_height + padding))) // 2
-        if (
-            orientation == "vertical"
-            and images_num * (block_width + padding) < canvas_width
-        ):
-            offset_x = (canvas_width - (images_num * (block_width + padding))) // 2
-
-    # Resize and paste images
-    for idx, img_path in enumerate(images):
-        img = Image.open(img_path)
-        img = ImageOps.fit(
-            img, (block_width, block_height), method=Image.Resampling.LANCZOS
-        )
-
-        # Calculate position
-        x, y = 0, 0
-        if orientation == "horizontal":
-            y = idx * (block_height + padding) + padding + offset_y
-        elif orientation == "vertical":
-            x = idx * (block_width + padding) + padding + offset_x
-
-        collage.paste(img, (x, y))
-
-    return collage
+    plan = layout.plan_lane(
+        images, collage.size, padding, randomization, centered, orientation
+    )
+    return render_plan(plan, collage, annotate)
 
 
-def auto_layout(images, collage, padding, randomization, centered):
+def auto_layout(images, collage, padding, randomization, centered, annotate=False):
     """
-    Create an auto layout.
+    Create an auto layout, a grid if all images are square and otherwise justified
+    rows, decided from the image dimensions.
 
     Args:
         images (list): List of image file paths to include in the collage.
@@ -172,57 +266,32 @@ def auto_layout(images, collage, padding, randomization, centered):
         padding (int): Space between images and canvas edges.
         randomization (bool): Randomize image placement and order.
         centered (bool): Whether to center the grid if the canvas is not square (default: False).
+        annotate (bool): Label each image with its filename (default: False).
     """
-    canvas_width, canvas_height = collage.size
-    images_num = len(images)
-    image_objects_list = []
-    squares = 0
-    horizontal_rectangles = 0
-    vertical_rectangles = 0
-    total_area = 0
-    aspect_ratio_sum_width = aspect_ratio_sum_height = 0
-    for idx, img_path in enumerate(images):
-        img = Image.open(img_path)
-        image_objects_list.append({"image": img})
-        total_area += img.width * img.height
-        if img.height == img.width:
-            squares += 1
-            aspect_ratio_sum_width += 1
-            aspect_ratio_sum_height += 1
-
-        elif img.height > img.width:
-            vertical_rectangles += 1
-            aspect_ratio_sum_height += img.height / img.width
-            aspect_ratio_sum_width += 1
-
-        else:
-            horizontal_rectangles += 1
-            aspect_ratio_sum_width += img.width / img.height
-            aspect_ratio_sum_height += 1
-
-    if squares == images_num:
-        return grid_collage(images, collage, padding, randomization, centered)
-
-    elif horizontal_rectangles == images_num:
-        return lane_collage(
-            images, collage, padding, randomization, centered, orientation="horizontal"
-        )
+    plan = layout.plan_auto(images, collage.size, padding, randomization, centered)
+    return render_plan(plan, collage, annotate)
 
-    elif vertical_rectangles == images_num:
-        return lane_collage(
-            images, collage, padding, randomization, centered, orientation="vertical"
-        )
 
-    else:
-        canvas_area = canvas_width * canvas_height
-        scaling_factor = math.sqrt(canvas_area / total_area)
-        rows = 0
-        cols = 0
-        aspect_sum_diff = abs(aspect_ratio_sum_width - aspect_ratio_sum_height)
-        return golden_ratio_collage(images, collage, padding, randomization)
+def justified_collage(
+    images, collage, padding, randomization, centered, annotate=False
+):
+    """
+    Create a collage of justified rows, filling the whole canvas with images cropped
+    as little as possible, planned from the image dimensions only.
+
+    Parameters:
+        images (list): List of image file paths to include in the collage.
+        collage (PIL.Image): Blank canvas to place the images.
+        padding (int): Space between images and canvas edges.
+        randomization (bool): Randomize image placement and order.
+        centered (bool): Unused, as rows always fill the canvas.
+        annotate (bool): Label each image with its filename.
+    """
+    plan = layout.plan_justified(images, collage.size, padding, randomization)
+    return render_plan(plan, collage, annotate)
 
 
-def grid_collage(images, collage, padding, randomization, centered):
+def grid_collage(images, collage, padding, randomization, centered, annotate=False):
     """
     Create a grid-based collage.
 
@@ -232,67 +301,10 @@ def grid_collage(images, collage, padding, randomization, centered):
         padding (int): Space between images and canvas edges.
         randomization (bool): Randomize image placement and order.
         centered (bool): Whether to center the grid if the canvas is not square.
+        annotate (bool): Label each image with its filename.
     """
-    images_num = len(images)
-    if randomization:
-        random.shuffle(images)
-    canvas_width, canvas_height = collage.size
-    if canvas_width == canvas_height:
-        # Square canvas: Determine grid dimensions for a square layout
-        grid_size = math.ceil(math.sqrt(images_num))
-        cell_size = (canvas_width - (grid_size + 1) * padding) // grid_size
-
-        for idx, img_path in enumerate(images):
-            img = Image.open(img_path)
-            img = ImageOps.fit(
-                img, (cell_size, cell_size), method=Image.Resampling.LANCZOS
-            )
-
-            # Calculate position in the grid
-            x = (idx % grid_size) * (cell_size + padding) + padding
-            y = (idx // grid_size) * (cell_size + padding) + padding
-
-            collage.paste(img, (x, y))
-
-    else:
-        # Non-square canvas: Determine grid dimensions for the closest layout
-        cols = math.ceil(math.sqrt(images_num))
-        rows = math.ceil(images_num / cols)
-        offset_x, offset_y = 0, 0
-
-        # Adjust grid dimensions and offsets based on canvas proportions
-        if canvas_width > canvas_height:
-            if cols < rows:
-                cols, rows = rows, cols
-            if centered:
-                offset_x = (canvas_width - (rows * (canvas_height // rows))) // 2
-        elif canvas_width < canvas_height:
-            if cols > rows:
-                cols, rows = rows, cols
-            if centered:
-                offset_y = (canvas_height - (cols * (canvas_width // cols))) // 2
-
-        # Calculate cell dimensions
-        cell_width = (canvas_width - (cols + 1) * padding) // cols
-        cell_height = (canvas_height - (rows + 1) * padding) // rows
-
-        # Use the smaller dimension if centering is enabled
-        if centered:
-            cell_width = cell_height = min(cell_width, cell_height)
-
-        for idx, img_path in enumerate(images):
-            img = Image.open(img_path)
-            img = ImageOps.fit(
-                img, (cell_width, cell_height), method=Image.Resampling.LANCZOS
-            )
-
-            # Calculate position in the grid
-            x = (idx % cols) * (cell_width + padding) + padding + offset_x
-            y = (idx // cols) * (cell_height + padding) + padding + offset_y
-
-            collage.paste(img, (x, y))
-
-    return collage
+    plan = layout.plan_grid(images, collage.size, padding, randomization, centered)
+    return render_plan(plan, collage, annotate)
 
 
 def create_collage_from_images(
@@ -301,6 +313,8 @@ def create_collage_from_images(
     size=(1754, 1240),
     bg_color: str = "#000000",
     image_format: ImageFormat = ImageFormat.PNG,
+    annotate: bool = False,
+    quality: Quality = "best",
 ) -> Annotated[bytes, "Image bytes"]:
     """
     Creates a collage from a collection of images, allowing customization of layout, size,
@@ -325,64 +339,139 @@ def create_collage_from_images(
     :param image_format:
         Specifies the format of the output image using the ImageFormat enumeration.
         Defaults to ImageFormat.PNG.
+    :param annotate:
+        Whether to label each image with its filename. Defaults to False.
+    :param quality:
+        Resampling speed and quality, "fast", "balanced" or "best". Defaults to "best".
     :return:
         The generated collage as bytes, which can be saved or transmitted as needed.
     """
+    new_collage = compose_collage(
+        images, collage_type, size, bg_color, annotate, quality
+    )
+    return encode_image(new_collage, image_format)
+
+
+def compose_collage(
+    images: Iterable[Path],
+    collage_type: Literal["grid", "auto", "lane", "document"],
+    size=(1754, 1240),
+    bg_color: str = "#000000",
+    annotate: bool = False,
+    quality: Quality = "best",
+) -> Image.Image:
+    """Lay out the images on a new collage, as create_collage_from_images does."""
+    with tracing.span("plan", "page"):
+        plan = layout.plan_page(images, collage_type, size)
+    return render_page_plan(plan, bg_color, annotate, quality)
+
+
+def render_page_plan(
+    plan: layout.LayoutPlan,
+    bg_color: str = "#000000",
+    annotate: bool = False,
+    quality: Quality = "best",
+) -> Image.Image:
+    """Render a page plan on a new collage of the plan's size."""
     new_collage = Image.new(
         "RGB",
-        size=size,
+        size=plan.size,
         color=bg_color,
     )
+    with tracing.span("layout", "page", images=len(plan.tiles)):
+        return render_plan(plan, new_collage, annotate, quality)
+
+
+def encode_image(
+    image: Image.Image, image_format: ImageFormat, jpeg: JpegSettings | None = None
+) -> bytes:
+    """Encode an image, as JPEG with the given settings or Pillow's defaults."""
+    with tracing.span("encode", "page") as args:
+        image_bytes = io.BytesIO()
+        options = jpeg.save_options() if jpeg else {}
+        if image_format == ImageFormat.JPG and image.mode not in ("L", "RGB"):
+            image = image.convert("RGB")
+        image.save(image_bytes, format=image_format.value, **options)
+        args["bytes_written"] = image_bytes.tell()
+    return image_bytes.getvalue()
+
+
+@functools.lru_cache(maxsize=16)
+def load_font(size: int) -> "ImageFont.FreeTypeFont":
+    from PIL import ImageFont
 
-    t = {
-        "grid": grid_collage,
-        "auto": auto_layout,
-        "lane": lane_collage,
-        "document": lane_collage,
-    }
-
-    new_collage: Image = t[collage_type](
-        images=images,
-        collage=new_collage,
-        padding=0,
-        randomization=False,
-        centered=False,
+    return ImageFont.load_default(size)
+
+
+@functools.lru_cache(maxsize=1024)
+def label_sprite(text: str, font_size: int) -> Image.Image:
+    """Render text in white on a black box, cached as the same labels recur."""
+    from PIL import ImageDraw
+
+    font = load_font(font_size)
+    left, top, right, bottom = ImageDraw.Draw(Image.new("1", (1, 1))).textbbox(
+        (0, 0), text, font=font
     )
-    image_bytes = io.BytesIO()
-    new_collage.save(image_bytes, format=image_format.value)
-    return image_bytes.getvalue()
+    margin = max(2, font_size // 4)
+    sprite = Image.new(
+        "RGB", (right - left + 2 * margin, bottom - top + 2 * margin), "black"
+    )
+    ImageDraw.Draw(sprite).text(
+        (margin - left, margin - top), text, font=font, fill=(255, 255, 255)
+    )
+    return sprite
+
+
+def add_text_to_image(image: Image.Image, text: str) -> Image.Image:
+    """Label an image with text, sized relative to the image."""
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    font_size = max(MIN_LABEL_FONT_SIZE, min(image.size) // 30)
+    image.paste(label_sprite(text, font_size), (image.width // 9, image.height // 20))
+    return image
+
+
+def convert_color_mode(image: Image.Image, color_mode: ColorMode) -> Image.Image:
+    """
+    Convert an image to the color mode of its page: kept as is for "rgb", grayscale
+    for "gray", and black and white for "bilevel", thresholded adaptively.
+    """
+    if color_mode == "rgb":
+        return image
+    with tracing.span("color", "image", color_mode=color_mode):
+        gray = image if image.mode == "L" else image.convert("L")
+        return gray if color_mode == "gray" else adaptive_threshold(gray)
+
+
+def adaptive_threshold(gray: Image.Image) -> Image.Image:
+    """
+    Threshold a grayscale image to black and white against the mean brightness of
+    the box around every pixel, as a box blur finds in time independent of its size.
+    """
+    from PIL import ImageChops, ImageFilter
+
+    radius = max(1, round(gray.width * THRESHOLD_WINDOW / 2))
+    background = gray.filter(ImageFilter.BoxBlur(radius))
+    ink = ImageChops.lighter(
+        ImageChops.subtract(background, gray).point(
+            lambda v: 255 if v > THRESHOLD_OFFSET else 0
+        ),
+        gray.point(lambda v: 255 if v < DARK_LEVEL else 0),
+    )
+    return ink.point(lambda v: 0 if v else 255, "1")
 
 
-def add_text_to_image(image_file: Path, text: str):
-    image = Image.open(image_file)
-    draw = ImageDraw.Draw(image)
-    font = ImageFont.load_default(20)
-    text_color = (255, 255, 255)
-    x = image.width / 3
-    y = 80
-    position = (x / 3, y)
-    left, top, right, bottom = draw.textbbox(position, text, font=font)
-    draw.rectangle((left - 5, top - 5, right + 5, bottom + 5), fill="black")
-    draw.text(position, text, font=font, fill=text_color)
-    format_ = None
-    match image_file.suffix:
-        case ".jpg" | ".jpeg":
-            format_ = "JPEG"
-        case ".png":
-            format_ = "PNG"
-        case ".tiff":
-            format_ = "TIFF"
-        case _:
-            assert "No valid image format found. Please provide a valid image format."
-    image.save(image_file, format=format_)
-
-
-def resize_image(image: Image, size: tuple[int, int]) -> Image:
+def resize_image(
+    image: Image, size: tuple[int, int], quality: Quality = "best"
+) -> Image:
+    """Resize an image to the width of size, keeping its aspect ratio."""
     width = size[0]
     width_percent = width / float(image.size[0])
     logger.info(
         f"Resizing image to {width}x{int(width_percent * float(image.size[1]))}"
     )
     hsize = int((float(image.size[1]) * float(width_percent)))
-    img = image.resize((width, hsize), resample=Image.Resampling.BILINEAR)
+    method, reducing_gap = RESAMPLING[quality]
+    image.draft(None, (width, hsize))  # Decode JPEG at a reduced DCT scale if unloaded.
+    img = image.resize((width, hsize), resample=method, reducing_gap=reducing_gap)
     return img
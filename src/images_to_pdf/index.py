@@ -0,0 +1,155 @@
+import functools
+import importlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterable
+
+from PIL import Image
+from images_to_pdf import logger
+from images_to_pdf.discover import IMAGE_FORMATS
+
+INDEX_VERSION = 1
+SCAN_THREADS = 16  # Reading headers is I/O bound, notably on network storage.
+EXIF_ORIENTATION = 0x0112
+MAX_INDEXED_IMAGES = 100_000  # Entries a process keeps, the oldest dropped first.
+
+
+@dataclass(frozen=True, slots=True)
+class ImageInfo:
+    """Image metadata read from the file system and the image header only."""
+
+    path: Path
+    width: int
+    height: int
+    orientation: int
+    mode: str
+    file_size: int
+    mtime_ns: int
+
+
+# Index of images seen by this process, by path, mtime and size, so that an image
+# changed since is read again, as by a long-lived job server.
+images: dict[tuple[Path, int, int], ImageInfo] = {}
+images_lock = threading.Lock()
+
+
+@functools.cache
+def register_plugins():
+    """
+    Import the Pillow plugins of the image formats found, Pillow otherwise importing
+    its dozens of plugins to open an image not matching the few it loads first.
+    """
+    for image_format in IMAGE_FORMATS:
+        importlib.import_module(f"PIL.{image_format.title()}ImagePlugin")
+
+
+def open_image(source: Path | BinaryIO) -> Image.Image:
+    """Open an image file or data as one of the image formats found, lazily."""
+    register_plugins()
+    return Image.open(source, formats=IMAGE_FORMATS)
+
+
+def exif_orientation(img: Image.Image) -> int:
+    """Return the EXIF orientation of an opened image, without decoding it."""
+    if img.format == "PNG" and "exif" not in img.info:
+        return 1  # Pillow would decode the image to look for EXIF data after it.
+    return img.getexif().get(EXIF_ORIENTATION, 1)
+
+
+def read_image_info(path: Path) -> ImageInfo:
+    """Read the metadata of an image without decoding any pixel data."""
+    stat = path.stat()
+    with open_image(path) as img:
+        return ImageInfo(
+            path=path,
+            width=img.width,
+            height=img.height,
+            orientation=exif_orientation(img),
+            mode=img.mode,
+            file_size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+        )
+
+
+def index_key(path: Path, stat: os.stat_result) -> tuple[Path, int, int]:
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def remember(info: ImageInfo):
+    """Add an image to the index, dropping the oldest entries beyond its cap."""
+    with images_lock:
+        images[(info.path, info.mtime_ns, info.file_size)] = info
+        while len(images) > MAX_INDEXED_IMAGES:
+            del images[next(iter(images))]
+
+
+def lookup(path: Path) -> ImageInfo:
+    """
+    Return the metadata of an image from the index, reading it if not yet indexed
+    or changed since.
+    """
+    if (info := images.get(index_key(path, path.stat()))) is None:
+        info = read_image_info(path)
+        remember(info)
+    return info
+
+
+def index_file_for(image_path: Path) -> Path:
+    """Return the path of the index file saved next to an image directory."""
+    return image_path.with_name(f"{image_path.name}.images_to_pdf_index.json")
+
+
+def load_index_file(index_file: Path) -> dict[Path, ImageInfo]:
+    try:
+        data = json.loads(index_file.read_text())
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != INDEX_VERSION:
+        return {}
+    return {
+        Path(entry["path"]): ImageInfo(**entry | {"path": Path(entry["path"])})
+        for entry in data["images"]
+    }
+
+
+def save_index_file(index_file: Path, infos: Iterable[ImageInfo]):
+    data = {
+        "version": INDEX_VERSION,
+        "images": [asdict(info) | {"path": info.path.as_posix()} for info in infos],
+    }
+    index_file.write_text(json.dumps(data))
+    logger.info(f"Saved image index to {index_file.as_posix()}")
+
+
+def build_index(
+    paths: Iterable[Path], index_file: Path | None = None
+) -> dict[Path, ImageInfo]:
+    """
+    Build the metadata index of images in one parallel pass over their headers.
+
+    Entries whose size and mtime are unchanged are reused without opening the image,
+    from the index of this process, as kept by a long-lived job server, and from the
+    index_file if given, which the updated index is saved back to.
+    """
+    saved = load_index_file(index_file) if index_file else {}
+
+    def read_or_reuse(path: Path) -> ImageInfo:
+        key = index_key(path, path.stat())
+        if (info := images.get(key)) is not None:
+            return info
+        if (info := saved.get(path)) is not None:
+            if (info.path, info.mtime_ns, info.file_size) == key:
+                return info
+        return read_image_info(path)
+
+    with ThreadPoolExecutor(max_workers=SCAN_THREADS) as executor:
+        infos = list(executor.map(read_or_reuse, paths))
+    for info in infos:
+        remember(info)
+    if index_file:
+        save_index_file(index_file, infos)
+    return {info.path: info for info in infos}
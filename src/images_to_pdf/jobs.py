@@ -0,0 +1,302 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Literal
+
+from images_to_pdf import logger, tracing
+
+MAX_JOBS = 2  # Jobs run at the same time, later ones wait in the queue.
+MAX_FINISHED_JOBS = 1000  # Finished jobs kept for their status to be looked up.
+CANCEL_TIMEOUT = 10  # Seconds a cancelled job may take to stop before it is killed.
+POLL_INTERVAL = 0.2
+
+JobState = Literal["queued", "running", "done", "failed", "cancelled"]
+
+
+class Cancelled(Exception):
+    """Raised within a job when it is cancelled."""
+
+
+def serve_jobs(inbox: multiprocessing.Queue, messages: multiprocessing.Queue, cancel):
+    """
+    Run create_pdf for every job parameters taken from the inbox of a worker process,
+    sending its progress, stage events and log messages to the parent process. Setting
+    cancel raises Cancelled from the next progress update or stage event.
+
+    The process serves jobs until its parent exits, keeping imported modules, the
+    image index and the tile cache warm between jobs.
+    """
+    from images_to_pdf.cli import create_pdf
+
+    def check_cancelled():
+        if cancel.is_set():
+            raise Cancelled
+
+    def send_progress(outer: float, inner: float):
+        messages.put(("progress", outer, inner))
+        check_cancelled()
+
+    def send_event(event: dict):
+        if event["category"] != "image":  # Pages, PDFs and whole run stages only.
+            messages.put(("event", event))
+        check_cancelled()
+
+    logger.forward = lambda level, message: messages.put(("log", level, message))
+    parent = multiprocessing.parent_process()
+    while parent.is_alive():
+        try:
+            parameters = inbox.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+        except KeyboardInterrupt:
+            return
+        if parameters is None:
+            return
+        try:
+            create_pdf(**parameters, progress_func=send_progress, event_func=send_event)
+        except Cancelled:
+            messages.put(("cancelled",))
+        except Exception as e:
+            messages.put(("failed", f"{type(e).__name__}: {e}"))
+        else:
+            messages.put(("done",))
+        finally:
+            tracing.configure(False)  # Not to keep spans of a job failed midway.
+
+
+class Job:
+    """
+    A create_pdf run by a worker process, with its progress, throughput and log
+    messages kept for a user interface to poll from its own thread.
+    """
+
+    def __init__(self, number: int, parameters: dict, priority: int = 0):
+        self.number = number
+        self.parameters = parameters
+        self.priority = priority
+        self.state: JobState = "queued"
+        self.error: str | None = None
+        self.lock = threading.Lock()
+        self.logs: list[tuple[str, str]] = []
+        self.started = None
+        self.finished = None
+        self.cancelled = None
+        self.stage = ""
+        self.images = 0
+        self.pages = 0
+        self.outer = self.inner = 0.0
+        self.outer_done = 0.0  # Outer progress when the last PDF was completed.
+
+    def cancel(self):
+        """Cancel the job, at once if still queued."""
+        with self.lock:
+            if self.cancelled is None:
+                self.cancelled = time.monotonic()
+            if self.state == "queued":
+                self.finish("cancelled")
+
+    def start(self) -> bool:
+        """Mark the job as running, unless cancelled while waiting."""
+        with self.lock:
+            if self.state != "queued":
+                return False
+            self.state = "running"
+            self.started = time.monotonic()
+            return True
+
+    def finish(self, state: JobState, error: str | None = None):
+        self.state = state
+        self.error = error
+        self.finished = time.monotonic()
+
+    def handle(self, message: tuple):
+        match message:
+            case ("progress", outer, inner):
+                self.outer, self.inner = outer, inner
+                if inner == 1.0:
+                    self.outer_done = outer
+            case ("event", event):
+                self.stage = f"{event['category']}/{event['name']}"
+                if event["name"] == "page":
+                    self.images += event["args"].get("images", 0)
+                elif event["name"] == "embed":
+                    self.pages += 1
+                    if self.parameters.get("layout") == "document":
+                        self.images += 1
+            case ("log", level, text):
+                with self.lock:
+                    self.logs.append((level, text))
+            case ("done",):
+                self.finish("done")
+            case ("cancelled",):
+                self.finish("cancelled")
+            case ("failed", error):
+                self.finish("failed", error)
+
+    def take_logs(self) -> list[tuple[str, str]]:
+        """Return and forget the log messages of the job so far."""
+        with self.lock:
+            logs, self.logs = self.logs, []
+        return logs
+
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def progress(self) -> float:
+        """Return the share of the job done, from the progress of the current PDF."""
+        if self.state == "done":
+            return 1.0
+        return self.outer_done + (self.outer - self.outer_done) * self.inner
+
+    def images_per_second(self) -> float:
+        elapsed = self.elapsed()
+        return self.images / elapsed if elapsed else 0.0
+
+    def eta(self) -> float | None:
+        """Return the estimated seconds left, extrapolating the progress so far."""
+        progress = self.progress()
+        if self.state != "running" or not progress:
+            return None
+        return self.elapsed() * (1 - progress) / progress
+
+    def status(self) -> dict:
+        eta = self.eta()
+        return {
+            "id": self.number,
+            "state": self.state,
+            "priority": self.priority,
+            "error": self.error,
+            "stage": self.stage,
+            "images": self.images,
+            "pages": self.pages,
+            "progress": round(self.progress(), 3),
+            "images_per_s": round(self.images_per_second(), 2),
+            "elapsed_s": round(self.elapsed(), 1),
+            "eta_s": None if eta is None else round(eta, 1),
+            "output_pdf": str(self.parameters.get("output_pdf")),
+        }
+
+
+class Worker:
+    """
+    A long-lived process running one job at a time, started when first needed and
+    started anew if it died or had to be killed.
+    """
+
+    def __init__(self):
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+
+    def start(self):
+        self.inbox = self.context.Queue()
+        self.messages = self.context.Queue()
+        self.cancel = self.context.Event()
+        # Not a daemon, so that jobs can start processes rendering pages.
+        self.process = self.context.Process(
+            target=serve_jobs, args=(self.inbox, self.messages, self.cancel)
+        )
+        self.process.start()
+
+    def run(self, job: Job):
+        """Run a job, taking its messages until it ends."""
+        if not job.start():
+            return
+        if self.process is None or not self.process.is_alive():
+            self.start()
+        self.cancel.clear()
+        self.inbox.put(job.parameters)
+        while job.state == "running":
+            if job.cancelled:
+                self.cancel.set()
+                if time.monotonic() - job.cancelled > CANCEL_TIMEOUT:
+                    self.stop(kill=True)
+                    job.finish("cancelled")
+                    break
+            try:
+                job.handle(self.messages.get(timeout=POLL_INTERVAL))
+            except queue.Empty:
+                if not self.process.is_alive():
+                    job.finish(
+                        "failed",
+                        f"Job process exited with code {self.process.exitcode}",
+                    )
+
+    def stop(self, kill: bool = False):
+        if self.process is None:
+            return
+        if kill:
+            self.process.kill()
+        else:
+            self.inbox.put(None)
+        self.process.join()
+        self.process = None
+
+
+class JobQueue:
+    """
+    Queue of jobs run by a fixed pool of max_jobs worker processes, highest priority
+    first and in order of submission otherwise. The CPUs are shared between the
+    workers, so that one job can't take all of them.
+    """
+
+    def __init__(self, max_jobs: int = MAX_JOBS):
+        self.max_jobs = max_jobs
+        self.cpus_per_job = max(1, (os.cpu_count() or 1) // max_jobs)
+        self.waiting: queue.PriorityQueue[tuple[int, int, Job]] = queue.PriorityQueue()
+        self.jobs: dict[int, Job] = {}
+        self.numbers = itertools.count(1)
+        self.workers: list[Worker] = []
+        self.lock = threading.Lock()
+
+    def submit(self, parameters: dict, priority: int = 0) -> Job:
+        """Queue a job of create_pdf parameters, with its workers capped."""
+        workers = min(parameters.get("workers", 1), self.cpus_per_job)
+        with self.lock:
+            job = Job(next(self.numbers), {**parameters, "workers": workers}, priority)
+            self.jobs[job.number] = job
+            self.forget_finished()
+            if len(self.workers) < self.max_jobs:
+                worker = Worker()
+                self.workers.append(worker)
+                threading.Thread(
+                    target=self.run_jobs, args=(worker,), daemon=True
+                ).start()
+        self.waiting.put((-priority, job.number, job))
+        return job
+
+    def forget_finished(self):
+        finished = [number for number, job in self.jobs.items() if job.finished]
+        for number in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[number]
+
+    def position(self, job: Job) -> int:
+        """Return the number of jobs waiting to run before a queued job."""
+        with self.waiting.mutex:
+            return sum(
+                1
+                for priority, number, waiting in self.waiting.queue
+                if waiting.state == "queued"
+                and (priority, number) < (-job.priority, job.number)
+            )
+
+    def run_jobs(self, worker: Worker):
+        while True:
+            _, _, job = self.waiting.get()
+            try:
+                worker.run(job)
+            except Exception as e:
+                job.finish("failed", f"{type(e).__name__}: {e}")
+
+    def close(self):
+        """Stop the worker processes, waiting for the jobs they are running."""
+        with self.lock:
+            for worker in self.workers:
+                worker.stop()
+
+
+job_queue = JobQueue()  # Shared by the sessions of the GUI server.
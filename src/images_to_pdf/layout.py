@@ -0,0 +1,389 @@
+import json
+import math
+import random
+from itertools import accumulate
+from pathlib import Path
+from typing import Iterable, Literal
+
+from images_to_pdf import index, logger
+
+GOLDEN_RATIO = (1 + math.sqrt(5)) / 2
+MAX_ROW_IMAGES = 8  # Images a row may hold, unless the rows can't hold them all.
+PLAN_VERSION = 1
+
+Rect = tuple[int, int, int, int]  # x, y, width, height
+Box = tuple[float, float, float, float]  # left, top, right, bottom in source pixels
+
+
+class Tile:
+    """A source image cropped to a box and scaled into a rect of the page."""
+
+    __slots__ = ("source", "crop", "rect")
+
+    def __init__(self, source: Path, crop: Box, rect: Rect):
+        self.source = source
+        self.crop = crop
+        self.rect = rect
+
+    def __repr__(self):
+        return f"Tile({self.source!r}, crop={self.crop}, rect={self.rect})"
+
+
+class LayoutPlan:
+    """
+    The tiles of a page, planned from image dimensions only and rendered separately,
+    so plans of many pages are cheap to compute, check, save and render anywhere.
+    """
+
+    __slots__ = ("size", "tiles")
+
+    def __init__(self, size: tuple[int, int], tiles: list[Tile]):
+        self.size = size
+        self.tiles = tiles
+
+    def __repr__(self):
+        return f"LayoutPlan(size={self.size}, tiles={self.tiles})"
+
+    def to_dict(self) -> dict:
+        return {
+            "size": list(self.size),
+            "tiles": [
+                [tile.source.as_posix(), list(tile.crop), list(tile.rect)]
+                for tile in self.tiles
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LayoutPlan":
+        return cls(
+            tuple(data["size"]),
+            [
+                Tile(Path(source), tuple(crop), tuple(rect))
+                for source, crop, rect in data["tiles"]
+            ],
+        )
+
+
+def save_plans(plan_file: Path, plans: dict[int, list[LayoutPlan]]):
+    """Save the page plans of every PDF, by PDF number, as JSON."""
+    data = {
+        "version": PLAN_VERSION,
+        "pdfs": {
+            str(pdf_number): [plan.to_dict() for plan in pdf_plans]
+            for pdf_number, pdf_plans in plans.items()
+        },
+    }
+    plan_file.write_text(json.dumps(data))
+
+
+def load_plans(plan_file: Path) -> dict[int, list[LayoutPlan]]:
+    data = json.loads(plan_file.read_text())
+    if data.get("version") != PLAN_VERSION:
+        raise ValueError(f"Unsupported plan file version {data.get('version')}")
+    return {
+        int(pdf_number): list(map(LayoutPlan.from_dict, pdf_plans))
+        for pdf_number, pdf_plans in data["pdfs"].items()
+    }
+
+
+def fit_crop(image_size: tuple[int, int], size: tuple[int, int]) -> Box:
+    """Return the centered box of an image with the aspect of size, as ImageOps.fit."""
+    width, height = image_size
+    if width / height >= size[0] / size[1]:
+        crop_width, crop_height = size[0] / size[1] * height, height
+    else:
+        crop_width, crop_height = width, width / (size[0] / size[1])
+    left, top = (width - crop_width) / 2, (height - crop_height) / 2
+    return left, top, left + crop_width, top + crop_height
+
+
+def fit_tile(img_path: Path, rect: Rect) -> Tile:
+    """Plan an image to fill rect, cropped to its aspect."""
+    info = index.lookup(img_path)
+    return Tile(img_path, fit_crop((info.width, info.height), rect[2:]), rect)
+
+
+def partition_rows(aspect_ratios: list[float], rows: int) -> list[int]:
+    """
+    Split images in order into rows of as equal summed aspect ratios as possible, so
+    that rows filling the width get as equal heights as possible.
+
+    Linear partition by dynamic programming, minimizing the squared deviation of the
+    row sums from their mean, in O(n·k·m) for n images and k rows, a row holding at
+    most m = max(MAX_ROW_IMAGES, ⌈n/k⌉) images. That is O(n·k) while n ≤ k ·
+    MAX_ROW_IMAGES, and up to O(n²) when fewer rows must hold more images each.
+    Returns the number of images in each row.
+    """
+    n = len(aspect_ratios)
+    rows = max(1, min(rows, n))
+    prefix = [0.0, *accumulate(aspect_ratios)]
+    target = prefix[n] / rows
+    row_limit = max(MAX_ROW_IMAGES, math.ceil(n / rows))
+    # cost[r][j] is the least cost of the first j images in r rows.
+    cost = [[math.inf] * (n + 1) for _ in range(rows + 1)]
+    split = [[0] * (n + 1) for _ in range(rows + 1)]
+    cost[0][0] = 0.0
+    for r in range(1, rows + 1):
+        for j in range(r, n - (rows - r) + 1):
+            for i in range(max(r - 1, j - row_limit), j):
+                row_cost = cost[r - 1][i] + (prefix[j] - prefix[i] - target) ** 2
+                if row_cost < cost[r][j]:
+                    cost[r][j], split[r][j] = row_cost, i
+    lengths, j = [], n
+    for r in range(rows, 0, -1):
+        lengths.append(j - split[r][j])
+        j = split[r][j]
+    return lengths[::-1]
+
+
+def distribute(total: int, weights: Iterable[float]) -> list[int]:
+    """Split an integer total in proportion to weights, the parts summing to total."""
+    edges = [0.0, *accumulate(weights)]
+    return [
+        round(total * b / edges[-1]) - round(total * a / edges[-1])
+        for a, b in zip(edges, edges[1:])
+    ]
+
+
+def justified_rows(aspect_ratios: list[float], size: tuple[int, int]) -> list[Rect]:
+    """
+    Lay out images of the given aspect ratios (width / height) in rows filling the
+    whole canvas, each row as high as its images at their aspect ratios fill the
+    width, with rows scaled to fill the height.
+
+    The number of rows is chosen so the rows need as little scaling as possible,
+    which is how much images get cropped to fill their tiles. Returns the tile of
+    each image, in order.
+    """
+    if not aspect_ratios:
+        return []
+    width, height = size
+    # Rows of equal aspect sums S fill the canvas when k rows of W / S fill H.
+    ideal_rows = math.sqrt(height * sum(aspect_ratios) / width)
+    candidates = {math.floor(ideal_rows), math.ceil(ideal_rows)}
+    best = None
+    for rows in sorted(r for r in candidates if 1 <= r <= len(aspect_ratios)) or [1]:
+        lengths = partition_rows(aspect_ratios, rows)
+        starts = [0, *accumulate(lengths)]
+        row_sums = [sum(aspect_ratios[a:b]) for a, b in zip(starts, starts[1:])]
+        natural_height = sum(width / row_sum for row_sum in row_sums)
+        crop = abs(math.log(height / natural_height))
+        if best is None or crop < best[0]:
+            best = crop, starts, row_sums
+
+    _, starts, row_sums = best
+    tiles = []
+    y = 0
+    row_heights = distribute(height, (1 / row_sum for row_sum in row_sums))
+    for a, b, row_height in zip(starts, starts[1:], row_heights):
+        x = 0
+        for tile_width in distribute(width, aspect_ratios[a:b]):
+            tiles.append((x, y, tile_width, row_height))
+            x += tile_width
+        y += row_height
+    return tiles
+
+
+def plan_page(
+    images: list[Path],
+    collage_type: Literal["grid", "auto", "lane", "document"],
+    size: tuple[int, int],
+) -> LayoutPlan:
+    """Plan a collage page as create_collage_from_images lays it out."""
+    planners = {
+        "grid": plan_grid,
+        "auto": plan_auto,
+        "lane": plan_lane,
+        "document": plan_lane,
+    }
+    return planners[collage_type](
+        images=images, size=size, padding=0, randomization=False, centered=False
+    )
+
+
+def plan_golden_ratio(images, size, padding, randomization) -> LayoutPlan:
+    """Plan images splitting the remaining working area by the golden ratio."""
+    # Initialize the working area for placing images
+    working_area = {"x": 0, "y": 0, "width": size[0], "height": size[1]}
+
+    # Determine the initial layout orders
+    horizontal_order = "right-to-left"
+    vertical_order = "bottom-to-top"
+    if randomization:
+        horizontal_order = random.choice(["right-to-left", "left-to-right"])
+        vertical_order = random.choice(["bottom-to-top", "top-to-bottom"])
+        random.shuffle(images)
+
+    tiles = []
+    x, y = 0, 0  # Starting position
+    for placed, img_path in enumerate(images, start=1):
+        # Decide whether to split horizontally or vertically based on working area dimensions
+        if working_area["width"] > working_area["height"]:  # Horizontal split
+            width = int(working_area["width"] / GOLDEN_RATIO)
+            height = working_area["height"]
+            # Adjust position and update working area
+            if horizontal_order == "right-to-left":
+                horizontal_order = "left-to-right"
+                working_area["x"] += width + padding
+            else:
+                x = x + working_area["width"] - width
+                horizontal_order = "right-to-left"
+            working_area["width"] -= width + padding
+        else:  # Vertical split
+            width = working_area["width"]
+            height = int(working_area["height"] / GOLDEN_RATIO)
+            # Adjust position and update working area
+            if vertical_order == "bottom-to-top":
+                working_area["y"] += height + padding
+                vertical_order = "top-to-bottom"
+            else:
+                y = y + working_area["height"] - height
+                vertical_order = "bottom-to-top"
+            working_area["height"] -= height + padding
+
+        tiles.append(fit_tile(img_path, (x, y, width, height)))
+        x, y = (
+            working_area["x"],
+            working_area["y"],
+        )  # Update position for the next image
+
+        # Stop if the working area becomes too small, reporting the images left out
+        if working_area["width"] <= 0 or working_area["height"] <= 0:
+            if unplaced := images[placed:]:
+                logger.warning(
+                    f"Working area exhausted, {len(unplaced)} images not placed: "
+                    + ", ".join(img_path.as_posix() for img_path in unplaced)
+                )
+            break
+
+    return LayoutPlan(size, tiles)
+
+
+def plan_lane(
+    images, size, padding, randomization, centered, orientation="horizontal"
+) -> LayoutPlan:
+    """Plan images in full width (horizontal) or full height (vertical) lanes."""
+    canvas_width, canvas_height = size
+
+    images_num = len(images)
+
+    if randomization:
+        random.shuffle(images)
+
+    # Determine block size based on orientation
+    if orientation == "horizontal":
+        block_height = (canvas_height - (images_num + 1) * padding) // images_num
+        block_width = canvas_width
+    elif orientation == "vertical":
+        block_width = (canvas_width - (images_num + 1) * padding) // images_num
+        block_height = canvas_height
+    else:
+        raise ValueError("Orientation must be 'horizontal' or 'vertical'.")
+
+    # Centering offsets
+    offset_x, offset_y = 0, 0
+    if centered:
+        if (
+            orientation == "horizontal"
+            and images_num * (block_height + padding) < canvas_height
+        ):
+            offset_y = (canvas_height - (images_num * (block_height + padding))) // 2
+        if (
+            orientation == "vertical"
+            and images_num * (block_width + padding) < canvas_width
+        ):
+            offset_x = (canvas_width - (images_num * (block_width + padding))) // 2
+
+    tiles = []
+    for idx, img_path in enumerate(images):
+        # Calculate position
+        x, y = 0, 0
+        if orientation == "horizontal":
+            y = idx * (block_height + padding) + padding + offset_y
+        elif orientation == "vertical":
+            x = idx * (block_width + padding) + padding + offset_x
+        tiles.append(fit_tile(img_path, (x, y, block_width, block_height)))
+
+    return LayoutPlan(size, tiles)
+
+
+def plan_auto(images, size, padding, randomization, centered) -> LayoutPlan:
+    """Plan a grid if all images are square, and justified rows otherwise."""
+    infos = [index.lookup(img_path) for img_path in images]
+    if all(info.width == info.height for info in infos):
+        return plan_grid(images, size, padding, randomization, centered)
+    return plan_justified(images, size, padding, randomization)
+
+
+def plan_justified(images, size, padding, randomization) -> LayoutPlan:
+    """Plan images in justified rows filling the whole canvas, see justified_rows."""
+    if randomization:
+        random.shuffle(images)
+    aspect_ratios = [info.width / info.height for info in map(index.lookup, images)]
+    tiles = []
+    for img_path, (x, y, width, height) in zip(
+        images, justified_rows(aspect_ratios, size)
+    ):
+        rect = (
+            x + padding,
+            y + padding,
+            max(1, width - padding),
+            max(1, height - padding),
+        )
+        tiles.append(fit_tile(img_path, rect))
+    return LayoutPlan(size, tiles)
+
+
+def plan_grid(images, size, padding, randomization, centered) -> LayoutPlan:
+    """Plan images in a grid of equal cells, as square as the canvas allows."""
+    images_num = len(images)
+    if randomization:
+        random.shuffle(images)
+    canvas_width, canvas_height = size
+    rects = []
+    if canvas_width == canvas_height:
+        # Square canvas: Determine grid dimensions for a square layout
+        grid_size = math.ceil(math.sqrt(images_num))
+        cell_size = (canvas_width - (grid_size + 1) * padding) // grid_size
+
+        for idx in range(images_num):
+            # Calculate position in the grid
+            x = (idx % grid_size) * (cell_size + padding) + padding
+            y = (idx // grid_size) * (cell_size + padding) + padding
+            rects.append((x, y, cell_size, cell_size))
+
+    else:
+        # Non-square canvas: Determine grid dimensions for the closest layout
+        cols = math.ceil(math.sqrt(images_num))
+        rows = math.ceil(images_num / cols)
+        offset_x, offset_y = 0, 0
+
+        # Adjust grid dimensions and offsets based on canvas proportions
+        if canvas_width > canvas_height:
+            if cols < rows:
+                cols, rows = rows, cols
+            if centered:
+                offset_x = (canvas_width - (rows * (canvas_height // rows))) // 2
+        elif canvas_width < canvas_height:
+            if cols > rows:
+                cols, rows = rows, cols
+            if centered:
+                offset_y = (canvas_height - (cols * (canvas_width // cols))) // 2
+
+        # Calculate cell dimensions
+        cell_width = (canvas_width - (cols + 1) * padding) // cols
+        cell_height = (canvas_height - (rows + 1) * padding) // rows
+
+        # Use the smaller dimension if centering is enabled
+        if centered:
+            cell_width = cell_height = min(cell_width, cell_height)
+
+        for idx in range(images_num):
+            # Calculate position in the grid
+            x = (idx % cols) * (cell_width + padding) + padding + offset_x
+            y = (idx // cols) * (cell_height + padding) + padding + offset_y
+            rects.append((x, y, cell_width, cell_height))
+
+    return LayoutPlan(
+        size, [fit_tile(img_path, rect) for img_path, rect in zip(images, rects)]
+    )
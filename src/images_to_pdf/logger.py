@@ -1,19 +1,24 @@
 import datetime
 from functools import partial
+from typing import Callable
 
 from loguru import logger as cli_logger
-from pywebio_battery import logbox_append
 
 from . import runmode
-from pywebio.output import put_text
-import datetime
+
+forward: Callable[[str, str], None] | None = None  # Set in background job processes.
 
 
 def log(level: str, message: str):
+    if forward:
+        forward(level, message)
+        return
     match runmode.state:
         case "cli":
             cli_logger.log(level, message)
         case "gui":
+            from pywebio_battery import logbox_append  # Slow, needed by the GUI only.
+
             now = datetime.datetime.now().strftime("%H:%M:%S")
             logbox_append("log", f"{now} {level} {message}\n")
 
@@ -0,0 +1,228 @@
+import glob
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Iterable
+
+MANIFEST_VERSION = 1
+SHARD_PATTERN = re.compile(r"^(\d+)/(\d+)$")
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """Parse a shard specification 'i/N' into (i, N), with shards numbered from 1."""
+    match = SHARD_PATTERN.match(shard.strip())
+    if not match or not 1 <= int(match[1]) <= int(match[2]):
+        raise ValueError(f"Shard must be given as i/N with 1 <= i <= N, got {shard!r}")
+    return int(match[1]), int(match[2])
+
+
+def in_shard(pdf_number: int, shard_index: int, shard_count: int) -> bool:
+    """Return True if the PDF with the given number is rendered by the shard."""
+    return (pdf_number - 1) % shard_count == shard_index - 1
+
+
+def job_fingerprint(
+    image_path: Path, image_files: Iterable[Path], parameters: dict
+) -> str:
+    """
+    Hash the parameters and input images of a job, identical on every machine sharing
+    the images, as paths are taken relative to the image directory.
+    """
+    digest = hashlib.sha256(json.dumps(parameters, sort_keys=True).encode())
+    for image_file in image_files:
+        relative_path = image_file.relative_to(image_path).as_posix()
+        digest.update(f"{relative_path}|{image_file.stat().st_size}\n".encode())
+    return digest.hexdigest()
+
+
+def shard_manifest_path(output_pdf: Path, shard_index: int, shard_count: int) -> Path:
+    return output_pdf.with_name(
+        f"{output_pdf.stem}.shard-{shard_index}-of-{shard_count}.json"
+    )
+
+
+def merged_manifest_path(output_pdf: Path) -> Path:
+    return output_pdf.with_name(f"{output_pdf.stem}.manifest.json")
+
+
+def write_shard_manifest(
+    output_pdf: Path,
+    shard_index: int,
+    shard_count: int,
+    job: str,
+    total_pdfs: int,
+    pdf_files: dict[int, Path],
+) -> Path:
+    """Record the PDF files rendered by a shard, for the merge step to check."""
+    manifest_file = shard_manifest_path(output_pdf, shard_index, shard_count)
+    data = {
+        "version": MANIFEST_VERSION,
+        "shard": [shard_index, shard_count],
+        "job": job,
+        "total_pdfs": total_pdfs,
+        "pdfs": {
+            str(pdf_number): {"file": pdf_file.name, "size": pdf_file.stat().st_size}
+            for pdf_number, pdf_file in pdf_files.items()
+        },
+    }
+    manifest_file.write_text(json.dumps(data, indent=2))
+    return manifest_file
+
+
+def merge_shard_manifests(output_pdf: Path) -> tuple[Path, list[str]]:
+    """
+    Check the shard manifests of a job for completeness and combine them into one.
+
+    Returns the path of the merged manifest, written only if complete, and the list of
+    problems found.
+    """
+    manifest_files = sorted(
+        output_pdf.parent.glob(f"{glob.escape(output_pdf.stem)}.shard-*-of-*.json")
+    )
+    if not manifest_files:
+        return merged_manifest_path(output_pdf), [
+            f"No shard manifests found for {output_pdf.as_posix()}"
+        ]
+    manifests = [json.loads(f.read_text()) for f in manifest_files]
+    problems = []
+    for key in ("version", "job", "total_pdfs"):
+        if len({json.dumps(m[key]) for m in manifests}) > 1:
+            problems.append(f"Shard manifests disagree on {key}")
+    shard_counts = {m["shard"][1] for m in manifests}
+    if len(shard_counts) > 1:
+        problems.append(f"Shard manifests of different shard counts {shard_counts}")
+    shard_count = max(shard_counts)
+    missing_shards = set(range(1, shard_count + 1)) - {m["shard"][0] for m in manifests}
+    if missing_shards:
+        problems.append(f"Missing shards {sorted(missing_shards)} of {shard_count}")
+
+    pdfs = {}
+    for manifest in manifests:
+        pdfs.update(manifest["pdfs"])
+    total_pdfs = manifests[0]["total_pdfs"]
+    missing_pdfs = set(range(1, total_pdfs + 1)) - set(map(int, pdfs))
+    if missing_pdfs:
+        problems.append(f"Missing PDFs {sorted(missing_pdfs)} of {total_pdfs}")
+    for pdf in pdfs.values():
+        pdf_file = output_pdf.parent / pdf["file"]
+        if not pdf_file.is_file() or pdf_file.stat().st_size != pdf["size"]:
+            problems.append(f"PDF {pdf_file.as_posix()} is missing or changed")
+
+    merged_file = merged_manifest_path(output_pdf)
+    if not problems:
+        data = {
+            "version": MANIFEST_VERSION,
+            "job": manifests[0]["job"],
+            "total_pdfs": total_pdfs,
+            "pdfs": dict(sorted(pdfs.items(), key=lambda item: int(item[0]))),
+        }
+        merged_file.write_text(json.dumps(data, indent=2))
+    return merged_file, problems
+
+
+def build_manifest_path(output_pdf: Path, shard: str | None = None) -> Path:
+    if shard:
+        shard_index, shard_count = parse_shard(shard)
+        return output_pdf.with_name(
+            f"{output_pdf.stem}.shard-{shard_index}-of-{shard_count}.build.json"
+        )
+    return output_pdf.with_name(f"{output_pdf.stem}.build.json")
+
+
+class BuildManifest:
+    """
+    Record of the inputs, parameters and pages every output PDF was built from.
+
+    It is saved after each PDF is written, so a re-run skips PDFs which are still up
+    to date, and an interrupted run resumes after the last PDF it completed.
+    """
+
+    def __init__(self, manifest_file: Path, parameters: dict):
+        self.manifest_file = manifest_file
+        self.parameters = hashlib.sha256(
+            json.dumps(parameters, sort_keys=True).encode()
+        ).hexdigest()
+        self.pdfs = {}
+        try:
+            data = json.loads(manifest_file.read_text())
+        except (OSError, ValueError):
+            return
+        if data.get("version") == MANIFEST_VERSION:
+            self.pdfs = data["pdfs"]
+
+    @staticmethod
+    def input_signature(image_path: Path, image_files: Iterable[Path]) -> list:
+        signature = []
+        for image_file in image_files:
+            stat = image_file.stat()
+            signature.append(
+                [
+                    image_file.relative_to(image_path).as_posix(),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                ]
+            )
+        return signature
+
+    def is_up_to_date(self, pdf_number: int, inputs: list, pdf_file: Path) -> bool:
+        """Return True if the PDF was built from the same inputs and parameters."""
+        pdf = self.pdfs.get(str(pdf_number))
+        return (
+            pdf is not None
+            and pdf["parameters"] == self.parameters
+            and pdf["inputs"] == inputs
+            and pdf["file"] == pdf_file.name
+            and pdf_file.is_file()
+            and pdf_file.stat().st_size == pdf["size"]
+        )
+
+    def record(
+        self,
+        pdf_number: int,
+        inputs: list,
+        pages: Iterable[Iterable[Path]],
+        pdf_file: Path,
+        image_path: Path,
+    ):
+        """Record a written PDF and save the manifest."""
+        self.pdfs[str(pdf_number)] = {
+            "parameters": self.parameters,
+            "inputs": inputs,
+            "pages": [
+                [image.relative_to(image_path).as_posix() for image in page]
+                for page in pages
+            ],
+            "file": pdf_file.name,
+            "size": pdf_file.stat().st_size,
+        }
+        self.save()
+
+    def remove_stale(self, pdf_files: dict[int, Path], output_dir: Path) -> list[Path]:
+        """
+        Forget the PDFs recorded but no longer written, as when added images split
+        the output into more PDFs, numbered differently, and delete their files from
+        output_dir unless changed since. Returns the stale files, those still
+        existing being the changed ones kept.
+        """
+        current = {str(number): pdf_file.name for number, pdf_file in pdf_files.items()}
+        stale_files = []
+        for number, pdf in list(self.pdfs.items()):
+            if current.get(number) == pdf["file"]:
+                continue
+            del self.pdfs[number]
+            stale_file = output_dir / pdf["file"]
+            if pdf["file"] in current.values() or not stale_file.is_file():
+                continue  # Written again under another number, or already gone.
+            if stale_file.stat().st_size == pdf["size"]:
+                stale_file.unlink()
+            stale_files.append(stale_file)
+        self.save()
+        return stale_files
+
+    def save(self):
+        data = {"version": MANIFEST_VERSION, "pdfs": self.pdfs}
+        temporary_file = self.manifest_file.with_suffix(".tmp")
+        temporary_file.write_text(json.dumps(data))
+        os.replace(temporary_file, self.manifest_file)
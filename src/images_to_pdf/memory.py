@@ -0,0 +1,245 @@
+import math
+import multiprocessing
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+import PIL
+from PIL import Image, ImageFile
+
+# Decoded size of the largest image Pillow opens by default, at 4 bytes per pixel,
+# larger ones being refused as decompression bombs.
+DEFAULT_MAX_DECODE_BYTES = 2 * (Image.MAX_IMAGE_PIXELS or 89_478_485) * 4
+STRIP_BYTES = 16 * 1024 * 1024  # Decoded size of each strip of an uncompressed image.
+# Bits per pixel of the raw modes of uncompressed images, to find their row stride.
+RAW_BITS = {
+    "L": 8,
+    "LA": 16,
+    "I;16": 16,
+    "I;16B": 16,
+    "RGB": 24,
+    "BGR": 24,
+    "RGBA": 32,
+    "RGBX": 32,
+    "BGRA": 32,
+    "BGRX": 32,
+    "CMYK": 32,
+}
+PILLOW_VERSION = tuple(int(part) for part in PIL.__version__.split(".")[:2])
+# Pillow releases decoding strips of rows is known to work with, as it relies on
+# internals of Image and ImageFile, other releases decoding images whole.
+STRIP_PILLOW_VERSIONS = ((11, 0), (13, 0))
+
+
+class ImageTooLarge(Exception):
+    """Raised for an image which can't be decoded within the memory limit."""
+
+
+class MemoryBudget:
+    """
+    Bytes in use, reserving beyond max_bytes blocks until enough is released. A
+    single reservation larger than max_bytes is let through when nothing else is in
+    use, so it can't block forever.
+
+    The budget is shared by the threads of a process, and by the processes it is
+    passed to when they are started, such as the workers of a process pool.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = multiprocessing.RawValue("q", 0)
+        self.condition = multiprocessing.Condition()
+
+    def acquire(self, size: int, stop: threading.Event | None = None) -> bool:
+        """Reserve size bytes, returning False if stopped while waiting."""
+        with self.condition:
+            while stop is None or not stop.is_set():
+                if self.used.value == 0 or self.used.value + size <= self.max_bytes:
+                    self.used.value += size
+                    return True
+                self.condition.wait(timeout=0.1)
+            return False
+
+    def release(self, size: int):
+        with self.condition:
+            self.used.value -= size
+            self.condition.notify_all()
+
+
+decode_budget: MemoryBudget | None = None  # Bytes of images being decoded.
+max_decode_bytes = DEFAULT_MAX_DECODE_BYTES
+
+
+def configure(
+    max_megabytes: int | None = None, budget: MemoryBudget | None = None
+) -> MemoryBudget | None:
+    """
+    Cap the bytes of images decoded at once by this process to max_megabytes, or
+    share the budget of the process starting it if given, and return the budget.
+    The budget is kept if already capped to max_megabytes, so that later runs in the
+    process share it with the processes started before.
+
+    Pillow's check for decompression bombs, which aborts on opening any image above
+    its pixel limit, is replaced by refusing to decode images needing more than the
+    cap, or than Pillow's limit if there is no cap, once reduced to the size needed.
+    """
+    global decode_budget, max_decode_bytes
+    Image.MAX_IMAGE_PIXELS = None
+    if budget is None and max_megabytes:
+        max_bytes = max_megabytes * 1024 * 1024
+        budget = decode_budget
+        if budget is None or budget.max_bytes != max_bytes:
+            budget = MemoryBudget(max_bytes)
+    decode_budget = budget
+    max_decode_bytes = budget.max_bytes if budget else DEFAULT_MAX_DECODE_BYTES
+    return decode_budget
+
+
+@contextmanager
+def reserve(size: int, description: str) -> Iterator[None]:
+    """
+    Hold size bytes of the decode budget, waiting for other images to be decoded
+    first if needed. Raises ImageTooLarge if size is beyond what can be decoded.
+    """
+    if size > max_decode_bytes:
+        raise ImageTooLarge(
+            f"Decoding {description} needs {size / 1024 / 1024:.0f} MB, over the "
+            f"limit of {max_decode_bytes / 1024 / 1024:.0f} MB"
+        )
+    if decode_budget is None:
+        yield
+        return
+    decode_budget.acquire(size)
+    try:
+        yield
+    finally:
+        decode_budget.release(size)
+
+
+def pixel_bytes(mode: str) -> int:
+    """Return the bytes Pillow stores a pixel of the mode in."""
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    return 4
+
+
+def raw_layout(tile: tuple) -> tuple[int, int] | None:
+    """Return the row stride and orientation of an uncompressed tile, or None."""
+    codec, (left, _, right, _), _, args = tile
+    if codec != "raw":
+        return None
+    if isinstance(args, str):
+        args = (args,)
+    rawmode, stride, orientation = (*args, 0, 1)[:3]
+    if not stride:
+        if rawmode not in RAW_BITS:
+            return None
+        stride = ((right - left) * RAW_BITS[rawmode] + 7) // 8
+    return stride, orientation
+
+
+def can_load_rows() -> bool:
+    """Return True if load_rows works with the Pillow release installed."""
+    first, last = STRIP_PILLOW_VERSIONS
+    return (
+        first <= PILLOW_VERSION < last
+        and hasattr(ImageFile, "_Tile")
+        and hasattr(Image.core, "new")
+    )
+
+
+def can_decode_in_strips(img: Image.Image) -> bool:
+    """Return True if an opened image is uncompressed, and can be reduced by strips."""
+    return (
+        can_load_rows()
+        and bool(img.tile)
+        and img.mode not in ("1", "P")
+        and all(raw_layout(tile) for tile in img.tile)
+    )
+
+
+def strip_rows(width: int, mode: str, factor: int) -> int:
+    """Return the rows of each strip, a multiple of factor so strips reduce evenly."""
+    rows = STRIP_BYTES // (width * pixel_bytes(mode))
+    return max(factor, rows // factor * factor)
+
+
+def decode_bytes(img: Image.Image, factor: int, strips: bool) -> int:
+    """
+    Return the bytes held at once decoding an opened image, reduced by factor, by
+    strips of rows if set.
+    """
+    per_pixel = pixel_bytes(img.mode)
+    decoded_rows = img.height
+    if strips:
+        decoded_rows = min(img.height, strip_rows(img.width, img.mode, factor))
+    reduced = 0
+    if factor > 1:
+        reduced = math.ceil(img.width / factor) * math.ceil(img.height / factor)
+    return (img.width * decoded_rows + reduced) * per_pixel
+
+
+def strip_tiles(tiles: list[tuple], top: int, bottom: int) -> list[tuple]:
+    """Return the parts of uncompressed tiles with rows top to bottom, from row 0."""
+    strip = []
+    for tile in tiles:
+        codec, (left, tile_top, right, tile_bottom), offset, args = tile
+        first, last = max(top, tile_top), min(bottom, tile_bottom)
+        if first >= last:
+            continue
+        stride, orientation = raw_layout(tile)
+        # Rows of bottom-up tiles, as of BMP files, are stored from the last one.
+        skipped = tile_bottom - last if orientation < 0 else first - tile_top
+        strip.append(
+            ImageFile._Tile(
+                codec,
+                (left, first - top, right, last - top),
+                offset + skipped * stride,
+                args,
+            )
+        )
+    return strip
+
+
+def load_rows(img: Image.Image, tiles: list[tuple], top: int, bottom: int, into):
+    """
+    Decode only rows top to bottom of an opened uncompressed image, given the tiles
+    of the whole image, into the memory of into, a core image of their size.
+
+    Pillow has no API to decode part of an image, so the size, tiles and memory of
+    img are set instead, internals checked by can_load_rows.
+    """
+    img._size = (img.width, bottom - top)
+    img.im = into
+    img.tile = strip_tiles(tiles, top, bottom)
+    img.load()
+
+
+def reduce_in_strips(open_image: Callable[[], Image.Image], factor: int) -> Image.Image:
+    """
+    Decode an uncompressed image a strip of rows at a time, box-reducing every strip
+    by factor, so that the whole image is never held decoded. Returns the same image
+    as reducing the whole decoded image would, which it does instead with Pillow
+    releases load_rows doesn't work with.
+    """
+    if not can_load_rows():
+        with open_image() as img:
+            img.load()
+            return img.reduce(factor)
+    with open_image() as img:
+        width, height, mode, tiles = img.width, img.height, img.mode, list(img.tile)
+    reduced = Image.new(mode, (math.ceil(width / factor), math.ceil(height / factor)))
+    rows = strip_rows(width, mode, factor)
+    strip = None
+    for top in range(0, height, rows):
+        bottom = min(top + rows, height)
+        with open_image() as img:
+            # Into the same memory for every strip, as allocating it is slow in
+            # threads other than the main one.
+            if strip is None or strip.size != (width, bottom - top):
+                strip = Image.core.new(mode, (width, bottom - top))
+            load_rows(img, tiles, top, bottom, strip)
+            reduced.paste(img.reduce(factor), (0, top // factor))
+    return reduced
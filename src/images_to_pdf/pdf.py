@@ -1,29 +1,231 @@
+import io
 from pathlib import Path
-from typing import Literal
-from fpdf import FPDF
+from typing import BinaryIO, Iterable, Literal
 from PIL import Image
-from loguru import logger
 
-from images_to_pdf.image import resize_image
+from images_to_pdf import index, logger, sizing, tracing
+from images_to_pdf.image import (
+    RESAMPLING,
+    ColorMode,
+    ImageFormat,
+    JpegSettings,
+    Quality,
+    add_text_to_image,
+    convert_color_mode,
+    decoded_image_for_size,
+    encode_image,
+    resize_image,
+)
+from images_to_pdf.memory import ImageTooLarge
+from images_to_pdf.pdfstream import StreamingPdfWriter
+from images_to_pdf.text import filename_to_annotation
+
+
+def can_embed_jpeg(
+    img: Image.Image,
+    shrink_to_resolution: None | tuple[int, int],
+    keep_original_resolution: bool,
+    color_mode: ColorMode = "rgb",
+) -> bool:
+    """Return True if the JPEG stream of an opened image can be embedded as-is."""
+    if img.format != "JPEG" or img.mode not in ("RGB", "L", "CMYK"):
+        return False
+    if color_mode != "rgb" and (color_mode == "bilevel" or img.mode != "L"):
+        return False
+    return (
+        keep_original_resolution
+        or not shrink_to_resolution
+        or img.width <= shrink_to_resolution[0]
+    )
 
 
 def create_pdf_from_images(
-    images: list[Path],
+    images: Iterable[Path | bytes],
     output_pdf_path: Path,
     page_format: Literal["a4"],
     orientation: Literal["portrait", "landscape"] = "landscape",
     shrink_to_resolution: None | tuple[int, int] = None,
+    keep_original_resolution: bool = False,
+    annotate: bool = False,
+    quality: Quality = "best",
+    jpeg: JpegSettings | None = None,
+    color_mode: ColorMode = "rgb",
+    composed: sizing.ComposedPages | None = None,
 ):
+    """
+    Create a PDF with one page per image.
+
+    Images are either paths to image files, or already encoded JPEG bytes (as rendered
+    collage pages) which are embedded as-is without being decoded or re-encoded.
+    Image files are shrunk to the width of shrink_to_resolution unless
+    keep_original_resolution is set, JPEG files not needing to be shrunk are
+    embedded as-is as well, unless they are to be annotated with their filename.
+    Shrinking resamples as the quality sets. With jpeg settings, image files are
+    all decoded and encoded as JPEG with these, to control the size of the PDF.
+    Image files are converted to the color mode, to grayscale embedded with Flate
+    compression, or to black and white embedded with CCITT Group 4 compression, as
+    is best for scanned text, whatever the jpeg settings. Image files too large to
+    decode within the memory limit are skipped. Image files are saved to composed
+    once processed, if given, and taken from it instead if saved before, to encode
+    them again with other jpeg settings.
+    """
+    from fpdf import FPDF
+
     pdf = FPDF(orientation=orientation, format=page_format)
-    for image in images:
-        pdf.add_page()
-        img = Image.open(image.as_posix())
-        # img = add_text_to_image(img, 'FOO\nBAR')
-        if shrink_to_resolution:
-            img = resize_image(img, shrink_to_resolution)
-            pdf.image(img, x=0, y=0, w=210, type="", link="")
-        else:
-            pdf.image(img, x=0, y=0, w=300, type="", link="")
-
-    pdf.output(output_pdf_path.as_posix())
+    for page_index, image in enumerate(images):
+        with tracing.span("embed", "pdf") as args:
+            try:
+                page_image = prepare_page_image(
+                    image,
+                    shrink_to_resolution,
+                    keep_original_resolution,
+                    annotate,
+                    args,
+                    quality,
+                    jpeg,
+                    color_mode,
+                    composed.file(page_index) if composed else None,
+                )
+            except ImageTooLarge as e:
+                logger.warning(f"Skipping page of {image.as_posix()}: {e}")
+                continue
+            pdf.add_page()
+            if isinstance(page_image, bytes):
+                page_image = io.BytesIO(page_image)
+            pdf.image(page_image, x=0, y=0, w=page_width(image, shrink_to_resolution))
+
+    with tracing.span("output", "pdf") as args:
+        pdf.output(output_pdf_path.as_posix())
+        args["bytes_written"] = output_pdf_path.stat().st_size
     logger.info(f"Created PDF at {output_pdf_path.as_posix()}")
+
+
+def stream_pdf_from_images(
+    images: Iterable[Path | bytes],
+    output: BinaryIO,
+    page_format: Literal["a4"],
+    orientation: Literal["portrait", "landscape"] = "landscape",
+    shrink_to_resolution: None | tuple[int, int] = None,
+    keep_original_resolution: bool = False,
+    annotate: bool = False,
+    quality: Quality = "best",
+    jpeg: JpegSettings | None = None,
+    color_mode: ColorMode = "rgb",
+    composed: sizing.ComposedPages | None = None,
+):
+    """
+    Create a PDF like create_pdf_from_images, but writing every page to the output
+    as soon as it is produced, so memory use does not grow with the number of pages.
+    """
+    writer = StreamingPdfWriter(output, page_format, orientation)
+    for page_index, image in enumerate(images):
+        with tracing.span("embed", "pdf") as args:
+            try:
+                page_image = prepare_page_image(
+                    image,
+                    shrink_to_resolution,
+                    keep_original_resolution,
+                    annotate,
+                    args,
+                    quality,
+                    jpeg,
+                    color_mode,
+                    composed.file(page_index) if composed else None,
+                )
+            except ImageTooLarge as e:
+                logger.warning(f"Skipping page of {image.as_posix()}: {e}")
+                continue
+            writer.add_image_page(page_image, page_width(image, shrink_to_resolution))
+    with tracing.span("output", "pdf") as args:
+        writer.close()
+        args["bytes_written"] = writer.position
+    logger.info(f"Streamed PDF of {len(writer.page_numbers)} pages")
+
+
+def page_width(image: Path | bytes, shrink_to_resolution: None | tuple[int, int]):
+    """Return the width in mm to place an image on its page with."""
+    return 210 if shrink_to_resolution and not isinstance(image, bytes) else 300
+
+
+def prepare_page_image(
+    image: Path | bytes,
+    shrink_to_resolution: None | tuple[int, int],
+    keep_original_resolution: bool,
+    annotate: bool,
+    trace_args: dict,
+    quality: Quality = "best",
+    jpeg: JpegSettings | None = None,
+    color_mode: ColorMode = "rgb",
+    composed_file: Path | None = None,
+) -> Path | bytes | Image.Image:
+    """
+    Return the image to place on a page, either JPEG bytes or a JPEG file to embed
+    as-is, or a decoded image. Image files are converted to the color mode, and
+    encoded as JPEG bytes if jpeg settings are given unless black and white. Bytes
+    read are recorded in trace_args. Image files are processed once only if a
+    composed_file is given, saved to it to be loaded from it afterwards.
+    """
+    if isinstance(image, bytes):
+        trace_args["bytes_read"] = len(image)
+        return image
+    trace_args["bytes_read"] = image.stat().st_size
+    if jpeg is None and not annotate:
+        with index.open_image(image) as img:
+            passthrough = can_embed_jpeg(
+                img, shrink_to_resolution, keep_original_resolution, color_mode
+            )
+        if passthrough:
+            logger.info(f"Embedding {image.name} without re-encoding")
+            trace_args["passthrough"] = True
+            return image
+    img = sizing.load_composed(composed_file)
+    if img is None:
+        img = process_page_image(
+            image,
+            shrink_to_resolution,
+            keep_original_resolution,
+            annotate,
+            quality,
+            color_mode,
+        )
+        sizing.save_composed(img, composed_file)
+    if jpeg is not None and img.mode != "1":  # Group 4 beats JPEG for black and white.
+        return encode_image(img, ImageFormat.JPG, jpeg)
+    return img
+
+
+def process_page_image(
+    image: Path,
+    shrink_to_resolution: None | tuple[int, int],
+    keep_original_resolution: bool,
+    annotate: bool,
+    quality: Quality = "best",
+    color_mode: ColorMode = "rgb",
+) -> Image.Image:
+    """
+    Decode, shrink, annotate and convert to the color mode an image file as its page
+    shows it, decoding no more pixels than needed if shrinking, and no colors if
+    not needed. Images narrower than shrink_to_resolution are kept at their size,
+    as the page scales them. Raises ImageTooLarge if the image can't be decoded
+    within the memory limit.
+    """
+    info = index.lookup(image)
+    shrink = (
+        shrink_to_resolution
+        and not keep_original_resolution
+        and info.width > shrink_to_resolution[0]
+    )
+    size = (info.width, info.height)
+    if shrink:
+        width = shrink_to_resolution[0]
+        size = (width, max(1, round(info.height * width / info.width)))
+    reducing_gap = RESAMPLING[quality][1]
+    mode = None if color_mode == "rgb" else "L"
+    with decoded_image_for_size(
+        image, size, reducing_gap=reducing_gap, mode=mode
+    ) as img:
+        if shrink:
+            img = resize_image(img, shrink_to_resolution, quality)
+        if annotate:
+            img = add_text_to_image(img, filename_to_annotation(image))
+        return convert_color_mode(img, color_mode)
@@ -0,0 +1,158 @@
+import io
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Literal
+
+from PIL import Image, features
+
+MM_TO_PT = 72 / 25.4
+PAGE_SIZES_PT = {"a4": (210 * MM_TO_PT, 297 * MM_TO_PT)}
+CATALOG, PAGES = 1, 2  # Object numbers reserved for the document structure.
+
+
+def ccitt_group4(image: Image.Image) -> bytes:
+    """
+    Return a bilevel image compressed with CCITT Group 4, as libtiff encodes it into
+    a TIFF file of a single strip, PDF taking a single Group 4 stream per image.
+    """
+    from PIL import TiffImagePlugin
+
+    tiff = io.BytesIO()
+    image.save(
+        tiff,
+        format="TIFF",
+        compression="group4",
+        strip_size=(image.width + 7) // 8 * image.height,
+    )
+    tiff.seek(0)
+    with Image.open(tiff, formats=("TIFF",)) as img:
+        (offset,) = img.tag_v2[TiffImagePlugin.STRIPOFFSETS]
+        (length,) = img.tag_v2[TiffImagePlugin.STRIPBYTECOUNTS]
+    return tiff.getbuffer()[offset : offset + length].tobytes()
+
+
+class StreamingPdfWriter:
+    """
+    Minimal PDF writer emitting every page, with its image, as soon as it is added.
+
+    Only the byte offsets of the objects and the page object numbers are kept, the
+    page tree and cross-reference table are written on close. As offsets are counted
+    rather than looked up, the output can be a pipe as well as a file.
+    """
+
+    def __init__(
+        self,
+        output: BinaryIO,
+        page_format: Literal["a4"] = "a4",
+        orientation: Literal["portrait", "landscape"] = "landscape",
+    ):
+        self.output = output
+        width, height = PAGE_SIZES_PT[page_format]
+        self.page_size = (
+            (height, width) if orientation == "landscape" else (width, height)
+        )
+        self.position = 0
+        self.offsets: dict[int, int] = {}
+        self.page_numbers: list[int] = []
+        self.next_number = PAGES + 1
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data: bytes):
+        self.output.write(data)
+        self.position += len(data)
+
+    def _write_object(self, number: int, dictionary: str, stream: bytes | None = None):
+        self.offsets[number] = self.position
+        self._write(f"{number} 0 obj\n{dictionary}\n".encode())
+        if stream is not None:
+            self._write(b"stream\n")
+            self._write(stream)
+            self._write(b"\nendstream\n")
+        self._write(b"endobj\n")
+
+    def _reserve(self) -> int:
+        self.next_number += 1
+        return self.next_number - 1
+
+    def add_image_page(self, image: bytes | Path | Image.Image, width_mm: float):
+        """
+        Add a page with an image placed at its top left corner, width_mm wide.
+
+        Bytes and paths are JPEG data embedded as-is, decoded images are embedded
+        losslessly with Flate compression, or CCITT Group 4 if black and white.
+        """
+        parameters = ""
+        if isinstance(image, Path):
+            image = image.read_bytes()
+        if isinstance(image, bytes):
+            with Image.open(io.BytesIO(image), formats=("JPEG",)) as img:
+                size, mode = img.size, img.mode
+            data, filter_ = image, "/DCTDecode"
+        else:
+            if image.mode not in ("1", "L", "RGB"):
+                image = image.convert("RGB")
+            size, mode = image.size, image.mode
+            if mode == "1" and features.check("libtiff"):
+                data, filter_ = ccitt_group4(image), "/CCITTFaxDecode"
+                # Pillow stores black as 0 bits, which Group 4 codes as white runs.
+                parameters = (
+                    f" /DecodeParms << /K -1 /Columns {size[0]} /Rows {size[1]}"
+                    " /BlackIs1 true >>"
+                )
+            else:  # Rows of bilevel images are packed to bytes, white being 1 bits.
+                data, filter_ = zlib.compress(image.tobytes(), 6), "/FlateDecode"
+        color_space, bits, decode = {
+            "1": ("/DeviceGray", 1, ""),
+            "L": ("/DeviceGray", 8, ""),
+            "RGB": ("/DeviceRGB", 8, ""),
+            "CMYK": ("/DeviceCMYK", 8, " /Decode [1 0 1 0 1 0 1 0]"),  # Adobe JPEG.
+        }[mode]
+
+        image_number = self._reserve()
+        self._write_object(
+            image_number,
+            f"<< /Type /XObject /Subtype /Image /Width {size[0]} /Height {size[1]}"
+            f" /ColorSpace {color_space} /BitsPerComponent {bits}"
+            f" /Filter {filter_}{parameters}{decode} /Length {len(data)} >>",
+            data,
+        )
+
+        page_width, page_height = self.page_size
+        width = width_mm * MM_TO_PT
+        height = width * size[1] / size[0]
+        content = (
+            f"q {width:.2f} 0 0 {height:.2f} 0 {page_height - height:.2f} cm"
+            " /I0 Do Q"
+        ).encode()
+        content_number = self._reserve()
+        self._write_object(content_number, f"<< /Length {len(content)} >>", content)
+
+        page_number = self._reserve()
+        self._write_object(
+            page_number,
+            f"<< /Type /Page /Parent {PAGES} 0 R"
+            f" /MediaBox [0 0 {page_width:.2f} {page_height:.2f}]"
+            f" /Resources << /XObject << /I0 {image_number} 0 R >> >>"
+            f" /Contents {content_number} 0 R >>",
+        )
+        self.page_numbers.append(page_number)
+
+    def close(self):
+        """Write the page tree, catalog and cross-reference table."""
+        kids = " ".join(f"{number} 0 R" for number in self.page_numbers)
+        self._write_object(
+            PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_numbers)} >>"
+        )
+        self._write_object(CATALOG, f"<< /Type /Catalog /Pages {PAGES} 0 R >>")
+        xref_position = self.position
+        size = self.next_number
+        xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        xref.extend(
+            f"{self.offsets[number]:010d} 00000 n \n" for number in range(1, size)
+        )
+        self._write("".join(xref).encode())
+        self._write(
+            f"trailer\n<< /Size {size} /Root {CATALOG} 0 R >>\n"
+            f"startxref\n{xref_position}\n%%EOF\n".encode()
+        )
+        self.output.flush()
@@ -0,0 +1,140 @@
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from images_to_pdf import image, index, sizing, tracing
+from images_to_pdf.layout import LayoutPlan
+from images_to_pdf.memory import MemoryBudget
+
+PREFETCH_THREADS = 4  # Reading is I/O bound, notably on network storage.
+PREFETCH_MEMORY = 256  # MB of images read ahead.
+QUEUE_SIZE = 2  # Pages waiting between two stages.
+DONE = object()  # Marks the end of a stage's output.
+
+
+def read_image(img_path: Path) -> bytes:
+    with tracing.span("read", "image") as args:
+        data = img_path.read_bytes()
+        args["bytes_read"] = len(data)
+    return data
+
+
+def put(stage_queue: queue.Queue, item, stop: threading.Event):
+    """Put an item on a bounded queue, giving up if the pipeline is stopped."""
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def items(stage_queue: queue.Queue, stop: threading.Event) -> Iterator:
+    """Yield the items of a stage until it is done, raising its exception if failed."""
+    while not stop.is_set():
+        try:
+            item = stage_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def render_pages(
+    page_plans: Iterable[LayoutPlan],
+    annotate: bool = False,
+    quality: image.Quality = "best",
+    threads: int = PREFETCH_THREADS,
+    max_bytes: int = PREFETCH_MEMORY * 1024 * 1024,
+    jpeg: image.JpegSettings | None = None,
+    composed_files: Iterable[Path | None] = (),
+) -> Iterator[bytes]:
+    """
+    Render planned collage pages in overlapping stages and yield them in order as
+    JPEG bytes, encoded with the jpeg settings if given, and saved before encoding to
+    the composed_files given for them, to encode them again.
+
+    Threads read the image files of upcoming pages into memory while a page is
+    composed, and the previous page is JPEG encoded meanwhile in another thread,
+    writing by the caller being the last stage. Stages are connected by bounded
+    queues, and max_bytes caps the size of the images read but not yet composed,
+    image files larger than it being decoded from disk instead.
+    """
+    stop = threading.Event()
+    budget = MemoryBudget(max_bytes)
+    read_queue = queue.Queue(QUEUE_SIZE)
+    compose_queue = queue.Queue(QUEUE_SIZE)
+    encode_queue = queue.Queue(QUEUE_SIZE)
+    executor = ThreadPoolExecutor(max_workers=threads)
+
+    def read():
+        try:
+            for plan in page_plans:
+                sizes = {}
+                for img_path in (tile.source for tile in plan.tiles):
+                    size = index.lookup(img_path).file_size
+                    if size <= max_bytes:  # Larger files are decoded from disk.
+                        sizes[img_path] = size
+                # Reserve the images of a page at once, as they are released once
+                # the page is composed.
+                if not budget.acquire(sum(sizes.values()), stop):
+                    return
+                reads: dict[Path, tuple[int, Future]] = {
+                    img_path: (size, executor.submit(read_image, img_path))
+                    for img_path, size in sizes.items()
+                }
+                put(read_queue, (plan, reads), stop)
+            put(read_queue, DONE, stop)
+        except Exception as e:
+            put(read_queue, e, stop)
+
+    def compose():
+        try:
+            for plan, reads in items(read_queue, stop):
+                for img_path, (_, future) in reads.items():
+                    image.prefetched[img_path] = future.result()
+                try:
+                    with tracing.span("page", "page", images=len(plan.tiles)):
+                        collage = image.render_page_plan(
+                            plan, "#000000", annotate, quality
+                        )
+                finally:
+                    for img_path, (size, _) in reads.items():
+                        image.prefetched.pop(img_path, None)
+                        budget.release(size)
+                put(compose_queue, collage, stop)
+            put(compose_queue, DONE, stop)
+        except Exception as e:
+            put(compose_queue, e, stop)
+
+    def encode():
+        try:
+            files = iter(composed_files)
+            for collage in items(compose_queue, stop):
+                sizing.save_composed(collage, next(files, None))
+                put(
+                    encode_queue,
+                    image.encode_image(collage, image.ImageFormat.JPG, jpeg),
+                    stop,
+                )
+            put(encode_queue, DONE, stop)
+        except Exception as e:
+            put(encode_queue, e, stop)
+
+    stages = [
+        threading.Thread(target=stage, daemon=True) for stage in (read, compose, encode)
+    ]
+    for stage in stages:
+        stage.start()
+    try:
+        yield from items(encode_queue, stop)
+    finally:  # Also when the caller stops early or a stage failed.
+        stop.set()
+        for stage in stages:
+            stage.join()
+        executor.shutdown(cancel_futures=True)
@@ -0,0 +1,285 @@
+import http.client
+import json
+import os
+import re
+import secrets
+import socket
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from images_to_pdf import logger
+from images_to_pdf.jobs import JobQueue
+
+DEFAULT_SERVER = "http://127.0.0.1:8765"
+TOKEN_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    / "images_to_pdf"
+    / "servers"
+)
+JOB_PATH = re.compile(r"^/jobs/(\d+)$")
+
+
+def parse_job_args(args: list[str]) -> dict:
+    """
+    Parse the arguments of a job as the images-to-pdf command line does, returning
+    the create_pdf parameters. Raises ValueError if they are not valid.
+    """
+    from images_to_pdf.cli import app, create_pdf
+
+    try:
+        command, bound, _ = app.parse_args(args, exit_on_error=False, print_error=False)
+    except Exception as e:
+        raise ValueError(str(e)) from e
+    if command is not create_pdf:
+        raise ValueError("Only the arguments of creating a PDF are accepted")
+    return bound.arguments
+
+
+def job_args(parameters: dict) -> list[str]:
+    """Return command line arguments of create_pdf parameters, with absolute paths."""
+    args = []
+    for name, value in parameters.items():
+        if isinstance(value, Path):
+            value = value.absolute().as_posix()
+        option = f"--{name.replace('_', '-')}"
+        if name in ("image_path", "output_pdf"):
+            args.append(value)
+        elif value is None:
+            continue
+        elif isinstance(value, bool):
+            args.append(option if value else f"--no-{name.replace('_', '-')}")
+        elif isinstance(value, list):
+            for item in value:
+                args.extend((option, str(item)))
+        elif isinstance(value, tuple):
+            args.extend((option, *map(str, value)))
+        else:
+            args.extend((option, str(value)))
+    return args
+
+
+def token_file_for(address: str) -> Path:
+    """
+    Return the file holding the token of the server at an http://host:port or
+    unix:/path address, next to its Unix socket or by port in the user's cache.
+    """
+    if address.startswith("unix:"):
+        socket_path = Path(address.removeprefix("unix:"))
+        return socket_path.with_name(f"{socket_path.name}.token")
+    return TOKEN_DIR / f"port-{urlsplit(address).port}.token"
+
+
+def write_token_file(token_file: Path, token: str):
+    """Write a token to a file only the user can read."""
+    token_file.parent.mkdir(parents=True, exist_ok=True)
+    token_file.unlink(missing_ok=True)
+    descriptor = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descriptor, "w") as f:
+        f.write(token)
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of a job queue:
+
+        POST /jobs {"args": [...], "priority": 0}  queue a job of command line args
+        GET /jobs                                  status of all jobs
+        GET /jobs/<id>                             status and new log messages of a job
+        DELETE /jobs/<id>                          cancel a job
+
+    Every request needs the token of the server as "Authorization: Bearer <token>",
+    and requests from web pages of other origins are refused, so that pages the user
+    visits can't write files through the server.
+    """
+
+    job_queue: JobQueue
+    token: str
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def find_job(self):
+        match = JOB_PATH.match(self.path)
+        job = match and self.job_queue.jobs.get(int(match.group(1)))
+        if not job:
+            self.send_json(404, {"error": f"No job at {self.path}"})
+        return job
+
+    def is_allowed(self) -> bool:
+        """Return True if the request may be served, else send the error."""
+        origin = self.headers.get("Origin")
+        if origin is not None and urlsplit(origin).netloc != self.headers.get("Host"):
+            self.send_json(403, {"error": f"Requests from {origin} are refused"})
+            return False
+        authorization = self.headers.get("Authorization", "")
+        if not secrets.compare_digest(authorization, f"Bearer {self.token}"):
+            self.send_json(401, {"error": "Missing or wrong server token"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self.is_allowed():
+            return
+        if self.path == "/jobs":
+            jobs = list(self.job_queue.jobs.values())
+            self.send_json(200, {"jobs": [self.job_status(job) for job in jobs]})
+        elif job := self.find_job():
+            status = self.job_status(job)
+            status["logs"] = job.take_logs()
+            self.send_json(200, status)
+
+    def do_POST(self):
+        if not self.is_allowed():
+            return
+        if self.headers.get_content_type() != "application/json":
+            self.send_json(415, {"error": "Jobs must be posted as application/json"})
+            return
+        if self.path != "/jobs":
+            self.send_json(404, {"error": f"Nothing to post to at {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            parameters = parse_job_args([str(arg) for arg in request["args"]])
+            priority = int(request.get("priority", 0))
+        except (KeyError, TypeError, ValueError) as e:
+            self.send_json(400, {"error": str(e) or type(e).__name__})
+            return
+        job = self.job_queue.submit(parameters, priority)
+        logger.info(f"Queued job {job.number} with priority {priority}")
+        self.send_json(201, self.job_status(job))
+
+    def do_DELETE(self):
+        if self.is_allowed() and (job := self.find_job()):
+            job.cancel()
+            logger.info(f"Cancelling job {job.number}")
+            self.send_json(200, self.job_status(job))
+
+    def job_status(self, job) -> dict:
+        status = job.status()
+        if job.state == "queued":
+            status["queue_position"] = self.job_queue.position(job)
+        return status
+
+    def log_message(self, format, *args):  # No client address on a Unix socket.
+        logger.debug(f"{self.command} {self.path}")
+
+
+class ThreadingUnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+
+def serve(
+    job_queue: JobQueue,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: Path | None = None,
+    token: str | None = None,
+):
+    """
+    Serve the JSON API of a job queue over HTTP, on a Unix socket if given, to
+    clients with the token, a random one if not given. The token is written to the
+    file of token_file_for the address, for local clients to read.
+    """
+    token = token or secrets.token_urlsafe(32)
+    handler = type(
+        "Handler", (JobRequestHandler,), {"job_queue": job_queue, "token": token}
+    )
+    if unix_socket:
+        unix_socket.unlink(missing_ok=True)
+        server = ThreadingUnixHTTPServer(unix_socket.as_posix(), handler)
+        address = f"unix:{unix_socket.as_posix()}"
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        address = f"http://{host}:{server.server_port}"
+    token_file = token_file_for(address)
+    write_token_file(token_file, token)
+    logger.info(f"Serving jobs at {address} with {job_queue.max_jobs} workers")
+    logger.info(f"Token of the server saved to {token_file.as_posix()}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        token_file.unlink(missing_ok=True)
+        if unix_socket:
+            unix_socket.unlink(missing_ok=True)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+class Client:
+    """
+    Client of a job server at an http://host:port or unix:/path address, with the
+    token of the server, read from the file the server wrote if not given.
+    """
+
+    def __init__(self, address: str = DEFAULT_SERVER, token: str | None = None):
+        self.address = address
+        self.token = token
+
+    def read_token(self) -> str:
+        if self.token is None:
+            token_file = token_file_for(self.address)
+            try:
+                self.token = token_file.read_text().strip()
+            except FileNotFoundError:
+                raise ValueError(
+                    f"No token of a server at {token_file.as_posix()}, "
+                    "is the server running?"
+                ) from None
+        return self.token
+
+    def request(self, method: str, path: str, body: dict | None = None) -> dict:
+        if self.address.startswith("unix:"):
+            connection = UnixHTTPConnection(self.address.removeprefix("unix:"))
+        else:
+            connection = http.client.HTTPConnection(
+                self.address.removeprefix("http://")
+            )
+        try:
+            connection.request(
+                method,
+                path,
+                body=json.dumps(body) if body is not None else None,
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.read_token()}",
+                },
+            )
+            response = connection.getresponse()
+            result = json.loads(response.read())
+        finally:
+            connection.close()
+        if response.status >= 400:
+            raise ValueError(result.get("error", f"HTTP {response.status}"))
+        return result
+
+    def submit(self, args: list[str], priority: int = 0) -> dict:
+        return self.request("POST", "/jobs", {"args": args, "priority": priority})
+
+    def status(self, job_id: int) -> dict:
+        return self.request("GET", f"/jobs/{job_id}")
+
+    def jobs(self) -> list[dict]:
+        return self.request("GET", "/jobs")["jobs"]
+
+    def cancel(self, job_id: int) -> dict:
+        return self.request("DELETE", f"/jobs/{job_id}")
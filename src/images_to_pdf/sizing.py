@@ -0,0 +1,135 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+from PIL import Image
+
+from images_to_pdf.image import ImageFormat, JpegSettings, encode_image
+
+SAMPLE_PAGES = 3  # Pages encoded to estimate the size of a PDF.
+MAX_ATTEMPTS = 3  # PDFs written before settling for one over the size cap.
+SIZE_MARGIN = 0.95  # Share of the size cap aimed at, as sampled sizes vary.
+PAGE_OVERHEAD = 300  # Bytes of the PDF objects of a page besides its image.
+PDF_OVERHEAD = 1000  # Bytes of the document structure.
+
+# JPEG settings from the largest to the smallest output, keeping chroma at full
+# resolution only at the highest qualities.
+LADDER = [JpegSettings(quality, 0) for quality in (95, 90)] + [
+    JpegSettings(quality, 2)
+    for quality in (90, 85, 80, 75, 70, 65, 60, 50, 40, 30, 20, 10)
+]
+
+
+def sample_indices(count: int, samples: int = SAMPLE_PAGES) -> list[int]:
+    """Return the indices of up to samples pages spread evenly over count pages."""
+    if count <= samples:
+        return list(range(count))
+    return [int((number + 0.5) * count / samples) for number in range(samples)]
+
+
+class SizeSearch:
+    """
+    Search for the highest JPEG settings keeping a PDF under a size cap, estimating
+    its size from a few sample pages encoded with each settings tried.
+
+    Encoded sizes are cached, and the ratio of the actual size of a PDF written to its
+    estimate corrects later estimates, so settings can be searched again without
+    rendering or encoding the samples anew.
+    """
+
+    def __init__(self, samples: list[Image.Image], page_count: int):
+        self.samples = samples
+        self.page_count = page_count
+        self.correction = 1.0
+        self.sizes: dict[JpegSettings, int] = {}
+
+    def sample_size(self, settings: JpegSettings) -> int:
+        """Return the total size of the sample pages encoded with settings."""
+        if settings not in self.sizes:
+            self.sizes[settings] = sum(
+                len(encode_image(sample, ImageFormat.JPG, settings))
+                for sample in self.samples
+            )
+        return self.sizes[settings]
+
+    def rung_settings(self, rung: int) -> JpegSettings:
+        """Return the settings of a rung of the ladder, progressive if smaller."""
+        baseline = LADDER[rung]
+        return min(
+            (baseline, baseline._replace(progressive=True)), key=self.sample_size
+        )
+
+    def estimate(self, settings: JpegSettings) -> int:
+        """Return the estimated size of the PDF with its pages encoded with settings."""
+        page_size = self.sample_size(settings) / len(self.samples) + PAGE_OVERHEAD
+        return round(self.correction * self.page_count * page_size + PDF_OVERHEAD)
+
+    def best_settings(self, max_bytes: int) -> JpegSettings:
+        """
+        Return the highest settings estimated to fit in max_bytes, found by binary
+        search of the ladder, or the lowest settings if none is.
+        """
+        low, high = 0, len(LADDER) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self.estimate(self.rung_settings(middle)) <= max_bytes * SIZE_MARGIN:
+                high = middle
+            else:
+                low = middle + 1
+        return self.rung_settings(low)
+
+    def is_lowest(self, settings: JpegSettings) -> bool:
+        return settings._replace(progressive=False) == LADDER[-1]
+
+    def correct(self, settings: JpegSettings, actual_bytes: int):
+        """Scale later estimates by how far off the estimate for settings was."""
+        self.correction *= actual_bytes / self.estimate(settings)
+
+
+class ComposedPages:
+    """
+    The pages of a PDF as composed before JPEG encoding, kept on disk uncompressed
+    while the PDF may be written again to fit its size cap, so that the pages are
+    encoded again with other settings without decoding and composing their images
+    anew. Pages are saved by their index in the PDF, and removed on closing.
+    """
+
+    def __init__(self):
+        self.directory = Path(tempfile.mkdtemp(prefix="images_to_pdf_pages_"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def file(self, page_index: int) -> Path:
+        """Return the file the page is saved to, possibly not saved yet."""
+        return self.directory / f"{page_index}.tiff"
+
+    def load(self, page_index: int) -> Image.Image | None:
+        """Return the saved page, or None if not saved."""
+        return load_composed(self.file(page_index))
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def save_composed(page: Image.Image, file: Path | None):
+    """Save a composed page uncompressed to file, if given, to encode it again."""
+    if file is not None:
+        # Registering TIFF only, not to have Pillow import all its plugins.
+        from PIL import TiffImagePlugin  # noqa: F401
+
+        page.save(file, format="TIFF")
+
+
+def load_composed(file: Path | None) -> Image.Image | None:
+    """Return the composed page saved to file, or None if not saved."""
+    if file is None or not file.exists():
+        return None
+    from PIL import TiffImagePlugin  # noqa: F401
+
+    with Image.open(file, formats=("TIFF",)) as page:
+        page.load()
+        return page
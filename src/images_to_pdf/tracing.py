@@ -0,0 +1,163 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable
+
+
+@dataclass(slots=True)
+class Span:
+    """A timed stage of work, with wall clock start so spans of processes align."""
+
+    name: str
+    category: str
+    start: float
+    duration: float
+    pid: int
+    tid: int
+    args: dict = field(default_factory=dict)
+
+
+class Recorder:
+    """
+    Collects finished spans and passes them on to subscribers as events.
+
+    Subscribers are always called from the thread which created the recorder, as user
+    interfaces expect, spans of other threads are passed on with its next span. Spans
+    are kept for take only if keep is set, not when only subscribers need them.
+    """
+
+    def __init__(self, keep: bool = True):
+        self.keep = keep
+        self.spans: list[Span] = []
+        self.subscribers: list[Callable[[dict], None]] = []
+        self.lock = threading.Lock()
+        self.thread = threading.get_ident()
+        self.pending: list[Span] = []
+
+    def add(self, finished: Span):
+        with self.lock:
+            if self.keep:
+                self.spans.append(finished)
+            if not self.subscribers:
+                return
+            self.pending.append(finished)
+            if threading.get_ident() != self.thread:
+                return
+            pending, self.pending = self.pending, []
+        for pending_span in pending:
+            event = asdict(pending_span)
+            for subscriber in self.subscribers:
+                subscriber(event)
+
+    def take(self) -> list[Span]:
+        """Return and forget the spans recorded so far."""
+        with self.lock:
+            spans, self.spans = self.spans, []
+        return spans
+
+
+recorder: Recorder | None = None
+
+
+def configure(enabled: bool, keep: bool = True) -> Recorder | None:
+    """Enable recording of spans in this process, or disable it."""
+    global recorder
+    recorder = Recorder(keep) if enabled else None
+    return recorder
+
+
+def max_rss_mb() -> float:
+    """
+    Return the RSS high-water mark of this process in MB, or 0.0 where the resource
+    module is not available, as on Windows.
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+@contextmanager
+def span(name: str, category: str, **args):
+    """
+    Record the duration of the enclosed work if recording is enabled.
+
+    Yields the args of the span, so counts such as bytes read can be added on the way.
+    """
+    if recorder is None:
+        yield args
+        return
+    start = time.time()
+    counter = time.perf_counter()
+    try:
+        yield args
+    finally:
+        args["max_rss_mb"] = round(max_rss_mb(), 1)
+        recorder.add(
+            Span(
+                name=name,
+                category=category,
+                start=start,
+                duration=time.perf_counter() - counter,
+                pid=os.getpid(),
+                tid=threading.get_ident(),
+                args=args,
+            )
+        )
+
+
+def merge(spans: list[Span]):
+    """Add spans recorded in a worker process."""
+    if recorder is not None:
+        for finished in spans:
+            recorder.add(finished)
+
+
+def export_chrome_trace(spans: list[Span], trace_file: Path):
+    """Save spans in the Chrome trace event format, viewable in Perfetto."""
+    events = [
+        {
+            "name": s.name,
+            "cat": s.category,
+            "ph": "X",
+            "ts": s.start * 1_000_000,
+            "dur": s.duration * 1_000_000,
+            "pid": s.pid,
+            "tid": s.tid,
+            "args": s.args,
+        }
+        for s in spans
+    ]
+    trace_file.write_text(json.dumps({"traceEvents": events}))
+
+
+def summary_table(spans: list[Span]) -> str:
+    """Return a table of count, time, bytes and peak RSS for each kind of span."""
+    rows = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0, "bytes": 0})
+    peak_rss = 0.0
+    for s in spans:
+        row = rows[(s.category, s.name)]
+        row["count"] += 1
+        row["total"] += s.duration
+        row["max"] = max(row["max"], s.duration)
+        row["bytes"] += s.args.get("bytes_read", 0) + s.args.get("bytes_written", 0)
+        peak_rss = max(peak_rss, s.args.get("max_rss_mb", 0.0))
+    lines = [
+        f"{'stage':<24}{'count':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}{'MB':>10}"
+    ]
+    for (category, name), row in sorted(rows.items(), key=lambda r: -r[1]["total"]):
+        lines.append(
+            f"{category + '/' + name:<24}{row['count']:>8}{row['total']:>10.2f}"
+            f"{row['total'] / row['count'] * 1000:>10.1f}{row['max'] * 1000:>10.1f}"
+            f"{row['bytes'] / 1024 / 1024:>10.1f}"
+        )
+    lines.append(f"Peak RSS {peak_rss:.0f} MB")
+    return "\n".join(lines)
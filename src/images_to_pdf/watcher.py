@@ -0,0 +1,166 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Iterator
+
+from images_to_pdf import discover, logger
+
+# Events of inotify(7) marking images or directories as added, changed or removed.
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len of struct inotify_event.
+POLL_INTERVAL = 2.0  # Seconds between scans of the polling watcher.
+
+
+def is_image(path: Path) -> bool:
+    return path.suffix.lower() in discover.IMAGE_SUFFIXES
+
+
+class InotifyWatcher:
+    """Watcher of the images below a directory, using inotify on Linux."""
+
+    def __init__(self, directory: Path):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories: dict[int, Path] = {}
+        self.add_tree(directory)
+
+    def add_tree(self, directory: Path):
+        """Watch a directory and its subdirectories."""
+        for subdirectory, _, _ in os.walk(directory):
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(subdirectory), WATCH_MASK
+            )
+            if wd < 0:
+                logger.warning(
+                    f"Can't watch {subdirectory}: {os.strerror(ctypes.get_errno())}"
+                )
+                continue
+            self.directories[wd] = Path(subdirectory)
+
+    def wait(self, timeout: float | None) -> set[Path]:
+        """Wait up to timeout seconds for changes, returning the paths changed."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_IGNORED:  # Watch removed along with its directory.
+                continue
+            directory = self.directories.get(wd)
+            if mask & IN_Q_OVERFLOW or directory is None:
+                changed.add(Path("."))  # Events lost, anything may have changed.
+                continue
+            path = directory / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)
+                changed.add(path)
+            elif mask & IN_DELETE_SELF:
+                del self.directories[wd]
+            elif is_image(path):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Watcher of the images below a directory, comparing scans of its tree."""
+
+    def __init__(self, directory: Path, interval: float = POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self) -> dict[Path, tuple[int, int]]:
+        snapshot = {}
+        for image_file in discover.find_images(self.directory):
+            try:
+                stat = image_file.stat()
+            except FileNotFoundError:
+                continue
+            snapshot[image_file] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout: float | None) -> set[Path]:
+        """Wait up to timeout seconds for changes, returning the paths changed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(
+                self.interval
+                if deadline is None
+                else max(0.0, min(self.interval, deadline - time.monotonic()))
+            )
+            snapshot = self.scan()
+            changed = {
+                path
+                for path in snapshot.keys() | self.snapshot.keys()
+                if snapshot.get(path) != self.snapshot.get(path)
+            }
+            self.snapshot = snapshot
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+
+def watcher_for(
+    directory: Path, poll_interval: float | None = None
+) -> InotifyWatcher | PollingWatcher:
+    """Return an inotify watcher on Linux, a polling one otherwise or if asked to."""
+    if poll_interval is None and sys.platform == "linux":
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"Can't use inotify, polling for changes instead: {e}")
+    return PollingWatcher(directory, poll_interval or POLL_INTERVAL)
+
+
+def debounced_changes(
+    watcher: InotifyWatcher | PollingWatcher, debounce: float
+) -> Iterator[set[Path]]:
+    """
+    Yield the paths changed, once no more changes came for debounce seconds, so a
+    batch of files being copied is handled at once.
+    """
+    while True:
+        changed = watcher.wait(None)
+        if not changed:
+            continue
+        deadline = time.monotonic() + debounce
+        while (remaining := deadline - time.monotonic()) > 0:
+            if more := watcher.wait(remaining):
+                changed |= more
+                deadline = time.monotonic() + debounce
+        yield changed
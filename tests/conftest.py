@@ -0,0 +1,17 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def make_image(tmp_path):
+    """Return a function saving an image of a size to a file in tmp_path."""
+
+    def make_image(name: str, size: tuple[int, int], color="gray") -> Path:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", size, color).save(path)
+        return path
+
+    return make_image
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from images_to_pdf import batches, cli
+
+
+@pytest.fixture
+def manifest_file(make_image, tmp_path):
+    make_image("images/1.png", (60, 40))
+    jobs = [
+        {"image_path": "images", "output_pdf": "first.pdf", "resolution": [120, 80]},
+        {"image_path": "images", "output_pdf": "bad.pdf", "no_such_option": 1},
+        {"image_path": "images"},
+        {"image_path": "images", "output_pdf": "last.pdf", "resolution": [120, 80]},
+    ]
+    manifest_file = tmp_path / "manifest.json"
+    manifest_file.write_text(json.dumps(jobs))
+    return manifest_file
+
+
+def test_jobs_are_validated_one_by_one(manifest_file):
+    jobs = batches.load_jobs(manifest_file)
+    assert [error is None for _, error in jobs] == [True, False, False, True]
+    parameters, error = jobs[1]
+    assert parameters == json.loads(manifest_file.read_text())[1]
+    assert error == "Unknown parameter no_such_option"
+
+
+def test_jobs_not_valid_fail_and_the_others_run(manifest_file, tmp_path):
+    report = tmp_path / "report.json"
+    with pytest.raises(SystemExit) as exit_info:
+        cli.batch(manifest_file, report=report)
+    assert exit_info.value.code == 1
+    assert (tmp_path / "first.pdf").is_file()
+    assert (tmp_path / "last.pdf").is_file()
+    statuses = json.loads(report.read_text())["jobs"]
+    assert [status["state"] for status in statuses] == [
+        "done",
+        "failed",
+        "failed",
+        "done",
+    ]
+    assert "no_such_option" in statuses[1]["error"]
+    assert statuses[1]["output_pdf"] == "bad.pdf"
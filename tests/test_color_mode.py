@@ -0,0 +1,67 @@
+import subprocess
+import sys
+
+import pytest
+from PIL import Image, ImageDraw
+
+from images_to_pdf import cli
+from images_to_pdf.image import convert_color_mode
+
+
+def shaded_scan() -> Image.Image:
+    """A page of text lines, lit unevenly from bright on the left to dim."""
+    scan = Image.linear_gradient("L").rotate(90).resize((400, 300))
+    scan = scan.point(lambda v: 110 + v * 120 // 255).convert("RGB")
+    draw = ImageDraw.Draw(scan)
+    for y in range(20, 280, 40):
+        draw.rectangle((20, y, 380, y + 4), fill=(40, 40, 40))
+    return scan
+
+
+def test_rgb_is_kept():
+    scan = shaded_scan()
+    assert convert_color_mode(scan, "rgb") is scan
+
+
+def test_gray():
+    gray = convert_color_mode(shaded_scan(), "gray")
+    assert gray.mode == "L"
+    assert gray.size == (400, 300)
+
+
+def test_bilevel_separates_text_from_uneven_background():
+    bilevel = convert_color_mode(shaded_scan(), "bilevel")
+    assert bilevel.mode == "1"
+    for x in (30, 200, 370):  # Text and paper alike, however lit.
+        assert bilevel.getpixel((x, 22)) == 0
+        assert bilevel.getpixel((x, 40)) == 255
+
+
+@pytest.mark.parametrize("layout", ["grid", "auto", "lane"])
+def test_color_modes_need_the_document_layout(make_image, tmp_path, layout):
+    image_dir = make_image("images/1.png", (60, 40)).parent
+    with pytest.raises(cli.UsageError):
+        cli.create_pdf(
+            image_dir, tmp_path / "out.pdf", layout=layout, color_mode="gray"
+        )
+    assert not list(tmp_path.glob("*.pdf"))
+
+
+def test_usage_errors_are_reported_without_traceback(make_image, tmp_path):
+    image_dir = make_image("images/1.png", (60, 40)).parent
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "images_to_pdf.cli",
+            image_dir.as_posix(),
+            (tmp_path / "out.pdf").as_posix(),
+            "--color-mode=bilevel",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 2
+    output = result.stdout + result.stderr
+    assert "A color mode other than rgb needs the document layout" in output
+    assert "Traceback" not in output
@@ -0,0 +1,45 @@
+import subprocess
+import sys
+
+import pytest
+
+MODULE = "images_to_pdf.cli"
+# Loaded when a command needs them only: the GUI, PDF writing, labelling, the
+# version, and Pillow plugins beyond those of the image formats found.
+DEFERRED_MODULES = (
+    "pywebio",
+    "pywebio_battery",
+    "fpdf",
+    "numpy",
+    "get_version",
+    "PIL.ImageDraw",
+    "PIL.ImageFont",
+    "PIL.JpegImagePlugin",
+    "PIL.TiffImagePlugin",
+    "PIL.WebPImagePlugin",
+)
+
+
+@pytest.fixture(scope="module")
+def imported_modules() -> set[str]:
+    """Return the modules imported by importing the CLI in a fresh process."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "cumulative" not in line
+    }
+
+
+def test_cli_is_imported(imported_modules):
+    assert MODULE in imported_modules
+
+
+@pytest.mark.parametrize("module", DEFERRED_MODULES)
+def test_modules_some_commands_need_are_deferred(imported_modules, module):
+    assert module not in imported_modules
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from images_to_pdf.cli import create_pdf
+
+
+@pytest.fixture
+def image_dir(make_image, tmp_path):
+    for number in range(1, 5):
+        make_image(f"images/{number}.png", (60, 40))
+    return tmp_path / "images"
+
+
+def build(image_dir, output_pdf, **parameters):
+    create_pdf(
+        image_dir,
+        output_pdf,
+        **{
+            "images_per_page": 1,
+            "max_pages_per_pdf": 2,
+            "resolution": (120, 80),
+            "incremental": True,
+            **parameters,
+        },
+    )
+
+
+def rebuilt(image_dir, output_pdf, **parameters) -> list[str]:
+    """Build again, returning the names of the PDFs written again."""
+    for pdf_file in output_pdf.parent.glob("*.pdf"):
+        os.utime(pdf_file, ns=(0, 0))
+    build(image_dir, output_pdf, **parameters)
+    return sorted(
+        pdf_file.name
+        for pdf_file in output_pdf.parent.glob("*.pdf")
+        if pdf_file.stat().st_mtime_ns
+    )
+
+
+def test_unchanged_pdfs_are_skipped(image_dir, tmp_path):
+    output_pdf = tmp_path / "out.pdf"
+    build(image_dir, output_pdf)
+    assert sorted(f.name for f in tmp_path.glob("*.pdf")) == ["out_1.pdf", "out_2.pdf"]
+    assert rebuilt(image_dir, output_pdf) == []
+
+
+def test_pdfs_of_changed_images_are_built_again(image_dir, make_image, tmp_path):
+    output_pdf = tmp_path / "out.pdf"
+    build(image_dir, output_pdf)
+    make_image("images/3.png", (80, 40))
+    assert rebuilt(image_dir, output_pdf) == ["out_2.pdf"]
+
+
+def test_pdfs_missing_or_changed_are_built_again(image_dir, tmp_path):
+    output_pdf = tmp_path / "out.pdf"
+    build(image_dir, output_pdf)
+    (tmp_path / "out_1.pdf").unlink()
+    with (tmp_path / "out_2.pdf").open("ab") as pdf:
+        pdf.write(b"\n")
+    assert rebuilt(image_dir, output_pdf) == ["out_1.pdf", "out_2.pdf"]
+
+
+def test_changed_parameters_build_every_pdf_again(image_dir, tmp_path):
+    output_pdf = tmp_path / "out.pdf"
+    build(image_dir, output_pdf)
+    assert rebuilt(image_dir, output_pdf, resolution=(90, 60)) == [
+        "out_1.pdf",
+        "out_2.pdf",
+    ]
+
+
+def test_pdfs_no_longer_written_are_removed(make_image, tmp_path):
+    image_dir = make_image("images/1.png", (60, 40)).parent
+    output_pdf = tmp_path / "out.pdf"
+    build(image_dir, output_pdf)
+    assert (tmp_path / "out.pdf").is_file()
+    for number in range(2, 5):
+        make_image(f"images/{number}.png", (60, 40))
+    build(image_dir, output_pdf)
+    assert sorted(f.name for f in tmp_path.glob("*.pdf")) == ["out_1.pdf", "out_2.pdf"]
+
+
+def test_stale_pdfs_changed_since_are_kept(make_image, tmp_path):
+    image_dir = make_image("images/1.png", (60, 40)).parent
+    output_pdf = tmp_path / "out.pdf"
+    build(image_dir, output_pdf)
+    with output_pdf.open("ab") as pdf:
+        pdf.write(b"\n")
+    for number in range(2, 5):
+        make_image(f"images/{number}.png", (60, 40))
+    build(image_dir, output_pdf)
+    assert sorted(f.name for f in tmp_path.glob("*.pdf")) == [
+        "out.pdf",
+        "out_1.pdf",
+        "out_2.pdf",
+    ]
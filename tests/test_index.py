@@ -0,0 +1,33 @@
+import os
+
+import pytest
+from PIL import Image
+
+from images_to_pdf import index
+
+
+@pytest.fixture(autouse=True)
+def images(monkeypatch):
+    monkeypatch.setattr(index, "images", {})  # Restored after each test.
+
+
+def test_changed_images_are_read_again(make_image):
+    image_file = make_image("image.png", (60, 40))
+    assert index.lookup(image_file).width == 60
+    Image.new("RGB", (30, 50)).save(image_file)
+    stat = image_file.stat()
+    os.utime(image_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert index.lookup(image_file).width == 30
+    assert index.build_index([image_file])[image_file].width == 30
+
+
+def test_index_drops_the_oldest_images_beyond_its_cap(make_image, monkeypatch):
+    monkeypatch.setattr(index, "MAX_INDEXED_IMAGES", 2)
+    image_files = [make_image(f"{number}.png", (60, 40)) for number in range(3)]
+    index.build_index(image_files)
+    assert [info.path for info in index.images.values()] == image_files[1:]
+    index.lookup(image_files[0])
+    assert [info.path for info in index.images.values()] == [
+        image_files[2],
+        image_files[0],
+    ]
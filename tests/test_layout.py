@@ -0,0 +1,102 @@
+import pytest
+
+from images_to_pdf import layout
+
+
+def covered_area(rects):
+    return sum(width * height for _, _, width, height in rects)
+
+
+def test_partition_rows_balances_row_sums():
+    assert layout.partition_rows([1, 1, 1, 1, 1, 1], 3) == [2, 2, 2]
+    assert layout.partition_rows([4, 1, 1, 1, 1], 2) == [1, 4]
+
+
+def test_partition_rows_keeps_every_image_once():
+    aspect_ratios = [1.5, 0.7, 1.0, 2.3, 0.5, 1.3, 0.8, 1.7, 1.1]
+    for rows in range(1, len(aspect_ratios) + 1):
+        lengths = layout.partition_rows(aspect_ratios, rows)
+        assert len(lengths) == rows
+        assert sum(lengths) == len(aspect_ratios)
+        assert min(lengths) >= 1
+
+
+def test_partition_rows_caps_rows_at_images():
+    assert layout.partition_rows([1.0, 2.0], 5) == [1, 1]
+
+
+def test_partition_rows_limits_images_per_row():
+    aspect_ratios = [100.0] + [0.01] * 29
+    lengths = layout.partition_rows(aspect_ratios, 4)
+    assert max(lengths) <= layout.MAX_ROW_IMAGES
+    assert sum(lengths) == len(aspect_ratios)
+
+
+@pytest.mark.parametrize(
+    "total, weights", [(100, [1, 1, 1]), (1240, [0.3, 1.7, 2.2, 0.9]), (7, [1])]
+)
+def test_distribute_sums_to_total(total, weights):
+    parts = layout.distribute(total, weights)
+    assert sum(parts) == total
+    assert len(parts) == len(weights)
+
+
+@pytest.mark.parametrize(
+    "aspect_ratios",
+    [[1.0], [1.5, 0.7, 1.0, 2.3, 0.5, 1.3], [0.75] * 12, [4.0, 0.25, 1.0]],
+)
+def test_justified_rows_fill_the_canvas(aspect_ratios):
+    size = (1754, 1240)
+    rects = layout.justified_rows(aspect_ratios, size)
+    assert len(rects) == len(aspect_ratios)
+    assert covered_area(rects) == size[0] * size[1]
+    for x, y, width, height in rects:
+        assert 0 <= x and x + width <= size[0]
+        assert 0 <= y and y + height <= size[1]
+
+
+def test_justified_rows_of_no_images():
+    assert layout.justified_rows([], (100, 100)) == []
+
+
+@pytest.mark.parametrize(
+    "image_size, size", [((400, 300), (100, 100)), ((300, 400), (200, 100))]
+)
+def test_fit_crop_has_the_aspect_of_size(image_size, size):
+    left, top, right, bottom = layout.fit_crop(image_size, size)
+    assert (right - left) / (bottom - top) == pytest.approx(size[0] / size[1])
+    assert 0 <= left and right <= image_size[0]
+    assert 0 <= top and bottom <= image_size[1]
+
+
+@pytest.mark.parametrize("collage_type", ["grid", "auto", "lane"])
+def test_plan_page_tiles_every_image(make_image, collage_type):
+    images = [
+        make_image(f"{number}.png", size)
+        for number, size in enumerate([(400, 300), (300, 400), (500, 500), (800, 200)])
+    ]
+    plan = layout.plan_page(images, collage_type, (1754, 1240))
+    assert plan.size == (1754, 1240)
+    assert sorted(tile.source for tile in plan.tiles) == sorted(images)
+
+
+def test_plans_round_trip(make_image, tmp_path):
+    images = [make_image("a.png", (400, 300)), make_image("b.png", (300, 400))]
+    plans = {1: [layout.plan_page(images, "auto", (1754, 1240))]}
+    plan_file = tmp_path / "plans.json"
+    layout.save_plans(plan_file, plans)
+    assert {
+        pdf_number: [plan.to_dict() for plan in pdf_plans]
+        for pdf_number, pdf_plans in layout.load_plans(plan_file).items()
+    } == {1: [plans[1][0].to_dict()]}
+
+
+def test_golden_ratio_reports_images_not_placed(make_image, monkeypatch):
+    images = [make_image(f"{number}.png", (400, 300)) for number in range(6)]
+    warnings = []
+    monkeypatch.setattr(layout.logger, "warning", warnings.append)
+    plan = layout.plan_golden_ratio(images, (100, 60), 20, False)
+    assert [tile.source for tile in plan.tiles] == images[:3]
+    assert len(warnings) == 1
+    assert "3 images not placed" in warnings[0]
+    assert images[5].as_posix() in warnings[0]
@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from images_to_pdf import manifest
+from images_to_pdf.cli import UsageError, create_pdf
+
+
+@pytest.fixture
+def image_dir(make_image, tmp_path):
+    for number in range(1, 7):
+        make_image(f"images/{number}.png", (60, 40 + number))
+    return tmp_path / "images"
+
+
+def create_shard(image_dir, output_pdf, shard):
+    create_pdf(
+        image_dir,
+        output_pdf,
+        images_per_page=1,
+        max_pages_per_pdf=1,
+        resolution=(120, 80),
+        shard=shard,
+    )
+
+
+def test_parse_shard():
+    assert manifest.parse_shard("2/3") == (2, 3)
+    assert manifest.parse_shard(" 1/1 ") == (1, 1)
+
+
+@pytest.mark.parametrize("shard", ["0/2", "3/2", "1", "a/b", "1/2/3"])
+def test_parse_shard_rejects(shard):
+    with pytest.raises(ValueError):
+        manifest.parse_shard(shard)
+
+
+def test_shards_render_every_pdf_once():
+    shard_count = 3
+    for pdf_number in range(1, 20):
+        shards = [
+            shard_index
+            for shard_index in range(1, shard_count + 1)
+            if manifest.in_shard(pdf_number, shard_index, shard_count)
+        ]
+        assert len(shards) == 1
+
+
+def test_merge_of_complete_shards(image_dir, tmp_path):
+    output_pdf = tmp_path / "out.pdf"
+    create_shard(image_dir, output_pdf, "1/2")
+    create_shard(image_dir, output_pdf, "2/2")
+    merged_file, problems = manifest.merge_shard_manifests(output_pdf)
+    assert problems == []
+    merged = json.loads(merged_file.read_text())
+    assert merged["total_pdfs"] == 6
+    assert list(merged["pdfs"]) == [str(number) for number in range(1, 7)]
+    assert [pdf["file"] for pdf in merged["pdfs"].values()] == [
+        f"out_{number}.pdf" for number in range(1, 7)
+    ]
+
+
+def test_merge_reports_missing_shards(image_dir, tmp_path):
+    output_pdf = tmp_path / "out.pdf"
+    create_shard(image_dir, output_pdf, "2/2")
+    merged_file, problems = manifest.merge_shard_manifests(output_pdf)
+    assert "Missing shards [1] of 2" in problems
+    assert "Missing PDFs [1, 3, 5] of 6" in problems
+    assert not merged_file.exists()
+
+
+def test_merge_reports_changed_pdfs(image_dir, tmp_path):
+    output_pdf = tmp_path / "out.pdf"
+    create_shard(image_dir, output_pdf, "1/2")
+    create_shard(image_dir, output_pdf, "2/2")
+    with (tmp_path / "out_4.pdf").open("ab") as pdf:
+        pdf.write(b"\n")
+    merged_file, problems = manifest.merge_shard_manifests(output_pdf)
+    assert problems == [
+        f"PDF {(tmp_path / 'out_4.pdf').as_posix()} is missing or changed"
+    ]
+    assert not merged_file.exists()
+
+
+def test_merge_reports_shards_of_other_jobs(image_dir, tmp_path):
+    output_pdf = tmp_path / "out.pdf"
+    create_shard(image_dir, output_pdf, "1/2")
+    (image_dir / "6.png").unlink()
+    create_shard(image_dir, output_pdf, "2/2")
+    _, problems = manifest.merge_shard_manifests(output_pdf)
+    assert "Shard manifests disagree on job" in problems
+
+
+def test_merge_without_shards(tmp_path):
+    _, problems = manifest.merge_shard_manifests(tmp_path / "out.pdf")
+    assert problems == [f"No shard manifests found for {tmp_path.as_posix()}/out.pdf"]
+
+
+@pytest.mark.parametrize("shard", ["4/3", "x"])
+def test_invalid_shards_are_usage_errors(image_dir, tmp_path, shard):
+    with pytest.raises(UsageError, match="Shard must be given as i/N"):
+        create_shard(image_dir, tmp_path / "out.pdf", shard)
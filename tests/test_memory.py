@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from images_to_pdf import memory
+
+
+def noise(mode: str, size: tuple[int, int]) -> Image.Image:
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    return Image.frombytes(mode, size, os.urandom(size[0] * size[1] * bands))
+
+
+def test_budget_reserves_within_its_bytes():
+    budget = memory.MemoryBudget(100)
+    assert budget.acquire(60)
+    assert budget.acquire(40)
+    assert budget.used.value == 100
+    budget.release(60)
+    budget.release(40)
+    assert budget.used.value == 0
+
+
+def test_budget_blocks_until_released():
+    budget = memory.MemoryBudget(100)
+    budget.acquire(80)
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: budget.acquire(50) and acquired.set())
+    thread.start()
+    assert not acquired.wait(0.3)
+    budget.release(80)
+    assert acquired.wait(5)
+    thread.join()
+    assert budget.used.value == 50
+
+
+def test_budget_lets_a_larger_reservation_through_alone():
+    budget = memory.MemoryBudget(100)
+    assert budget.acquire(500)
+    assert budget.used.value == 500
+
+
+def test_budget_gives_up_when_stopped():
+    budget = memory.MemoryBudget(100)
+    budget.acquire(100)
+    stop = threading.Event()
+    threading.Timer(0.2, stop.set).start()
+    start = time.monotonic()
+    assert not budget.acquire(1, stop)
+    assert time.monotonic() - start < 5
+    assert budget.used.value == 100
+
+
+def test_reserve_refuses_images_over_the_limit(monkeypatch):
+    monkeypatch.setattr(memory, "max_decode_bytes", 1000)
+    monkeypatch.setattr(memory, "decode_budget", memory.MemoryBudget(1000))
+    with memory.reserve(1000, "image"):
+        assert memory.decode_budget.used.value == 1000
+    assert memory.decode_budget.used.value == 0
+    with pytest.raises(memory.ImageTooLarge):
+        with memory.reserve(1001, "image"):
+            pass
+
+
+@pytest.mark.parametrize(
+    "image_format, mode",
+    [("TIFF", "RGB"), ("TIFF", "L"), ("BMP", "RGB"), ("BMP", "L"), ("PPM", "RGB")],
+)
+@pytest.mark.parametrize("factor", [2, 3, 8])
+def test_reduce_in_strips_as_reducing_the_whole_image(
+    tmp_path, monkeypatch, image_format, mode, factor
+):
+    image_file = tmp_path / f"image.{image_format.lower()}"
+    image = noise(mode, (203, 157))
+    image.save(image_file, format=image_format)
+    # Strips of a few rows each, not dividing the height.
+    monkeypatch.setattr(memory, "STRIP_BYTES", 203 * 4 * 10)
+    with Image.open(image_file) as img:
+        assert memory.can_decode_in_strips(img)
+    reduced = memory.reduce_in_strips(lambda: Image.open(image_file), factor)
+    assert reduced.mode == mode
+    assert reduced.size == image.reduce(factor).size
+    assert reduced.tobytes() == image.reduce(factor).tobytes()
+
+
+def test_other_pillow_releases_reduce_the_whole_image(tmp_path, monkeypatch):
+    image_file = tmp_path / "image.bmp"
+    image = noise("RGB", (203, 157))
+    image.save(image_file)
+    monkeypatch.setattr(memory, "PILLOW_VERSION", memory.STRIP_PILLOW_VERSIONS[1])
+    with Image.open(image_file) as img:
+        assert not memory.can_decode_in_strips(img)
+    reduced = memory.reduce_in_strips(lambda: Image.open(image_file), 4)
+    assert reduced.tobytes() == image.reduce(4).tobytes()
+
+
+@pytest.mark.parametrize("image_format", ["PNG", "JPEG"])
+def test_compressed_images_are_not_decoded_in_strips(tmp_path, image_format):
+    image_file = tmp_path / f"image.{image_format.lower()}"
+    noise("RGB", (64, 48)).save(image_file, format=image_format)
+    with Image.open(image_file) as img:
+        assert not memory.can_decode_in_strips(img)
+
+
+def test_strips_hold_less_than_the_image():
+    image = Image.new("RGB", (4000, 3000))
+    whole = memory.decode_bytes(image, 4, strips=False)
+    in_strips = memory.decode_bytes(image, 4, strips=True)
+    assert in_strips < whole
+    assert memory.strip_rows(4000, "RGB", 4) % 4 == 0
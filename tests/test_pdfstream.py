@@ -0,0 +1,146 @@
+import io
+import re
+import struct
+import zlib
+
+import pytest
+from PIL import Image, ImageDraw, features
+
+from images_to_pdf.pdfstream import StreamingPdfWriter, ccitt_group4
+
+needs_libtiff = pytest.mark.skipif(
+    not features.check("libtiff"), reason="Pillow built without libtiff"
+)
+
+
+class Pipe(io.RawIOBase):
+    """An output that can't seek or tell, as a pipe to another process."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+def pdf_objects(pdf: bytes) -> dict[int, bytes]:
+    """Return every object of a PDF by number, as found by its xref table."""
+    xref_position = int(re.search(rb"startxref\n(\d+)\n%%EOF\n$", pdf)[1])
+    assert pdf[xref_position:].startswith(b"xref\n")
+    size = int(re.match(rb"xref\n0 (\d+)\n", pdf[xref_position:])[1])
+    entries = pdf[xref_position:].split(b"\n")[3 : 3 + size - 1]
+    objects = {}
+    for number, entry in enumerate(entries, start=1):
+        offset = int(entry[:10])
+        assert pdf[offset:].startswith(f"{number} 0 obj\n".encode())
+        objects[number] = pdf[offset : pdf.index(b"endobj\n", offset)]
+    return objects
+
+
+def stream_of(pdf_object: bytes) -> bytes:
+    length = int(re.search(rb"/Length (\d+) >>\nstream\n", pdf_object)[1])
+    start = pdf_object.index(b"stream\n") + len(b"stream\n")
+    assert pdf_object[start + length :] == b"\nendstream\n"
+    return pdf_object[start : start + length]
+
+
+def image_objects(objects: dict[int, bytes]) -> list[bytes]:
+    return [obj for obj in objects.values() if b"/Subtype /Image" in obj]
+
+
+def text_scan(size=(300, 200)) -> Image.Image:
+    scan = Image.new("1", size, 1)
+    draw = ImageDraw.Draw(scan)
+    for y in range(10, size[1] - 10, 20):
+        draw.rectangle((10, y, size[0] - 40, y + 6), fill=0)
+    return scan
+
+
+def decode_group4(data: bytes, size: tuple[int, int]) -> Image.Image:
+    """Decode a Group 4 stream by wrapping it in a TIFF file of a single strip."""
+    data_offset = 8 + 2 + 8 * 12 + 4  # After the header and an IFD of 8 tags.
+    tags = [
+        (256, 4, size[0]),  # ImageWidth
+        (257, 4, size[1]),  # ImageLength
+        (258, 3, 1),  # BitsPerSample
+        (259, 3, 4),  # Compression: CCITT Group 4
+        (262, 3, 1),  # PhotometricInterpretation: BlackIsZero, as Pillow saves "1"
+        (273, 4, data_offset),  # StripOffsets
+        (278, 4, size[1]),  # RowsPerStrip
+        (279, 4, len(data)),  # StripByteCounts
+    ]
+    ifd = struct.pack("<H", len(tags))
+    for tag, field_type, value in tags:
+        ifd += struct.pack("<HHII", tag, field_type, 1, value)
+    tiff = b"II*\x00" + struct.pack("<I", 8) + ifd + struct.pack("<I", 0) + data
+    with Image.open(io.BytesIO(tiff)) as img:
+        img.load()
+        return img
+
+
+def write_pdf(pages, output=None, orientation="portrait") -> bytes:
+    output = output or io.BytesIO()
+    writer = StreamingPdfWriter(output, "a4", orientation)
+    for page in pages:
+        writer.add_image_page(page, 210)
+    writer.close()
+    return output.getvalue() if isinstance(output, io.BytesIO) else bytes(output.data)
+
+
+def test_pages_are_found_by_the_xref_table():
+    pdf = write_pdf([Image.new("RGB", (40, 30), "red")] * 3)
+    assert pdf.startswith(b"%PDF-1.4\n")
+    objects = pdf_objects(pdf)
+    assert b"/Type /Catalog /Pages 2 0 R" in objects[1]
+    assert b"/Count 3" in objects[2]
+    pages = [obj for obj in objects.values() if b"/Type /Page " in obj]
+    assert len(pages) == 3
+    for obj in objects.values():
+        if b"stream\n" in obj:
+            stream_of(obj)
+
+
+def test_output_needs_not_be_seekable():
+    page = Image.new("RGB", (40, 30), "blue")
+    assert write_pdf([page], Pipe()) == write_pdf([page])
+
+
+def test_jpeg_bytes_are_embedded_as_is():
+    jpeg = io.BytesIO()
+    Image.new("RGB", (64, 48), "green").save(jpeg, format="JPEG")
+    (image,) = image_objects(pdf_objects(write_pdf([jpeg.getvalue()])))
+    assert b"/Filter /DCTDecode" in image
+    assert b"/Width 64 /Height 48" in image
+    assert stream_of(image) == jpeg.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["RGB", "L"])
+def test_decoded_images_are_embedded_losslessly(mode):
+    page = Image.linear_gradient("L").resize((40, 30)).convert(mode)
+    (image,) = image_objects(pdf_objects(write_pdf([page])))
+    assert b"/Filter /FlateDecode" in image
+    assert zlib.decompress(stream_of(image)) == page.tobytes()
+
+
+@needs_libtiff
+def test_ccitt_group4_decodes_to_the_image():
+    scan = text_scan()
+    decoded = decode_group4(ccitt_group4(scan), scan.size)
+    assert decoded.size == scan.size
+    assert decoded.mode == "1"
+    assert decoded.tobytes() == scan.tobytes()
+
+
+@needs_libtiff
+def test_bilevel_pages_are_embedded_with_group4():
+    scan = text_scan()
+    (image,) = image_objects(pdf_objects(write_pdf([scan])))
+    assert b"/Filter /CCITTFaxDecode" in image
+    assert b"/BitsPerComponent 1" in image
+    assert b"/DecodeParms << /K -1 /Columns 300 /Rows 200 /BlackIs1 true >>" in image
+    assert stream_of(image) == ccitt_group4(scan)
+    assert len(stream_of(image)) < len(scan.tobytes()) / 4
@@ -0,0 +1,180 @@
+import http.client
+import json
+import stat
+import threading
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from images_to_pdf import server
+
+TOKEN = "secret"
+
+
+class FakeJob:
+    state = "running"
+
+    def __init__(self, number: int, parameters: dict, priority: int):
+        self.number = number
+        self.parameters = parameters
+        self.priority = priority
+        self.cancelled = False
+
+    def status(self) -> dict:
+        return {"id": self.number, "state": self.state}
+
+    def take_logs(self):
+        return []
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeJobQueue:
+    """A job queue recording the jobs submitted instead of running them."""
+
+    max_jobs = 1
+
+    def __init__(self):
+        self.jobs = {}
+
+    def submit(self, parameters: dict, priority: int = 0) -> FakeJob:
+        job = FakeJob(len(self.jobs) + 1, parameters, priority)
+        self.jobs[job.number] = job
+        return job
+
+
+@pytest.fixture
+def job_queue():
+    return FakeJobQueue()
+
+
+@pytest.fixture
+def address(job_queue):
+    handler = type(
+        "Handler",
+        (server.JobRequestHandler,),
+        {"job_queue": job_queue, "token": TOKEN},
+    )
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(
+        target=http_server.serve_forever, args=(0.01,), daemon=True
+    )
+    thread.start()
+    yield f"127.0.0.1:{http_server.server_port}"
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def request(address, method, path, body=None, **headers) -> tuple[int, dict]:
+    headers = {"Authorization": f"Bearer {TOKEN}", **headers}
+    if body is not None:
+        headers.setdefault("Content-Type", "application/json")
+        body = body if isinstance(body, bytes) else json.dumps(body).encode()
+    connection = http.client.HTTPConnection(address)
+    try:
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_job_is_queued(address, job_queue, tmp_path):
+    args = [tmp_path.as_posix(), "out.pdf", "--layout", "document"]
+    status, body = request(address, "POST", "/jobs", {"args": args, "priority": 3})
+    assert status == 201
+    assert body == {"id": 1, "state": "running"}
+    job = job_queue.jobs[1]
+    assert job.priority == 3
+    assert job.parameters["image_path"] == tmp_path
+    assert job.parameters["layout"] == "document"
+
+
+@pytest.mark.parametrize("authorization", [None, "Bearer wrong", TOKEN])
+def test_requests_without_the_token_are_refused(address, job_queue, authorization):
+    for method, path in [("GET", "/jobs"), ("POST", "/jobs"), ("DELETE", "/jobs/1")]:
+        headers = {"Authorization": authorization} if authorization else {}
+        connection = http.client.HTTPConnection(address)
+        connection.request(method, path, b"{}", headers)
+        assert connection.getresponse().status == 401
+        connection.close()
+    assert job_queue.jobs == {}
+
+
+def test_requests_from_other_origins_are_refused(address, job_queue, tmp_path):
+    body = {"args": [tmp_path.as_posix(), "out.pdf"]}
+    status, _ = request(address, "POST", "/jobs", body, Origin="http://evil.example")
+    assert status == 403
+    assert job_queue.jobs == {}
+    status, _ = request(address, "POST", "/jobs", body, Origin=f"http://{address}")
+    assert status == 201
+
+
+@pytest.mark.parametrize(
+    "content_type", ["text/plain", "application/x-www-form-urlencoded"]
+)
+def test_jobs_must_be_posted_as_json(address, job_queue, tmp_path, content_type):
+    body = {"args": [tmp_path.as_posix(), "out.pdf"]}
+    status, _ = request(
+        address, "POST", "/jobs", body, **{"Content-Type": content_type}
+    )
+    assert status == 415
+    assert job_queue.jobs == {}
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"not json",
+        {"priority": 1},
+        {"args": ["/no/such/directory", "out.pdf"]},
+        {"args": ["merge", "out.pdf"]},
+        {"args": [".", "out.pdf", "--no-such-option"]},
+        {"args": [".", "out.pdf"], "priority": "high"},
+    ],
+)
+def test_invalid_jobs_are_rejected(address, job_queue, body):
+    status, response = request(address, "POST", "/jobs", body)
+    assert status == 400
+    assert response["error"]
+    assert job_queue.jobs == {}
+
+
+def test_job_status_and_cancelling(address, job_queue, tmp_path):
+    request(address, "POST", "/jobs", {"args": [tmp_path.as_posix(), "out.pdf"]})
+    assert request(address, "GET", "/jobs/1") == (
+        200,
+        {"id": 1, "state": "running", "logs": []},
+    )
+    assert request(address, "GET", "/jobs") == (
+        200,
+        {"jobs": [{"id": 1, "state": "running"}]},
+    )
+    assert request(address, "DELETE", "/jobs/1")[0] == 200
+    assert job_queue.jobs[1].cancelled
+    assert request(address, "GET", "/jobs/2")[0] == 404
+    assert request(address, "POST", "/other", {})[0] == 404
+
+
+def test_job_args_are_parsed_back(tmp_path):
+    parameters = server.parse_job_args(
+        [tmp_path.as_posix(), "out.pdf", "--resolution", "877", "620", "--incremental"]
+    )
+    assert server.parse_job_args(server.job_args(parameters)) == parameters
+
+
+def test_token_file_is_private(tmp_path):
+    token_file = tmp_path / "servers" / "port-8765.token"
+    server.write_token_file(token_file, TOKEN)
+    server.write_token_file(token_file, "new")
+    assert token_file.read_text() == "new"
+    assert stat.S_IMODE(token_file.stat().st_mode) == 0o600
+
+
+def test_token_files_of_addresses():
+    assert server.token_file_for("unix:/run/jobs.sock") == Path("/run/jobs.sock.token")
+    assert server.token_file_for("http://127.0.0.1:9000") == (
+        server.TOKEN_DIR / "port-9000.token"
+    )
@@ -0,0 +1,79 @@
+import pytest
+from PIL import Image, UnidentifiedImageError
+
+from images_to_pdf import cli, pdf, sizing
+
+
+@pytest.fixture
+def image_dir(make_image, tmp_path):
+    colors = ["red", "green", "blue", "white", "black", "gray"]
+    for number, color in enumerate(colors * 2, start=1):
+        make_image(f"images/{number}.png", (300, 200), color)
+    return tmp_path / "images"
+
+
+def test_sample_indices_spread_over_pages():
+    assert sizing.sample_indices(2) == [0, 1]
+    assert sizing.sample_indices(30) == [5, 15, 25]
+
+
+def test_best_settings_fit_the_estimate():
+    samples = [Image.effect_noise((200, 150), 60).convert("RGB")]
+    search = sizing.SizeSearch(samples, page_count=10)
+    largest = search.estimate(search.rung_settings(0))
+    settings = search.best_settings(largest // 2)
+    assert search.estimate(settings) <= largest // 2 * sizing.SIZE_MARGIN
+    assert search.is_lowest(search.best_settings(1))
+
+
+def test_composed_pages_are_removed_on_closing():
+    with sizing.ComposedPages() as composed:
+        assert composed.load(0) is None
+        sizing.save_composed(Image.new("RGB", (30, 20), "red"), composed.file(0))
+        page = composed.load(0)
+        assert (page.mode, page.size) == ("RGB", (30, 20))
+        assert page.getpixel((0, 0)) == (255, 0, 0)
+    assert not composed.directory.exists()
+
+
+def test_composed_pages_are_read_as_tiff_only(tmp_path):
+    page_file = tmp_path / "page.tiff"
+    Image.new("RGB", (30, 20)).save(page_file, format="PNG")
+    with pytest.raises(UnidentifiedImageError):
+        sizing.load_composed(page_file)
+
+
+def count_calls(monkeypatch, module, name: str, calls: list):
+    function = getattr(module, name)
+
+    def counted(*args, **kwargs):
+        calls.append(name)
+        return function(*args, **kwargs)
+
+    monkeypatch.setattr(module, name, counted)
+
+
+@pytest.mark.parametrize("layout, pages", [("grid", 6), ("document", 12)])
+def test_pdfs_over_the_cap_are_encoded_again_only(
+    image_dir, tmp_path, monkeypatch, layout, pages
+):
+    composed, written = [], []
+    count_calls(monkeypatch, cli, "render_page_plan", composed)
+    count_calls(monkeypatch, cli, "process_page_image", composed)
+    count_calls(monkeypatch, pdf, "process_page_image", composed)
+    count_calls(monkeypatch, cli, "generate_pdf", written)
+    # Aim far above the cap, so that every PDF written is over it.
+    monkeypatch.setattr(sizing, "SIZE_MARGIN", 100)
+    cli.create_pdf(
+        image_dir,
+        tmp_path / "out.pdf",
+        images_per_page=2,
+        layout=layout,
+        resolution=(300, 200),
+        prefetch_threads=0,
+        max_pdf_size=0.001,
+    )
+    assert len(written) == sizing.MAX_ATTEMPTS
+    # The sample pages of the search, and every page once.
+    assert len(composed) == sizing.SAMPLE_PAGES + pages
+    assert (tmp_path / "out.pdf").is_file()
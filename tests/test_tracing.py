@@ -0,0 +1,31 @@
+import pytest
+
+from images_to_pdf import cli, tracing
+
+
+@pytest.fixture(autouse=True)
+def recorder(monkeypatch):
+    monkeypatch.setattr(tracing, "recorder", None)  # Restored after each test.
+
+
+def test_spans_are_passed_on_without_being_kept():
+    events = []
+    recorder = tracing.configure(True, keep=False)
+    recorder.subscribers.append(events.append)
+    with tracing.span("page", "page", images=2):
+        pass
+    assert [event["name"] for event in events] == ["page"]
+    assert recorder.take() == []
+
+
+def test_events_of_a_run_are_not_kept(make_image, tmp_path):
+    image_dir = make_image("images/1.png", (60, 40)).parent
+    events = []
+    cli.create_pdf(
+        image_dir,
+        tmp_path / "out.pdf",
+        resolution=(120, 80),
+        event_func=events.append,
+    )
+    assert any(event["name"] == "embed" for event in events)
+    assert tracing.recorder.take() == []